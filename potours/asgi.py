@@ -0,0 +1,12 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'potours.settings')
+# Под ASGI публичные страницы обслуживают async-вьюхи (tours.async_views)
+os.environ.setdefault('POTOURS_ASYNC_VIEWS', '1')
+application = get_asgi_application()
+
+# Индекс автодополнения строится до первого запроса, а не в нём
+from tours.autocomplete import warm  # noqa: E402
+
+warm()
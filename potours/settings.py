@@ -24,18 +24,23 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tours.middleware.MetricsMiddleware',
+    'tours.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'tours.middleware.ReplicaRoutingMiddleware',
+    'tours.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'potours.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates + замер времени рендеринга для Server-Timing
+        'BACKEND': 'tours.template_backends.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -59,9 +64,57 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Постоянные соединения: PRAGMA применяются один раз, а не на каждый запрос
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # busy timeout (сек.): ждать блокировку вместо "database is locked"
+            'timeout': 20,
+        },
     }
 }
 
+# Реплика только для чтения: снимок db.sqlite3 через SQLite online backup API.
+# Публичные GET-запросы анонимов читают из неё (tours/routers.py).
+SQLITE_REPLICA_ENABLED = os.getenv('DB_REPLICA', '1') == '1'
+SQLITE_REPLICA_PATH = BASE_DIR / 'db.replica.sqlite3'
+# Задержка обновления реплики после коммита (сек.): пачка правок — один backup
+SQLITE_REPLICA_REFRESH_DELAY = float(os.getenv('DB_REPLICA_REFRESH_DELAY', '2'))
+
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': f'file:{SQLITE_REPLICA_PATH}?mode=ro',
+    'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        'uri': True,
+        'timeout': 20,
+    },
+    'PRAGMAS': {
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,
+        'temp_store': 'memory',
+    },
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_ROUTERS = ['tours.routers.PrimaryReplicaRouter'] if SQLITE_REPLICA_ENABLED else []
+
+# PRAGMA для каждого нового SQLite-соединения (см. tours/db.py)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # в KiB
+    'temp_store': 'memory',
+}
+
+# Повтор записи при "database is locked": попытки и базовая задержка (сек.)
+SQLITE_WRITE_RETRY = {
+    'attempts': 5,
+    'base_delay': 0.05,
+}
+
 WSGI_APPLICATION = 'potours.wsgi.application'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -70,5 +123,144 @@ LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/catalog/'
 LOGOUT_REDIRECT_URL = '/'
 
+# N+1-контроль: в строгом режиме (тесты, локально) одинаковый запрос,
+# выполненный больше QUERY_REPEAT_LIMIT раз за запрос, вызывает ошибку
+QUERY_STRICT_MODE = os.getenv('QUERY_STRICT_MODE', '0') == '1'
+QUERY_REPEAT_LIMIT = int(os.getenv('QUERY_REPEAT_LIMIT', '5'))
+
+# /metrics: файлы метрик процессов (mmap) и кто может их читать кроме staff. По умолчанию
+# никто: за локальным обратным прокси REMOTE_ADDR любого запроса — 127.0.0.1. Адреса
+# указывать только для прямого доступа сборщика к приложению, мимо прокси
+METRICS_DIR = Path(os.getenv('METRICS_DIR', BASE_DIR / 'var' / 'metrics'))
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip]
+
+# Async-версии публичных страниц (tours.async_views); включается в potours/asgi.py,
+# под WSGI остаются синхронные вьюхи
+ASYNC_PUBLIC_VIEWS = os.getenv('POTOURS_ASYNC_VIEWS', '0') == '1'
+
+# Лента изменений /api/v1/changes/: записи моложе окна (сек.) не отдаются —
+# updated_at ставится до коммита, а транзакция может ждать блокировку до busy timeout
+CHANGES_SETTLE_SECONDS = int(os.getenv('CHANGES_SETTLE_SECONDS', '30'))
+
+# Карта шага 3 (tours.places_map): сколько держать тайлы и список мест в кэше Django
+# (по умолчанию — LocMemCache процесса; ключ включает версию каталога) и в кэше браузера
+PLACES_MAP_CACHE_SECONDS = int(os.getenv('PLACES_MAP_CACHE_SECONDS', '600'))
+PLACES_MAP_BROWSER_CACHE_SECONDS = int(os.getenv('PLACES_MAP_BROWSER_CACHE_SECONDS', '60'))
+
+# Автодополнение (tours.autocomplete): индекс в памяти процесса; изменения других процессов
+# (воркеры, импорт, команды) подтягиваются не чаще раза в столько секунд
+AUTOCOMPLETE_SYNC_SECONDS = float(os.getenv('AUTOCOMPLETE_SYNC_SECONDS', '5'))
+# Строить индекс при старте сервера (potours.wsgi / potours.asgi), а не на первом запросе:
+# на большом каталоге построение занимает секунды
+AUTOCOMPLETE_WARM_ON_START = os.getenv('AUTOCOMPLETE_WARM_ON_START', '1') == '1'
+
+# Оптимизатор маршрута дня (tours.itinerary): средняя скорость переездов между остановками, км/ч
+ITINERARY_TRAVEL_SPEED_KMH = float(os.getenv('ITINERARY_TRAVEL_SPEED_KMH', '30'))
+
+# Рекомендации мастера (tours.recommender): матрица признаков туров в памяти процесса;
+# изменения других процессов подтягиваются не чаще раза в столько секунд
+RECOMMENDER_SYNC_SECONDS = float(os.getenv('RECOMMENDER_SYNC_SECONDS', '5'))
+
+# Похожие туры (tours.similarity, manage.py build_similar_tours): сколько хранить на тур
+SIMILAR_TOURS_PER_TOUR = int(os.getenv('SIMILAR_TOURS_PER_TOUR', '6'))
+
+# Похожие посты блога (tours.related_posts, manage.py build_related_posts): сколько хранить на пост
+RELATED_POSTS_PER_POST = int(os.getenv('RELATED_POSTS_PER_POST', '3'))
+
+# Заявки с сайта (tours/leads.py): запрос дописывает их в локальный журнал, в базу их переносит
+# manage.py drain_leads пачками по LEADS_DRAIN_BATCH; уведомления — класс LEADS_NOTIFIER
+# (письмо на LEADS_NOTIFY_EMAILS, без адресов — запись в лог)
+LEADS_JOURNAL_PATH = Path(os.getenv('LEADS_JOURNAL_PATH', BASE_DIR / 'var' / 'leads' / 'journal.sqlite3'))
+LEADS_DRAIN_BATCH = int(os.getenv('LEADS_DRAIN_BATCH', '500'))
+LEADS_NOTIFY_EMAILS = [address for address in os.getenv('LEADS_NOTIFY_EMAILS', '').split(',') if address]
+LEADS_NOTIFIER = os.getenv(
+    'LEADS_NOTIFIER',
+    'tours.leads.EmailNotifier' if LEADS_NOTIFY_EMAILS else 'tours.leads.LogNotifier',
+)
+
+# Фоновые задачи (tours/jobs.py, manage.py runworker): очередь в таблице Job. Воркер держит задачу
+# не дольше аренды (сек.), неудачную повторяет через JOB_RETRY_BASE_SECONDS·2^n до JOB_MAX_ATTEMPTS раз;
+# пересчёты после правок каталога ставятся с задержкой JOB_RECOMPUTE_DELAY, чтобы пачка правок дала один пересчёт
+JOB_WORKER_PROCESSES = int(os.getenv('JOB_WORKER_PROCESSES', '2'))
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1'))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', '10'))
+JOB_RECOMPUTE_DELAY = float(os.getenv('JOB_RECOMPUTE_DELAY', '30'))
+JOB_KEEP_DAYS = int(os.getenv('JOB_KEEP_DAYS', '14'))
+JOB_UPLOAD_DIR = Path(os.getenv('JOB_UPLOAD_DIR', BASE_DIR / 'var' / 'jobs'))
+# Расписание: имя -> (cron из пяти полей по местному времени, задача из tours/tasks.py)
+JOB_SCHEDULE = {
+    'similar-tours': ('*/15 * * * *', 'similar_tours'),
+    'related-posts': ('0 * * * *', 'related_posts'),
+    'drain-leads': ('* * * * *', 'drain_leads'),
+    'purge-archived': ('30 3 * * *', 'purge_archived'),
+    'purge-jobs': ('45 3 * * *', 'purge_jobs'),
+}
+
+# Срок хранения архивных записей каталога (дней после archived_at, None — бессрочно),
+# см. manage.py purge_archived; удалённые строки дописываются в CATALOG_RETENTION_DIR
+_retention_days = int(os.getenv('CATALOG_RETENTION_DAYS', '365'))
+CATALOG_RETENTION_DAYS = {
+    'attraction': _retention_days,
+    'include': _retention_days,
+    'toursday': _retention_days,
+    'grouptour': _retention_days,
+    'blogpost': _retention_days,
+}
+CATALOG_RETENTION_DIR = Path(os.getenv('CATALOG_RETENTION_DIR', BASE_DIR / 'var' / 'retention'))
+
+# Профилирование запросов: файлы профилей, сколько хранить, срок подписанной ссылки,
+# фоновый режим (каждый N-й запрос, 0 — выключен) и шаг сэмплера стека
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR', BASE_DIR / 'var' / 'profiles'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+PROFILE_LINK_MAX_AGE = int(os.getenv('PROFILE_LINK_MAX_AGE', '600'))
+PROFILE_SAMPLE_RATE = int(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+# Фоновые стеки процесса пишутся на диск не чаще раза в столько секунд; сверх лимита
+# различных стеков новые считаются одной строкой "(other stacks)"
+PROFILE_BACKGROUND_FLUSH_SECONDS = float(os.getenv('PROFILE_BACKGROUND_FLUSH_SECONDS', '10'))
+PROFILE_BACKGROUND_MAX_STACKS = int(os.getenv('PROFILE_BACKGROUND_MAX_STACKS', '5000'))
+# Файлы фоновых стеков завершившихся процессов удаляются через столько секунд
+# (и сверх PROFILE_KEEP самых свежих), чтобы отчёт не копил стеки давних воркеров
+PROFILE_BACKGROUND_MAX_AGE = int(os.getenv('PROFILE_BACKGROUND_MAX_AGE', '86400'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'tours.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        # LogNotifier пишет новые заявки сюда
+        'tours.leads': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'tours.jobs': {
+            'handlers': ['console'],
+            'level': os.getenv('JOB_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY", "")
 YANDEX_MAPS_API_KEY = os.getenv("YANDEX_MAPS_API_KEY", "")
+
+# Геокодер адресов каталога (tours.geocoding): Yandex HTTP Geocoder при наличии ключа,
+# иначе офлайн-заглушка (центры городов) для разработки и тестов
+YANDEX_GEOCODER_API_KEY = os.getenv('YANDEX_GEOCODER_API_KEY', YANDEX_MAPS_API_KEY)
+GEOCODER = os.getenv(
+    'GEOCODER',
+    'tours.geocoding.YandexGeocoder' if YANDEX_GEOCODER_API_KEY else 'tours.geocoding.OfflineGeocoder',
+)
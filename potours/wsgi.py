@@ -3,3 +3,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'potours.settings')
 application = get_wsgi_application()
+
+# Индекс автодополнения строится до первого запроса, а не в нём
+from tours.autocomplete import warm  # noqa: E402
+
+warm()
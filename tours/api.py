@@ -0,0 +1,280 @@
+"""Read-only JSON API for the catalog (``/api/v1/``).
+
+Every resource supports
+
+* ``fields=a,b`` — only these columns are selected (``.values()``);
+* keyset pagination — ``limit`` and an opaque ``after`` cursor (the last
+  id of the previous page), so page N costs the same as page 1;
+* ``ETag`` / ``If-None-Match`` — the tag is a hash of the page's
+  (id, ``updated_at``) pairs, read from the pk index before the columns
+  themselves, so an unchanged page answers 304 without loading or
+  serializing the rows;
+* ``expand=itinerary`` on group tours — days and their attractions for the
+  whole page in two extra queries.
+"""
+import hashlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+
+from .models import Attraction, BlogPost, GroupTour, GroupTourDay, Include, ToursDay, ToursDayAttraction
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+
+def _media_url(name):
+    return default_storage.url(name) if name else None
+
+
+def _icon_url(path):
+    return f"{settings.MEDIA_URL}{path}" if path else None
+
+
+class Resource:
+    """One API resource: API field name -> (model field, value transform)."""
+
+    def __init__(self, model, fields, expand=()):
+        self.model = model
+        self.fields = fields
+        self.expand = expand
+
+    def queryset(self):
+        return self.model.objects.order_by("pk")
+
+    def columns(self, names):
+        return ["id"] + [self.fields[name][0] for name in names if name != "id"]
+
+    def row(self, values, names):
+        item = {}
+        for name in names:
+            column, transform = self.fields[name]
+            value = values[column]
+            item[name] = transform(value) if transform else value
+        return item
+
+
+RESOURCES = {
+    "attractions": Resource(Attraction, {
+        "id": ("id", None),
+        "title": ("title", None),
+        "description": ("description", None),
+        "city": ("city", None),
+        "address": ("address", None),
+        "latitude": ("latitude", None),
+        "longitude": ("longitude", None),
+        "duration_hours": ("duration_hours", None),
+        "photo": ("photo", _media_url),
+        "created_at": ("created_at", None),
+        "updated_at": ("updated_at", None),
+    }),
+    "includes": Resource(Include, {
+        "id": ("id", None),
+        "description": ("description", None),
+        "icon": ("icon_path", _icon_url),
+        "created_at": ("created_at", None),
+        "updated_at": ("updated_at", None),
+    }),
+    "tours-days": Resource(ToursDay, {
+        "id": ("id", None),
+        "title": ("title", None),
+        "description": ("description", None),
+        "city": ("city", None),
+        "address": ("address", None),
+        "latitude": ("latitude", None),
+        "longitude": ("longitude", None),
+        "duration_hours": ("duration_hours", None),
+        "photo": ("photo", _media_url),
+        "created_at": ("created_at", None),
+        "updated_at": ("updated_at", None),
+    }),
+    "group-tours": Resource(GroupTour, {
+        "id": ("id", None),
+        "title": ("title", None),
+        "short_description": ("short_description", None),
+        "description": ("description", None),
+        "group_size": ("group_size", None),
+        "created_at": ("created_at", None),
+        "updated_at": ("updated_at", None),
+    }, expand=("itinerary",)),
+    "blog-posts": Resource(BlogPost, {
+        "id": ("id", None),
+        "title": ("title", None),
+        "body": ("body", None),
+        "published_at": ("published_at", None),
+        "image": ("image", _media_url),
+        "created_at": ("created_at", None),
+        "updated_at": ("updated_at", None),
+    }),
+}
+
+class ApiError(Exception):
+    pass
+
+
+def encode_cursor(pk):
+    return urlsafe_b64encode(str(pk).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        return int(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (BinasciiError, UnicodeDecodeError, ValueError):
+        raise ApiError("Invalid cursor.")
+
+
+def _requested_fields(request, resource):
+    raw = request.GET.get("fields")
+    if not raw:
+        return list(resource.fields)
+    names = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}.")
+    return ["id"] + [name for name in names if name != "id"]
+
+
+def _requested_expand(request, resource):
+    names = [name.strip() for name in request.GET.get("expand", "").split(",") if name.strip()]
+    unknown = [name for name in names if name not in resource.expand]
+    if unknown:
+        raise ApiError(f"Unknown expansion(s): {', '.join(unknown)}.")
+    return names
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError("limit must be an integer.")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _etag(*parts):
+    digest = hashlib.sha1(_encoder.encode(parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def _itineraries(tour_ids):
+    """{tour id: [day, ...]} for all tours at once: one query for days, one for their attractions."""
+    links = list(
+        GroupTourDay.objects.filter(group_tour_id__in=tour_ids, tours_day__is_archived=False)
+        .order_by("group_tour_id", "day_number", "id")
+        .values(
+            "group_tour_id", "day_number", "tours_day_id", "tours_day__title",
+            "tours_day__city", "tours_day__duration_hours",
+        )
+    )
+    attractions = {}
+    for row in (
+        ToursDayAttraction.objects.filter(
+            tours_day_id__in={link["tours_day_id"] for link in links}, attraction__is_archived=False
+        )
+        .order_by("position", "id")
+        .values("tours_day_id", "attraction_id", "attraction__title", "attraction__city")
+    ):
+        attractions.setdefault(row["tours_day_id"], []).append(
+            {"id": row["attraction_id"], "title": row["attraction__title"], "city": row["attraction__city"]}
+        )
+    itineraries = {}
+    for link in links:
+        itineraries.setdefault(link["group_tour_id"], []).append(
+            {
+                "day_number": link["day_number"],
+                "id": link["tours_day_id"],
+                "title": link["tours_day__title"],
+                "city": link["tours_day__city"],
+                "duration_hours": link["tours_day__duration_hours"],
+                "attractions": attractions.get(link["tours_day_id"], []),
+            }
+        )
+    return itineraries
+
+
+def _error(message, status=400):
+    return JsonResponse({"error": message}, status=status)
+
+
+@require_safe
+def object_list(request, resource):
+    spec = RESOURCES[resource]
+    try:
+        names = _requested_fields(request, spec)
+        expand = _requested_expand(request, spec)
+        limit = _limit(request)
+        after = decode_cursor(request.GET["after"]) if request.GET.get("after") else None
+    except ApiError as exc:
+        return _error(str(exc))
+
+    qs = spec.queryset()
+    if after is not None:
+        qs = qs.filter(pk__gt=after)
+    # limit + 1 строк: лишняя говорит, что есть следующая страница
+    keys = list(qs.values_list("pk", "updated_at")[: limit + 1])
+    has_next = len(keys) > limit
+    ids = [pk for pk, _ in keys[:limit]]
+    # Развёрнутый маршрут нужен и для ETag: дни и их достопримечательности меняются отдельно от тура.
+    # has_next тоже: у последней страницы появляется ссылка "next", когда за ней добавили строки
+    itineraries = _itineraries(ids) if expand else {}
+    etag = _etag(resource, request.GET.urlencode(), keys[:limit], has_next, itineraries)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    rows = list(spec.queryset().filter(pk__in=ids).values(*spec.columns(names)))
+    items = [spec.row(row, names) for row in rows]
+    if expand:
+        for item in items:
+            item["itinerary"] = itineraries.get(item["id"], [])
+
+    next_url = None
+    if has_next:
+        params = request.GET.copy()
+        params["after"] = encode_cursor(ids[-1])
+        next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+    # Страница ограничена limit и уже прочитана целиком: потоковый ответ памяти бы не сэкономил
+    response = JsonResponse(
+        {"results": items, "next": next_url}, encoder=DjangoJSONEncoder, json_dumps_params={"ensure_ascii": False}
+    )
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+@require_safe
+def object_detail(request, resource, pk):
+    spec = RESOURCES[resource]
+    try:
+        names = _requested_fields(request, spec)
+        expand = _requested_expand(request, spec)
+    except ApiError as exc:
+        return _error(str(exc))
+
+    columns = spec.columns(names)
+    if "updated_at" not in columns:
+        columns.append("updated_at")
+    row = spec.queryset().filter(pk=pk).values(*columns).first()
+    if row is None:
+        return _error("Not found.", status=404)
+    itinerary = _itineraries([pk]).get(pk, []) if expand else None
+    etag = _etag(resource, pk, request.GET.urlencode(), row["updated_at"], itinerary)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    item = spec.row(row, names)
+    if expand:
+        item["itinerary"] = itinerary
+    response = JsonResponse(item, encoder=DjangoJSONEncoder, json_dumps_params={"ensure_ascii": False})
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"
+    return response
@@ -0,0 +1,71 @@
+from django.apps import AppConfig
+
+
+class ToursConfig(AppConfig):
+    name = "tours"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+
+        from . import autocomplete, recommender, tasks
+        from .changes import PARENT_LINKS, THROUGH_MODELS, touch_parent, touch_parent_on_m2m_add
+        from .db import apply_sqlite_pragmas
+        from .instrumentation import install_query_recorder
+        from .replica import refresh_after_commit, refresh_after_migrate
+        from .models import Attraction, BlogPost, GroupTour, GroupTourDay, ToursDay, ToursDayAttraction
+        from .signals import archive_changed
+
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid="tours_sqlite_pragmas")
+        connection_created.connect(install_query_recorder, dispatch_uid="tours_query_recorder")
+        post_save.connect(refresh_after_commit, dispatch_uid="tours_replica_post_save")
+        post_delete.connect(refresh_after_commit, dispatch_uid="tours_replica_post_delete")
+        archive_changed.connect(refresh_after_commit, dispatch_uid="tours_replica_archive_changed")
+        # Одна копия на весь migrate: сигнал шлётся для каждого приложения, слушаем только своё
+        post_migrate.connect(refresh_after_migrate, sender=self, dispatch_uid="tours_replica_post_migrate")
+
+        # Индекс автодополнения этого процесса обновляется сразу после коммита
+        for model in (Attraction, GroupTour):
+            label = model._meta.model_name
+            post_save.connect(
+                autocomplete.update_on_save, sender=model, dispatch_uid=f"tours_autocomplete_{label}_save"
+            )
+            post_delete.connect(
+                autocomplete.update_on_delete, sender=model, dispatch_uid=f"tours_autocomplete_{label}_delete"
+            )
+        archive_changed.connect(
+            autocomplete.update_on_archive_changed, dispatch_uid="tours_autocomplete_archive_changed"
+        )
+
+        # Матрица рекомендаций пересчитывает изменённые туры при следующем ранжировании
+        for model in (GroupTour, ToursDay, Attraction, GroupTourDay, ToursDayAttraction):
+            label = model._meta.model_name
+            post_save.connect(
+                recommender.features.mark_stale, sender=model, dispatch_uid=f"tours_recommender_{label}_save"
+            )
+            post_delete.connect(
+                recommender.features.mark_stale, sender=model, dispatch_uid=f"tours_recommender_{label}_delete"
+            )
+        archive_changed.connect(recommender.features.mark_stale, dispatch_uid="tours_recommender_archive_changed")
+
+        # Изменения связей (дни тура, достопримечательности дня, медиа) попадают в ленту через родителя
+        for link in PARENT_LINKS:
+            label = link._meta.model_name
+            post_save.connect(touch_parent, sender=link, dispatch_uid=f"tours_touch_{label}_save")
+            post_delete.connect(touch_parent, sender=link, dispatch_uid=f"tours_touch_{label}_delete")
+        for through in THROUGH_MODELS:
+            m2m_changed.connect(
+                touch_parent_on_m2m_add, sender=through, dispatch_uid=f"tours_touch_{through._meta.model_name}_m2m"
+            )
+
+        # Похожие туры и посты пересчитывает воркер (tours.tasks): одна отложенная задача на пачку правок
+        recompute = {
+            model: tasks.similar_tours_changed
+            for model in (GroupTour, ToursDay, Attraction, GroupTourDay, ToursDayAttraction)
+        }
+        recompute[BlogPost] = tasks.blog_post_changed
+        for model, handler in recompute.items():
+            label = model._meta.model_name
+            post_save.connect(handler, sender=model, dispatch_uid=f"tours_jobs_{label}_save")
+            post_delete.connect(handler, sender=model, dispatch_uid=f"tours_jobs_{label}_delete")
+            archive_changed.connect(handler, sender=model, dispatch_uid=f"tours_jobs_{label}_archive_changed")
@@ -0,0 +1,269 @@
+"""Async versions of the read-only public views, used under ASGI.
+
+``potours/urls.py`` routes the public pages here when ``ASYNC_PUBLIC_VIEWS``
+is on (``potours/asgi.py`` turns it on). A request waiting for the database
+or for a slow client no longer holds a worker thread.
+
+The async ORM methods all run on one shared thread, so independent queries
+are instead sent to separate worker threads with ``_in_thread`` and awaited
+together: each thread has its own connection, and SQLite in WAL mode serves
+the readers in parallel. Templates are rendered through ``sync_to_async``
+because context processors (``user``) may still hit the database.
+"""
+import asyncio
+import mimetypes
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.paginator import Paginator
+from django.db import close_old_connections
+from django.db.models import prefetch_related_objects
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from . import booking, related_posts, similarity, views
+from .models import Attraction, BlogPost, GroupTour
+
+arender = sync_to_async(render)
+
+MEDIA_CHUNK_SIZE = 256 * 1024
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _with_connection_cleanup(func, *args):
+    # Как request_started / request_finished: соединение потока пула старше
+    # CONN_MAX_AGE или сломанное закрывается, а не живёт вечно
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def _in_thread(func, *args):
+    """Run blocking ORM code in its own worker thread so several calls can overlap.
+
+    A worker thread reuses its connection between calls for up to
+    ``CONN_MAX_AGE`` (the PRAGMAs are applied once per connection).
+    """
+    return sync_to_async(_with_connection_cleanup, thread_sensitive=False)(func, *args)
+
+
+async def _group_tours_with_cards(queryset, limit=None):
+    """Tours plus their days and media, the two prefetches running in parallel."""
+    group_tours = await _in_thread(list, queryset)
+    await asyncio.gather(
+        _in_thread(prefetch_related_objects, group_tours, "tour_days"),
+        _in_thread(prefetch_related_objects, group_tours, "media_items"),
+    )
+    return views._build_group_tour_cards(group_tours, limit=limit)
+
+
+async def home(request):
+    attractions, featured_cards = await asyncio.gather(
+        _in_thread(views._attractions_payload),
+        _group_tours_with_cards(GroupTour.objects.order_by("?")[:4], limit=4),
+    )
+    return await arender(
+        request,
+        "index.html",
+        {
+            "featured_group_tours": featured_cards,
+            "featured_attractions": attractions,
+        },
+    )
+
+
+def _attraction_with_nearby(pk):
+    attraction = Attraction.objects.filter(pk=pk).first()
+    return attraction, views._nearby_attractions(attraction) if attraction else []
+
+
+async def attraction_detail(request, pk):
+    (attraction, nearby), ordered = await asyncio.gather(
+        _in_thread(_attraction_with_nearby, pk),
+        _in_thread(lambda: list(Attraction.objects.order_by("title").values_list("pk", flat=True))),
+    )
+    if attraction is None:
+        raise Http404("No Attraction matches the given query.")
+    try:
+        idx = ordered.index(attraction.pk)
+    except ValueError:
+        idx = 0
+    prev_pk = ordered[idx - 1] if idx > 0 else None
+    next_pk = ordered[idx + 1] if idx < len(ordered) - 1 else None
+    return await arender(
+        request,
+        "attraction_detail.html",
+        {
+            "attraction": attraction,
+            "prev_attraction_pk": prev_pk,
+            "next_attraction_pk": next_pk,
+            "nearby_attractions": nearby,
+        },
+    )
+
+
+async def tours_list(request):
+    cards = await _group_tours_with_cards(GroupTour.objects.order_by("-created_at"))
+    first_row = cards[:2]
+    rest_chunks = [cards[i : i + 4] for i in range(2, len(cards), 4)]
+    return await arender(
+        request,
+        "tours.html",
+        {"cards": cards, "first_row": first_row, "rest_chunks": rest_chunks},
+    )
+
+
+async def group_tours_page(request):
+    cards = await _group_tours_with_cards(GroupTour.all_objects.order_by("-created_at"))
+    card_chunks = [cards[i : i + 5] for i in range(0, len(cards), 5)]
+    context = {
+        "group_tour_rows": views._group_tour_card_rows(cards),
+        "card_chunks": card_chunks,
+    }
+    return await arender(request, "group_tours.html", context)
+
+
+async def _group_tour_detail(request, pk, template_name, with_similar=False):
+    # Тур с медиа, дни маршрута, выезды и похожие туры зависят только от pk — грузим одновременно
+    group_tour, day_links, departures, similar_tours = await asyncio.gather(
+        _in_thread(lambda: GroupTour.objects.prefetch_related("media_items").filter(pk=pk).first()),
+        _in_thread(lambda: list(views._group_tour_day_links(pk))),
+        _in_thread(booking.upcoming_departures, pk),
+        _in_thread(lambda: similarity.similar_tours(pk) if with_similar else []),
+    )
+    if group_tour is None:
+        raise Http404("No GroupTour matches the given query.")
+    context = views._group_tour_detail_context(group_tour, day_links=day_links, departures=departures)
+    context["tour_includes"] = views._includes_with_icons(context["tour_includes"])
+    context["similar_tours"] = similar_tours
+    return await arender(request, template_name, context)
+
+
+async def group_tour_detail(request, pk):
+    return await _group_tour_detail(request, pk, "group_tour_detail.html", with_similar=True)
+
+
+async def group_tour_inspiration_detail(request, pk):
+    return await _group_tour_detail(request, pk, "group_tour_inspiration_detail.html")
+
+
+async def blog_page(request):
+    qs = BlogPost.objects.order_by("-published_at", "-created_at").defer("body", "term_weights")
+    paginator = Paginator(qs, 9)
+    # count считаем асинхронно и кладём в cached_property, дальше Paginator не ходит в БД
+    paginator.count = await qs.acount()
+    try:
+        page_number = int(request.GET.get("page", 1))
+    except (TypeError, ValueError):
+        page_number = 1
+    page = paginator.get_page(page_number)
+    page.object_list = [post async for post in page.object_list]
+    return await arender(
+        request,
+        "blog.html",
+        {
+            "page_obj": page,
+            "posts": page.object_list,
+        },
+    )
+
+
+async def blog_post_detail(request, pk):
+    post, related = await asyncio.gather(
+        _in_thread(lambda: BlogPost.objects.defer("term_weights").filter(pk=pk).first()),
+        _in_thread(related_posts.related_posts, pk),
+    )
+    if post is None:
+        raise Http404("No BlogPost matches the given query.")
+    return await arender(
+        request,
+        "blog_post_detail.html",
+        {"post": post, "related_posts": related},
+    )
+
+
+def _parse_range(header, size):
+    """(start, end) inclusive for a single ``bytes=`` range; None if absent or unsupported."""
+    match = _RANGE_RE.match(header or "")
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # bytes=-N — последние N байт
+        length = min(int(end), size)
+        return size - length, size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    return start, end
+
+
+async def _file_chunks(path, start, length):
+    handle = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(handle.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(handle.read, min(MEDIA_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(handle.close)
+
+
+async def media(request, path):
+    """MEDIA_ROOT files streamed without holding a thread, with Range support for video seeking.
+
+    Replaces ``django.views.static.serve`` under ASGI: that view returns a
+    synchronous file iterator, which the ASGI handler reads completely into
+    memory before sending.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Invalid path")
+    try:
+        stat = await asyncio.to_thread(os.stat, full_path)
+    except OSError:
+        raise Http404("File not found")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found")
+    if not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    size = stat.st_size
+    start, end = 0, size - 1
+    status = 200
+    byte_range = _parse_range(request.headers.get("Range"), size)
+    if byte_range:
+        start, end = byte_range
+        if start >= size or start > end:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        status = 206
+
+    length = max(end - start + 1, 0)
+    response = StreamingHttpResponse(
+        _file_chunks(full_path, start, length),
+        status=status,
+        content_type=content_type or "application/octet-stream",
+    )
+    response["Content-Length"] = str(length)
+    response["Accept-Ranges"] = "bytes"
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    if status == 206:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,323 @@
+"""Prefix autocomplete over attraction titles, cities and tour titles.
+
+The index lives in the process: per kind, sorted lists of folded keys
+(``tours.geocoding.normalize_query``: case, accents, spaces) searched with
+``bisect``, so a lookup is a binary search and a walk over the few entries
+it returns, whatever the size of the catalog. A name is found by its
+beginning ("malb" -> "Malbork Castle") and by the beginning of any later
+word ("cast" -> "Malbork Castle"); matches of the whole name come first.
+Cities are the distinct ``Attraction.city`` values, under their most common
+spelling.
+
+The index is built when the server starts (``warm()``, called by
+``potours.wsgi`` / ``potours.asgi`` when ``AUTOCOMPLETE_WARM_ON_START`` is
+set), otherwise on first use, and kept current by the save, delete and
+archive signals of this process. Writes of other processes (other workers,
+imports, management commands) are pulled in by ``ensure_current()`` at most
+once per ``AUTOCOMPLETE_SYNC_SECONDS`` from the ``updated_at`` index, the
+way the change feed reads them.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Max
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+
+from .api import _error
+from .geocoding import normalize_query
+from .models import Attraction, GroupTour
+from .routers import primary_only
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("attraction", "city", "tour")
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+ATTRACTION_FIELDS = ("pk", "title", "city", "latitude", "longitude", "is_archived", "updated_at")
+TOUR_FIELDS = ("pk", "title", "is_archived", "updated_at")
+INDEXED = ((Attraction, ATTRACTION_FIELDS), (GroupTour, TOUR_FIELDS))
+
+_WORD_START_RE = re.compile(r"(?<=[\W_])(?=[^\W_])")
+
+
+def _word_keys(key):
+    """Keys for the later words of a name: "malbork castle" -> ["castle"]."""
+    return [key[match.start():] for match in _WORD_START_RE.finditer(key)]
+
+
+def _append(keys, item):
+    keys.append(item)
+
+
+def _discard(keys, item):
+    index = bisect.bisect_left(keys, item)
+    if index < len(keys) and keys[index] == item:
+        del keys[index]
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._synced_at = 0.0
+        self._watermark = None  # новейший updated_at, который индекс уже видел
+        # kind -> (имена, слова): отсортированные (ключ, id)
+        self._keys = {kind: ([], []) for kind in KINDS}
+        self._entries = {}  # (kind, id) -> ответ
+        self._item_keys = {}  # (kind, id) -> (ключ имени, ключи слов)
+        self._attraction_cities = {}  # id достопримечательности -> (ключ города, написание)
+        self._city_spellings = {}  # ключ города -> Counter написаний
+
+    # --- чтение ---
+
+    def search(self, text, kinds=KINDS, limit=DEFAULT_LIMIT):
+        """Up to ``limit`` entries whose name or a word of it starts with ``text``."""
+        prefix = normalize_query(text)
+        if not prefix:
+            return []
+        self.ensure_current()
+        found = []
+        with self._lock:
+            for kind_order, kind in enumerate(kinds):
+                seen = set()
+                for rank, keys in enumerate(self._keys[kind]):
+                    index = bisect.bisect_left(keys, (prefix,))
+                    taken = 0
+                    while index < len(keys) and taken < limit:
+                        key, ident = keys[index]
+                        index += 1
+                        if not key.startswith(prefix):
+                            break
+                        if ident in seen:
+                            continue  # уже найдено по имени или по другому слову
+                        seen.add(ident)
+                        taken += 1
+                        found.append((rank, key, kind_order, self._entries[kind, ident]))
+        found.sort(key=lambda item: item[:3])
+        return [entry for *_, entry in found[:limit]]
+
+    def cities(self):
+        """Every city, in folded alphabetical order."""
+        self.ensure_current()
+        with self._lock:
+            return [self._entries["city", ident]["label"] for _, ident in self._keys["city"][0]]
+
+    def ensure_current(self):
+        if self._built and time.monotonic() - self._synced_at < settings.AUTOCOMPLETE_SYNC_SECONDS:
+            return
+        with self._lock:
+            if not self._built:
+                self._build()
+            elif time.monotonic() - self._synced_at >= settings.AUTOCOMPLETE_SYNC_SECONDS:
+                self._sync()
+            self._synced_at = time.monotonic()
+
+    # --- обновление ---
+
+    def put(self, model, rows):
+        """Add, replace or (for archived rows) remove rows given as dicts of ``*_FIELDS``."""
+        with self._lock:
+            if not self._built:
+                return  # первое построение прочитает всё само
+            for row in rows:
+                self._put(model, row, bisect.insort)
+                self._note_version(row["updated_at"])
+
+    def discard(self, model, pks):
+        with self._lock:
+            if not self._built:
+                return
+            for pk in pks:
+                self._remove(model, pk)
+
+    def _build(self):
+        with primary_only():
+            # Версия читается до строк: изменения между запросами перечитает _sync
+            versions = [model.all_objects.aggregate(latest=Max("updated_at"))["latest"] for model, _ in INDEXED]
+            self._watermark = max(filter(None, versions), default=None)
+            for model, fields in INDEXED:
+                for row in model.objects.order_by().values(*fields).iterator(chunk_size=5000):
+                    self._put(model, row, _append, cities=False)
+        for key in self._city_spellings:
+            self._set_city(key, _append)
+        for names, words in self._keys.values():
+            names.sort()
+            words.sort()
+        self._built = True
+
+    def _sync(self):
+        if self._watermark is None:
+            since = {}
+        else:
+            # Окно назад: updated_at ставится до коммита, медленная транзакция появляется «в прошлом»
+            since = {"updated_at__gte": self._watermark - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)}
+        with primary_only():
+            for model, fields in INDEXED:
+                for row in model.all_objects.filter(**since).order_by().values(*fields).iterator(chunk_size=5000):
+                    self._put(model, row, bisect.insort)
+                    self._note_version(row["updated_at"])
+
+    def _note_version(self, updated_at):
+        if updated_at and (self._watermark is None or updated_at > self._watermark):
+            self._watermark = updated_at
+
+    def _put(self, model, row, insort, cities=True):
+        self._remove(model, row["pk"], cities)
+        if row["is_archived"]:
+            return
+        if model is GroupTour:
+            self._add("tour", row["pk"], row["title"], {"type": "tour", "id": row["pk"], "label": row["title"]}, insort)
+            return
+        city = (row["city"] or "").strip()
+        entry = {
+            "type": "attraction",
+            "id": row["pk"],
+            "label": row["title"],
+            "city": city,
+            "lat": row["latitude"],
+            "lng": row["longitude"],
+        }
+        self._add("attraction", row["pk"], row["title"], entry, insort)
+        city_key = normalize_query(city)
+        if city_key:
+            self._attraction_cities[row["pk"]] = (city_key, city)
+            self._city_spellings.setdefault(city_key, Counter())[city] += 1
+            if cities:
+                self._set_city(city_key, insort)
+
+    def _remove(self, model, pk, cities=True):
+        self._discard_entry("tour" if model is GroupTour else "attraction", pk)
+        city = self._attraction_cities.pop(pk, None) if model is Attraction else None
+        if city is None:
+            return
+        city_key, spelling = city
+        spellings = self._city_spellings[city_key]
+        spellings[spelling] -= 1
+        if spellings[spelling] <= 0:
+            del spellings[spelling]
+        if not spellings:
+            del self._city_spellings[city_key]
+        if cities:
+            self._set_city(city_key, bisect.insort)
+
+    def _set_city(self, city_key, insort):
+        """(Re)index a city under its most common spelling, or drop it when no attraction is left."""
+        spellings = self._city_spellings.get(city_key)
+        label = spellings.most_common(1)[0][0] if spellings else None
+        current = self._entries.get(("city", city_key))
+        if current is not None and current["label"] == label:
+            return
+        self._discard_entry("city", city_key)
+        if label:
+            self._add("city", city_key, label, {"type": "city", "label": label}, insort)
+
+    def _add(self, kind, ident, label, entry, insort):
+        key = normalize_query(label or "")
+        if not key:
+            return
+        names, words = self._keys[kind]
+        word_keys = _word_keys(key)
+        insort(names, (key, ident))
+        for word in word_keys:
+            insort(words, (word, ident))
+        self._entries[kind, ident] = entry
+        self._item_keys[kind, ident] = (key, word_keys)
+
+    def _discard_entry(self, kind, ident):
+        keys = self._item_keys.pop((kind, ident), None)
+        if keys is None:
+            return
+        del self._entries[kind, ident]
+        names, words = self._keys[kind]
+        _discard(names, (keys[0], ident))
+        for word in keys[1]:
+            _discard(words, (word, ident))
+
+
+index = PrefixIndex()
+
+
+def warm():
+    """Build the index before the first request: on a large catalog the build takes seconds."""
+    if not settings.AUTOCOMPLETE_WARM_ON_START:
+        return
+    started = time.monotonic()
+    try:
+        index.ensure_current()
+    except DatabaseError:
+        # База ещё не смигрирована: индекс построится на первом запросе
+        logger.exception("Autocomplete index was not built at start")
+        return
+    finally:
+        # Соединение загрузки не уносим в форк воркера (gunicorn --preload) и не держим зря
+        connections.close_all()
+    logger.info("Autocomplete index built in %.1fs", time.monotonic() - started)
+
+
+def _fields(model):
+    return dict(INDEXED)[model]
+
+
+def _row(model, instance):
+    return {field: getattr(instance, field) for field in _fields(model)}
+
+
+def update_on_save(sender, instance, using, **kwargs):
+    """post_save of an attraction or a tour; applied once the transaction commits."""
+    row = _row(sender, instance)
+    transaction.on_commit(lambda: index.put(sender, [row]), using=using)
+
+
+def update_on_delete(sender, instance, using, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: index.discard(sender, [pk]), using=using)
+
+
+def update_on_archive_changed(sender, pks, archived, using, **kwargs):
+    """Bulk archive / restore (``tours.signals.archive_changed``)."""
+    if sender not in (Attraction, GroupTour):
+        return
+    pks = list(pks)
+
+    def apply():
+        if archived:
+            index.discard(sender, pks)
+            return
+        with primary_only():
+            index.put(sender, list(sender.all_objects.filter(pk__in=pks).values(*_fields(sender))))
+
+    transaction.on_commit(apply, using=using)
+
+
+def _result(entry):
+    if entry["type"] == "attraction":
+        return {**entry, "url": reverse("attraction_detail", args=[entry["id"]])}
+    if entry["type"] == "tour":
+        return {**entry, "url": reverse("group_tour_detail", args=[entry["id"]])}
+    return entry
+
+
+@require_safe
+def suggest(request):
+    """``?q=<prefix>&type=attraction,city,tour&limit=8`` -> the best matches, names first."""
+    requested = [kind.strip() for kind in request.GET.get("type", "").split(",") if kind.strip()]
+    unknown = [kind for kind in requested if kind not in KINDS]
+    if unknown:
+        return _error(f"Unknown type(s): {', '.join(unknown)}.")
+    try:
+        limit = max(1, min(int(request.GET.get("limit", DEFAULT_LIMIT)), MAX_LIMIT))
+    except ValueError:
+        return _error("limit must be an integer.")
+    kinds = [kind for kind in KINDS if kind in requested] if requested else KINDS
+    entries = index.search(request.GET.get("q", "")[:100], kinds, limit)
+    return JsonResponse({"results": [_result(entry) for entry in entries]}, json_dumps_params={"ensure_ascii": False})
@@ -0,0 +1,185 @@
+"""Shared pieces of the view benchmark and the query plan audit.
+
+``audited_routes()`` lists the named GET routes served by ``tours.views``
+with a real pk substituted; ``measure()`` drives one of them through the
+test client; ``compare()`` checks a run against a stored baseline.
+"""
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test import override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from .models import Attraction, BlogPost, GroupTour, GroupTourMedia, Include, ToursDay
+
+# Модель, чей pk подставляется в маршрут с <int:pk>, по имени маршрута
+PK_MODELS = {
+    "attraction": Attraction,
+    "include": Include,
+    "tours_day": ToursDay,
+    "group_tour_media": GroupTourMedia,
+    "group_tour": GroupTour,
+    "blog": BlogPost,
+    "tour": GroupTour,
+}
+
+# Дополнительные варианты GET-параметров, у которых свой план запроса
+QUERY_VARIANTS = {
+    "blog_page": ["?page=2"],
+    "catalog_blog_list": ["?sort=title&order=asc", "?sort=author", "?search=a&date_from=2020-01-01"],
+    "api_map_tiles": ["?bbox=49,14,55,24&zoom=6", "?bbox=50,19.5,50.2,20.1&zoom=15"],
+    "api_map_places": ["?bbox=49,14,55,24", "?q=a&category=historical"],
+    "api_autocomplete": ["?q=a", "?q=kra&type=city"],
+}
+
+VIEW_MODULES = (
+    "tours.views",
+    "tours.async_views",
+    "tours.api",
+    "tours.changes",
+    "tours.places_map",
+    "tours.autocomplete",
+)
+
+# Маршруты без GET-страницы или с побочным эффектом
+SKIPPED_ROUTES = ("logout",)
+
+
+def _iter_patterns(patterns):
+    for entry in patterns:
+        if isinstance(entry, URLResolver):
+            yield from _iter_patterns(entry.url_patterns)
+        elif isinstance(entry, URLPattern):
+            yield entry
+
+
+def _pk_for(name):
+    for key, model in PK_MODELS.items():
+        if key in name:
+            return model._default_manager.db_manager("default").values_list("pk", flat=True).first() or 1
+    return 1
+
+
+def audited_routes():
+    """(url name, path) for every named GET route handled by the tours views.
+
+    Routes with arguments other than ``pk`` (a profile file name, ...) are
+    skipped: there is nothing meaningful to substitute.
+    """
+    routes = []
+    seen = set()
+    for entry in _iter_patterns(get_resolver().url_patterns):
+        callback = entry.callback
+        if not entry.name or entry.name in seen or getattr(callback, "__module__", "") not in VIEW_MODULES:
+            continue
+        if entry.name in SKIPPED_ROUTES or set(entry.pattern.converters) - {"pk"}:
+            continue
+        seen.add(entry.name)
+        kwargs = {"pk": _pk_for(entry.name)} if "pk" in entry.pattern.converters else {}
+        path = reverse(entry.name, kwargs=kwargs)
+        routes.append((entry.name, path))
+        routes.extend((entry.name, path + query) for query in QUERY_VARIANTS.get(entry.name, ()))
+    return routes
+
+
+@contextmanager
+def scratch_database(alias="default"):
+    """Swap ``alias`` to a migrated throwaway SQLite file for the duration of the block.
+
+    A file (not ``:memory:``) keeps WAL, mmap and the page cache behaving as
+    they do in production. ``MEDIA_ROOT`` points into the same temporary
+    directory, so generated images never reach the real media.
+    """
+    connection = connections[alias]
+    directory = tempfile.mkdtemp(prefix="potours-bench-")
+    previous_test_name = connection.settings_dict["TEST"].get("NAME")
+    connection.settings_dict["TEST"]["NAME"] = os.path.join(directory, "bench.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with override_settings(MEDIA_ROOT=os.path.join(directory, "media")):
+            yield directory
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict["TEST"]["NAME"] = previous_test_name
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _body_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def measure(client, path, repeat=5):
+    """Time ``repeat`` GETs of ``path`` after one warm-up, then traced GETs for peak memory.
+
+    Memory is measured on its own runs because tracemalloc slows allocation
+    down several times and would distort the timings; the peak is taken from
+    the second traced request so one-off caches filled by the first do not
+    count.
+    """
+    client.get(path)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        size = _body_size(response)
+        timings.append(time.perf_counter() - started)
+    stats = getattr(response.wsgi_request, "query_stats", None)
+
+    tracemalloc.start()
+    try:
+        _body_size(client.get(path))
+        tracemalloc.reset_peak()
+        baseline_memory, _ = tracemalloc.get_traced_memory()
+        _body_size(client.get(path))
+        _, peak = tracemalloc.get_traced_memory()
+        peak -= baseline_memory
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "status": response.status_code,
+        "time_ms": round(statistics.median(timings) * 1000, 2),
+        "time_ms_min": round(min(timings) * 1000, 2),
+        "queries": stats.query_count if stats else None,
+        "bytes": size,
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+# Отклонения меньше этих значений считаются шумом, сколько бы процентов они ни составляли.
+# Запросы и байты детерминированы на любой машине — по ним гейт работает всегда
+DETERMINISTIC_METRICS = {"queries": 0, "bytes": 512}
+# Время (по минимуму: он стабильнее медианы) и память зависят от машины и её загрузки:
+# сравнивать их имеет смысл только с эталоном, записанным на том же хосте
+HOST_METRICS = {"time_ms_min": 5.0, "peak_kb": 64.0}
+
+
+def compare(results, baseline, threshold, metrics=DETERMINISTIC_METRICS):
+    """Regressions of ``results`` against ``baseline``: list of (size, route, metric, old, new).
+
+    ``metrics`` maps a metric to its noise floor. A metric regresses when it
+    grows by more than ``threshold`` (a fraction) and by more than the floor;
+    any extra query is a regression.
+    """
+    regressions = []
+    for size, routes in results.items():
+        for route, current in routes.items():
+            previous = baseline.get(size, {}).get(route)
+            if not previous:
+                continue
+            for metric, floor in metrics.items():
+                old, new = previous.get(metric), current.get(metric)
+                if old is None or new is None:
+                    continue
+                allowed = 0 if metric == "queries" else threshold
+                if new > old * (1 + allowed) and new - old > floor:
+                    regressions.append((size, route, metric, old, new))
+    return regressions
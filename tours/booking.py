@@ -0,0 +1,63 @@
+"""Seat booking for group tour departures.
+
+``Departure.seats_left`` is never read, changed and written back: a booking
+takes its seats with one conditional UPDATE (``seats_left = seats_left - n
+WHERE seats_left >= n``), so of the requests racing for the last seats only
+those that still fit match the row, whichever thread or process they run
+in. The same transaction inserts the ``Booking`` under the idempotency key
+of the submitted form. Its UNIQUE constraint rolls a repeated submit (a
+double click, a retried request) back before it takes seats twice, and the
+repeat gets the booking of the first one. ``manage.py bench_bookings``
+checks the counts under contention.
+"""
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .db import retry_on_locked
+from .models import Booking, Departure
+
+
+class BookingError(Exception):
+    """The booking cannot be made; the message can be shown to the visitor."""
+
+
+def upcoming_departures(group_tour_id):
+    return list(
+        Departure.objects.filter(group_tour_id=group_tour_id, starts_on__gte=timezone.localdate()).order_by("starts_on")
+    )
+
+
+def book(departure_id, seats, idempotency_key, *, name, email, notes=""):
+    """(booking, created); ``created`` is False when the key was already used by the same request."""
+    if seats < 1:
+        raise BookingError("Book at least one seat.")
+    booking = _replay(idempotency_key, departure_id, seats)
+    if booking is not None:
+        return booking, False
+    try:
+        return _reserve(departure_id, seats, idempotency_key, name=name, email=email, notes=notes), True
+    except IntegrityError:
+        # Тот же ключ успел записать параллельный запрос; наша транзакция откатилась вместе со списанием мест
+        booking = _replay(idempotency_key, departure_id, seats)
+        if booking is None:
+            raise
+        return booking, False
+
+
+def _replay(idempotency_key, departure_id, seats):
+    booking = Booking.objects.filter(idempotency_key=idempotency_key).first()
+    if booking is not None and (booking.departure_id, booking.seats) != (departure_id, seats):
+        raise BookingError("This form was already used for another booking; reload the page.")
+    return booking
+
+
+@retry_on_locked
+def _reserve(departure_id, seats, idempotency_key, **contact):
+    # Первым идёт UPDATE: транзакция сразу берёт блокировку записи и не читает ничего до неё
+    taken = Departure.objects.filter(
+        pk=departure_id, seats_left__gte=seats, starts_on__gte=timezone.localdate()
+    ).update(seats_left=F("seats_left") - seats, updated_at=timezone.now())
+    if not taken:
+        raise BookingError("Not enough seats left on this departure.")
+    return Booking.objects.create(departure_id=departure_id, seats=seats, idempotency_key=idempotency_key, **contact)
@@ -0,0 +1,260 @@
+"""Incremental change feed for partners: ``/api/v1/changes/?since=<cursor>``.
+
+Every catalog model is read in (``updated_at``, id) order from its own index
+and the streams are merged, so a page costs the same whatever the size of
+the catalog. The opaque cursor is the (``updated_at``, type, id) of the last
+record returned; passing it back yields only what changed after it.
+
+Links without their own timestamp (days of a tour, attractions and includes
+of a day, tour media) bump ``updated_at`` of their parent through the
+signal handlers below, and the parent's record carries the current list of
+links. Hard deletes are not reported: the catalog archives instead.
+
+Records newer than ``CHANGES_SETTLE_SECONDS`` are held back: ``updated_at``
+is taken before the transaction commits, and a slow transaction could
+otherwise appear behind a cursor that has already moved past it.
+"""
+import heapq
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_safe
+
+from .api import RESOURCES, ApiError, _error, _media_url
+from .models import (
+    Attraction,
+    GroupTour,
+    GroupTourDay,
+    GroupTourMedia,
+    ToursDay,
+    ToursDayAttraction,
+    ToursDayInclude,
+)
+from .routers import primary_only
+
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+# Порядок типов — часть курсора: записи с одинаковым updated_at идут в этом порядке
+FEED = (
+    ("include", RESOURCES["includes"]),
+    ("attraction", RESOURCES["attractions"]),
+    ("tours_day", RESOURCES["tours-days"]),
+    ("group_tour", RESOURCES["group-tours"]),
+    ("blog_post", RESOURCES["blog-posts"]),
+)
+_FEED_INDEX = {name: index for index, (name, _) in enumerate(FEED)}
+
+# Модель связи -> (родитель, поле со ссылкой на него), у которого обновляется updated_at
+PARENT_LINKS = {
+    GroupTourDay: (GroupTour, "group_tour_id"),
+    GroupTourMedia: (GroupTour, "group_tour_id"),
+    ToursDayAttraction: (ToursDay, "tours_day_id"),
+    ToursDayInclude: (ToursDay, "tours_day_id"),
+}
+THROUGH_MODELS = (GroupTourDay, ToursDayAttraction, ToursDayInclude)
+
+_STATE_COLUMNS = ("created_at", "updated_at", "is_archived", "archived_at", "restored_at")
+
+
+def touch_parent(sender, instance, **kwargs):
+    """post_save / post_delete of a link row: the parent counts as changed."""
+    parent, attname = PARENT_LINKS[sender]
+    parent.all_objects.filter(pk=getattr(instance, attname)).update(updated_at=timezone.now())
+
+
+def touch_parent_on_m2m_add(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """``.add()`` on a through relation writes rows with bulk_create, without post_save."""
+    if action != "post_add":
+        return
+    if reverse:
+        model.all_objects.filter(pk__in=pk_set).update(updated_at=timezone.now())
+    else:
+        type(instance).all_objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+
+
+def group_tours_changed_since(since):
+    """Pks of tours whose own row, a day or an attraction of a day changed at or after ``since``.
+
+    Archived tours are included: whoever keeps derived data drops them.
+    """
+    changed_days = ToursDay.all_objects.filter(updated_at__gte=since).values("pk")
+    changed_attractions = Attraction.all_objects.filter(updated_at__gte=since).values("pk")
+    days_with_changed = ToursDayAttraction.objects.filter(attraction__in=changed_attractions)
+    pks = set(GroupTour.all_objects.filter(updated_at__gte=since).values_list("pk", flat=True))
+    for days in (changed_days, days_with_changed.values("tours_day_id")):
+        pks.update(GroupTourDay.objects.filter(tours_day__in=days).values_list("group_tour_id", flat=True))
+    return pks
+
+
+def encode_cursor(updated_at, name, pk):
+    raw = f"{updated_at.isoformat()}|{name}|{pk}"
+    return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(updated_at, type index, id) from an opaque cursor."""
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        stamp, name, pk = raw.split("|")
+        updated_at = datetime.fromisoformat(stamp)
+        return updated_at, _FEED_INDEX[name], int(pk)
+    except (BinasciiError, UnicodeDecodeError, ValueError, KeyError):
+        raise ApiError("Invalid cursor.")
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError("limit must be an integer.")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _changed_keys(index, model, since, horizon, limit):
+    """Up to ``limit`` (updated_at, type index, id) of one model after ``since``, from its index."""
+    qs = model.all_objects.filter(updated_at__lte=horizon)
+    if since is not None:
+        stamp, since_index, since_pk = since
+        if index < since_index:
+            qs = qs.filter(updated_at__gt=stamp)
+        elif index > since_index:
+            qs = qs.filter(updated_at__gte=stamp)
+        else:
+            qs = qs.filter(updated_at__gte=stamp).exclude(updated_at=stamp, pk__lte=since_pk)
+    keys = qs.order_by("updated_at", "pk").values_list("updated_at", "pk")[:limit]
+    return [(updated_at, index, pk) for updated_at, pk in keys]
+
+
+def _change_kind(row, since_stamp):
+    if row["is_archived"]:
+        return "archived"
+    if since_stamp is None or row["created_at"] > since_stamp:
+        return "created"
+    if row["restored_at"] and row["restored_at"] > since_stamp:
+        return "restored"
+    return "updated"
+
+
+def _tour_links(tour_ids):
+    """Current itinerary (day ids in order) and media of tours, two queries for the whole page."""
+    itineraries = {}
+    for row in (
+        GroupTourDay.objects.filter(group_tour_id__in=tour_ids)
+        .order_by("group_tour_id", "day_number", "id")
+        .values("group_tour_id", "day_number", "tours_day_id")
+    ):
+        itineraries.setdefault(row["group_tour_id"], []).append(
+            {"day_number": row["day_number"], "tours_day_id": row["tours_day_id"]}
+        )
+    media = {}
+    for row in (
+        GroupTourMedia.objects.filter(group_tour_id__in=tour_ids)
+        .order_by("group_tour_id", "-created_at")
+        .values("group_tour_id", "file", "media_type")
+    ):
+        media.setdefault(row["group_tour_id"], []).append(
+            {"url": _media_url(row["file"]), "media_type": row["media_type"]}
+        )
+    return {pk: {"itinerary": itineraries.get(pk, []), "media": media.get(pk, [])} for pk in tour_ids}
+
+
+def _day_links(day_ids):
+    """Ordered attraction and include ids of days, two queries for the whole page."""
+    links = {pk: {"attraction_ids": [], "include_ids": []} for pk in day_ids}
+    for model, column, key in (
+        (ToursDayAttraction, "attraction_id", "attraction_ids"),
+        (ToursDayInclude, "include_id", "include_ids"),
+    ):
+        # Сортируем в Python: строк не больше, чем связей у дней страницы, а индекса по position нет
+        rows = sorted(
+            model.objects.filter(tours_day_id__in=day_ids)
+            .order_by()
+            .values_list("tours_day_id", "position", "id", column)
+        )
+        for day_id, _, _, related_id in rows:
+            links[day_id][key].append(related_id)
+    return links
+
+
+_LINK_LOADERS = {"group_tour": _tour_links, "tours_day": _day_links}
+
+
+def changes_since(since, limit, horizon=None):
+    """One page of the feed: (records, cursor of the last record or None, has_more).
+
+    At most ``limit`` keys are read per model, then the rows of the chosen
+    records only, plus two queries per type with links.
+    """
+    horizon = horizon or timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    streams = [
+        _changed_keys(index, spec.model, since, horizon, limit + 1) for index, (_, spec) in enumerate(FEED)
+    ]
+    keys = list(heapq.merge(*streams))[: limit + 1]
+    has_more = len(keys) > limit
+    keys = keys[:limit]
+
+    ids_by_type = {}
+    for _, index, pk in keys:
+        ids_by_type.setdefault(index, []).append(pk)
+    rows = {}
+    for index, ids in ids_by_type.items():
+        name, spec = FEED[index]
+        names = list(spec.fields)
+        columns = list(dict.fromkeys(spec.columns(names) + list(_STATE_COLUMNS)))
+        links = _LINK_LOADERS[name](ids) if name in _LINK_LOADERS else {}
+        for row in spec.model.all_objects.filter(pk__in=ids).order_by().values(*columns):
+            data = spec.row(row, names)
+            data.update(links.get(row["id"], {}))
+            rows[index, row["id"]] = (row, data)
+
+    since_stamp = since[0] if since is not None else None
+    records = []
+    for updated_at, index, pk in keys:
+        if (index, pk) not in rows:
+            continue  # удалена между двумя запросами
+        row, data = rows[index, pk]
+        records.append(
+            {
+                "type": FEED[index][0],
+                "id": pk,
+                "change": _change_kind(row, since_stamp),
+                "updated_at": updated_at,
+                "data": data,
+            }
+        )
+    cursor = None
+    if keys:
+        updated_at, index, pk = keys[-1]
+        cursor = encode_cursor(updated_at, FEED[index][0], pk)
+    return records, cursor, has_more
+
+
+@require_safe
+def feed(request):
+    """``since`` — the cursor of the previous response (omit for a full initial sync)."""
+    try:
+        limit = _limit(request)
+        since = decode_cursor(request.GET["since"]) if request.GET.get("since") else None
+    except ApiError as exc:
+        return _error(str(exc))
+
+    # Только primary: реплика может отставать больше, чем окно CHANGES_SETTLE_SECONDS
+    with primary_only():
+        records, cursor, has_more = changes_since(since, limit)
+    response = JsonResponse(
+        {
+            "results": records,
+            "cursor": cursor or request.GET.get("since") or None,
+            "has_more": has_more,
+        },
+        encoder=DjangoJSONEncoder,
+        json_dumps_params={"ensure_ascii": False},
+    )
+    response["Cache-Control"] = "no-store"
+    return response
@@ -0,0 +1,72 @@
+"""SQLite connection tuning and a retry wrapper for catalog writes."""
+import functools
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Один писатель на процесс: потоки не толкаются за RESERVED-блокировку SQLite,
+# между процессами ожидание берёт на себя busy_timeout.
+_write_lock = threading.RLock()
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """connection_created hook: apply ``SQLITE_PRAGMAS`` to a new SQLite connection.
+
+    A database entry may override the set with its own ``PRAGMAS`` key
+    (the read-only replica cannot switch journal mode, for instance).
+    """
+    if connection.vendor != "sqlite":
+        return
+    pragmas = connection.settings_dict.get("PRAGMAS", getattr(settings, "SQLITE_PRAGMAS", {}))
+    raw = connection.connection
+    for name, value in pragmas.items():
+        raw.execute(f"PRAGMA {name} = {value}")
+
+
+def is_locked_error(exc):
+    message = str(exc).lower()
+    return "database is locked" in message or "database table is locked" in message
+
+
+def retry_on_locked(func=None, *, using="default", attempts=None, base_delay=None):
+    """Run ``func`` atomically, serialised per process, retrying while SQLite is locked.
+
+    Deferred SQLite transactions that read first and write later fail with
+    "database is locked" immediately (the busy handler is skipped to avoid a
+    deadlock), so the whole unit of work is rolled back and replayed with
+    exponential backoff. Nested calls run inside the outer transaction as is.
+    """
+    if func is None:
+        return functools.partial(
+            retry_on_locked, using=using, attempts=attempts, base_delay=base_delay
+        )
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if connections[using].in_atomic_block:
+            return func(*args, **kwargs)
+        options = getattr(settings, "SQLITE_WRITE_RETRY", {})
+        max_attempts = attempts if attempts is not None else options.get("attempts", 5)
+        delay = base_delay if base_delay is not None else options.get("base_delay", 0.05)
+        for attempt in range(1, max_attempts + 1):
+            try:
+                with _write_lock, transaction.atomic(using=using):
+                    return func(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt == max_attempts or not is_locked_error(exc):
+                    raise
+                pause = delay * 2 ** (attempt - 1) * (1 + random.random())
+                logger.warning(
+                    "%s: database is locked, retry %s/%s in %.3fs",
+                    func.__qualname__, attempt, max_attempts - 1, pause,
+                )
+                time.sleep(pause)
+        return None
+
+    return wrapper
@@ -1,8 +1,10 @@
 from pathlib import Path
 from django import forms
 from django.conf import settings
+from django.utils import timezone
 
-from .models import Attraction, BlogPost, GroupTour, Include, ToursDay
+from .geocoding import locate_cached
+from .models import Attraction, BlogPost, Departure, GroupTour, Include, ToursDay
 
 
 class MultipleFileInput(forms.ClearableFileInput):
@@ -38,18 +40,53 @@ class BaseCatalogForm(forms.ModelForm):
                 field.widget.attrs.setdefault("class", "catalog-select-multiple")
 
 
-class AttractionForm(BaseCatalogForm):
+class GeoLocatedFormMixin:
+    """Coordinates can be set by hand; otherwise they follow the address.
+
+    When the address changes and the coordinates were not edited, they are
+    taken from the geocoding cache, or cleared for ``geocode_catalog`` to fill.
+    """
+
+    GEO_FIELDS = ("latitude", "longitude")
+    ADDRESS_FIELDS = ("title", "city", "address")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        latitude, longitude = cleaned_data.get("latitude"), cleaned_data.get("longitude")
+        if (latitude is None) != (longitude is None):
+            raise forms.ValidationError("Set both latitude and longitude, or leave both empty.")
+        if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise forms.ValidationError("Coordinates are out of range.")
+        return cleaned_data
+
+    def save(self, commit=True):
+        instance = super().save(commit=False)
+        changed = set(self.changed_data)
+        if not changed & set(self.GEO_FIELDS) and (instance.pk is None or changed & set(self.ADDRESS_FIELDS)):
+            instance.set_location(locate_cached(instance))
+        if commit:
+            instance.save()
+            self.save_m2m()
+        return instance
+
+
+class AttractionForm(GeoLocatedFormMixin, BaseCatalogForm):
     class Meta:
         model = Attraction
-        fields = ["title", "description", "city", "address", "duration_hours", "photo"]
+        fields = ["title", "description", "city", "address", "latitude", "longitude", "duration_hours", "photo"]
         labels = {
             "title": "Title",
             "description": "Description",
             "city": "City",
             "address": "Address",
+            "latitude": "Latitude",
+            "longitude": "Longitude",
             "duration_hours": "Duration (hours)",
             "photo": "Photo",
         }
+        help_texts = {
+            "latitude": "Leave empty to geocode from the address.",
+        }
 
 
 class IncludeForm(BaseCatalogForm):
@@ -83,7 +120,7 @@ class IncludeForm(BaseCatalogForm):
         self.fields["icon_path"].widget.attrs.setdefault("class", "catalog-input")
 
 
-class ToursDayForm(BaseCatalogForm):
+class ToursDayForm(GeoLocatedFormMixin, BaseCatalogForm):
     attractions = forms.ModelMultipleChoiceField(
         queryset=Attraction.objects.none(),
         required=False,
@@ -99,15 +136,23 @@ class ToursDayForm(BaseCatalogForm):
 
     class Meta:
         model = ToursDay
-        fields = ["title", "description", "city", "address", "duration_hours", "photo", "attractions", "includes"]
+        fields = [
+            "title", "description", "city", "address", "latitude", "longitude",
+            "duration_hours", "photo", "attractions", "includes",
+        ]
         labels = {
             "title": "Title",
             "description": "Description",
             "city": "City",
             "address": "Address",
+            "latitude": "Latitude",
+            "longitude": "Longitude",
             "duration_hours": "Duration (hours)",
             "photo": "Photo",
         }
+        help_texts = {
+            "latitude": "Leave empty to geocode from the address.",
+        }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -172,3 +217,63 @@ class BlogPostForm(BaseCatalogForm):
         self.fields["published_at"].input_formats = ["%Y-%m-%d", "%d.%m.%Y"]
         if self.instance and self.instance.pk and self.instance.published_at:
             self.initial["published_at"] = self.instance.published_at.strftime("%Y-%m-%d")
+
+
+class DepartureForm(BaseCatalogForm):
+    class Meta:
+        model = Departure
+        fields = ["starts_on", "capacity"]
+        labels = {"starts_on": "Start date", "capacity": "Seats (empty: the tour's group size)"}
+        widgets = {
+            "starts_on": forms.DateInput(attrs={"type": "date"}, format="%Y-%m-%d"),
+        }
+
+    def __init__(self, *args, group_tour, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instance.group_tour = group_tour
+        self.fields["capacity"].required = False
+
+    def clean_starts_on(self):
+        starts_on = self.cleaned_data["starts_on"]
+        if starts_on < timezone.localdate():
+            raise forms.ValidationError("The start date is in the past.")
+        if Departure.objects.filter(group_tour=self.instance.group_tour, starts_on=starts_on).exists():
+            raise forms.ValidationError("The tour already departs on this date.")
+        return starts_on
+
+
+class BookingForm(forms.Form):
+    """The booking form of a group tour page; the seats are taken by ``tours.booking.book``."""
+
+    departure = forms.ModelChoiceField(queryset=Departure.objects.none(), error_messages={
+        "invalid_choice": "This departure is no longer available.",
+    })
+    name = forms.CharField(max_length=120)
+    email = forms.EmailField()
+    adults = forms.IntegerField(min_value=1, max_value=99)
+    children = forms.IntegerField(min_value=0, max_value=99, required=False)
+    notes = forms.CharField(max_length=2000, required=False)
+    idempotency_key = forms.RegexField(
+        regex=r"^[0-9a-f]{32}$",
+        label="Form",
+        widget=forms.HiddenInput,
+        error_messages={"required": "the page is out of date, reload it.", "invalid": "the page is out of date, reload it."},
+    )
+
+    def __init__(self, *args, group_tour, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["departure"].queryset = Departure.objects.filter(
+            group_tour=group_tour, starts_on__gte=timezone.localdate()
+        )
+
+    @property
+    def seats(self):
+        return self.cleaned_data["adults"] + (self.cleaned_data.get("children") or 0)
+
+
+class LeadForm(forms.Form):
+    """Contact of a site request; the other details are optional and taken as they come."""
+
+    name = forms.CharField(max_length=120, required=False)
+    email = forms.EmailField(label="Email address")
+    month = forms.RegexField(regex=r"^\d{4}-(0[1-9]|1[0-2])$", required=False, label="Preferred start")
@@ -0,0 +1,166 @@
+"""Geohash spatial index for geocoded catalog rows.
+
+A geocoded row stores ``geohash`` (``GEOHASH_PRECISION`` characters) next to
+its coordinates. Every geohash prefix is a grid cell, and the rows of a cell
+are one range of the ``geohash`` index: ``prefix <= geohash < prefix + "~"``.
+A bounding box or a circle is covered by a handful of cells, so the query is
+a few index ranges joined by OR (SQLite's MULTI-INDEX OR), and exact distances
+are computed in Python for the few rows those ranges return.
+"""
+import math
+
+from django.db.models import Q
+
+GEOHASH_PRECISION = 9  # ячейка ~5 x 5 м
+EARTH_RADIUS_KM = 6371.0088
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {char: index for index, char in enumerate(_BASE32)}
+# Больше любого символа алфавита: prefix + "~" — верхняя граница диапазона ячейки
+_RANGE_END = "~"
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def decode(geohash):
+    """(south, west, north, east) of the cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            interval = lng_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def cell_size(precision):
+    """(height, width) of a cell in degrees."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cells(south, west, north, east, precision):
+    height, width = cell_size(precision)
+    cells = set()
+    lat = south
+    while True:
+        lng = west
+        while True:
+            cells.add(encode(min(max(lat, -90.0), 90.0), (lng + 180.0) % 360.0 - 180.0, precision))
+            if lng >= east:
+                break
+            lng = min(lng + width, east)
+        if lat >= north:
+            break
+        lat = min(lat + height, north)
+    return cells
+
+
+def covering_cells(south, west, north, east, max_cells=16):
+    """The finest set of at most ``max_cells`` geohash cells covering the box.
+
+    ``west > east`` means the box crosses the 180th meridian.
+    """
+    if west > east:
+        east += 360.0
+    cells = {""}  # пустой префикс — весь мир
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(precision)
+        estimate = (math.floor((north - south) / height) + 2) * (math.floor((east - west) / width) + 2)
+        if estimate > max_cells:
+            break
+        cells = _cells(south, west, north, east, precision)
+    return sorted(cells)
+
+
+def cells_q(cells, field="geohash"):
+    """OR of index ranges, one per cell."""
+    q = Q()
+    for cell in cells:
+        if not cell:
+            return Q(**{f"{field}__gt": ""})
+        q |= Q(**{f"{field}__gte": cell, f"{field}__lt": cell + _RANGE_END})
+    return q
+
+
+def radius_box(latitude, longitude, radius_km):
+    """(south, west, north, east) of the box around a circle; near a pole it spans all longitudes."""
+    angle = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angle)
+    south, north = latitude - dlat, latitude + dlat
+    if south <= -90.0 or north >= 90.0 or math.sin(angle) >= math.cos(math.radians(latitude)):
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+    dlng = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(latitude))))
+    return south, longitude - dlng, north, longitude + dlng
+
+
+def in_bbox(queryset, south, west, north, east, max_cells=16):
+    """Rows of ``queryset`` inside the box, found through the geohash index."""
+    qs = queryset.filter(cells_q(covering_cells(south, west, north, east, max_cells)))
+    qs = qs.filter(latitude__gte=south, latitude__lte=north)
+    if west <= east:
+        return qs.filter(longitude__gte=west, longitude__lte=east)
+    return qs.filter(Q(longitude__gte=west) | Q(longitude__lte=east))
+
+
+def nearby(queryset, latitude, longitude, radius_km, limit, fields=("id", "latitude", "longitude")):
+    """Up to ``limit`` rows within ``radius_km``, nearest first, in one query.
+
+    Rows are dicts of ``fields`` plus ``distance_km``.
+    """
+    south, west, north, east = radius_box(latitude, longitude, radius_km)
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    fields = list(dict.fromkeys([*fields, "latitude", "longitude"]))
+    # Сортировка и отсечение по расстоянию — в Python: строк в нескольких ячейках немного
+    rows = []
+    for row in in_bbox(queryset, south, west, north, east, max_cells=9).order_by().values(*fields):
+        row["distance_km"] = haversine_km(latitude, longitude, row["latitude"], row["longitude"])
+        if row["distance_km"] <= radius_km:
+            rows.append(row)
+    rows.sort(key=lambda row: (row["distance_km"], row["id"]))
+    return rows[:limit]
+
+
+def nearest(queryset, latitude, longitude, k, max_radius_km=1000.0, start_radius_km=2.0, **kwargs):
+    """k nearest rows: ``nearby`` with a radius growing 4x until ``k`` rows fit in it."""
+    radius = start_radius_km
+    while True:
+        rows = nearby(queryset, latitude, longitude, min(radius, max_radius_km), k, **kwargs)
+        if len(rows) >= k or radius >= max_radius_km:
+            return rows
+        radius *= 4
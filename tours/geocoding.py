@@ -0,0 +1,216 @@
+"""Geocoding of catalog addresses with a persistent cache.
+
+The geocoder is pluggable (``settings.GEOCODER``, a dotted path to a class
+with ``provider`` and ``geocode(query)``). Every answer, including "not
+found", is stored in ``GeocodeCache`` under the normalized query, so the
+remote service is asked at most once per distinct address. Rows are
+geocoded in bulk by ``manage.py geocode_catalog``; a catalog form only
+takes coordinates the cache already knows.
+"""
+import json
+import time
+import unicodedata
+from functools import lru_cache
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .db import retry_on_locked
+from .models import Attraction, GeocodeCache, ToursDay
+
+COUNTRY = "Poland"
+GEOCODED_MODELS = (Attraction, ToursDay)
+
+
+def normalize_query(text):
+    """Case- and accent-folded query with single spaces: the cache key."""
+    text = unicodedata.normalize("NFKD", text.replace("ł", "l").replace("Ł", "L"))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.casefold().split())
+
+
+def candidate_queries(record):
+    """Queries from the most to the least precise, as the step-3 map used to try them."""
+    queries = [
+        ", ".join(part for part in (record.address, record.city, COUNTRY) if part),
+        ", ".join(part for part in (record.city, COUNTRY) if part),
+        ", ".join(part for part in (record.title, record.city, COUNTRY) if part),
+    ]
+    return [query for query in dict.fromkeys(normalize_query(q) for q in queries) if query != normalize_query(COUNTRY)]
+
+
+class YandexGeocoder:
+    """Yandex HTTP Geocoder API (``YANDEX_GEOCODER_API_KEY``)."""
+
+    provider = "yandex"
+    url = "https://geocode-maps.yandex.ru/1.x/"
+    min_interval = 0.1  # сек. между запросами, ограничение бесплатного тарифа
+
+    def __init__(self, api_key=None, timeout=10):
+        self.api_key = api_key or settings.YANDEX_GEOCODER_API_KEY
+        self.timeout = timeout
+        self._last_request = 0.0
+
+    def geocode(self, query):
+        wait = self._last_request + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        params = urlencode({"apikey": self.api_key, "geocode": query, "format": "json", "results": 1, "lang": "en_US"})
+        try:
+            with urlopen(f"{self.url}?{params}", timeout=self.timeout) as response:
+                data = json.load(response)
+        finally:
+            self._last_request = time.monotonic()
+        members = data["response"]["GeoObjectCollection"]["featureMember"]
+        if not members:
+            return None
+        longitude, latitude = map(float, members[0]["GeoObject"]["Point"]["pos"].split())
+        return latitude, longitude
+
+
+class OfflineGeocoder:
+    """Stand-in without network access: knows city centres and the places passed in.
+
+    Used in development and tests; a query resolves if one of its
+    comma-separated parts is a known place name.
+    """
+
+    provider = "offline"
+    CITIES = {
+        "gdansk": (54.352, 18.6466),
+        "krakow": (50.0647, 19.945),
+        "malbork": (54.0359, 19.0266),
+        "warsaw": (52.2297, 21.0122),
+        "warszawa": (52.2297, 21.0122),
+        "wieliczka": (49.9875, 20.0614),
+        "zakopane": (49.2992, 19.9496),
+        "oswiecim": (50.0344, 19.2104),
+        "auschwitz": (50.0344, 19.2104),
+        "wroclaw": (51.1079, 17.0385),
+        "poznan": (52.4064, 16.9252),
+        "torun": (53.0138, 18.5984),
+        "lodz": (51.7592, 19.456),
+        "lublin": (51.2465, 22.5684),
+        "szczecin": (53.4285, 14.5528),
+        "sopot": (54.4418, 18.5601),
+        "gdynia": (54.5189, 18.5305),
+    }
+
+    def __init__(self, places=None):
+        self.places = dict(self.CITIES)
+        self.places.update({normalize_query(name): coords for name, coords in (places or {}).items()})
+
+    def geocode(self, query):
+        query = normalize_query(query)
+        if query in self.places:
+            return self.places[query]
+        for part in query.split(","):
+            coords = self.places.get(part.strip())
+            if coords:
+                return coords
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_geocoder():
+    return import_string(settings.GEOCODER)()
+
+
+def cached(queries):
+    """{query: (latitude, longitude) or None} for the queries already in the cache."""
+    return {
+        row.query: (row.latitude, row.longitude) if row.latitude is not None else None
+        for row in GeocodeCache.objects.filter(query__in=queries)
+    }
+
+
+@retry_on_locked
+def _store(query, coords, provider):
+    latitude, longitude = coords or (None, None)
+    GeocodeCache.objects.bulk_create(
+        [GeocodeCache(query=query, latitude=latitude, longitude=longitude, provider=provider)],
+        ignore_conflicts=True,
+    )
+
+
+def geocode(query, geocoder=None, known=None):
+    """(latitude, longitude) or None; asks the geocoder only on a cache miss.
+
+    ``known`` — answers already read with ``cached()``, to skip the lookup.
+    """
+    query = normalize_query(query)
+    known = cached([query]) if known is None else known
+    if query in known:
+        return known[query]
+    geocoder = geocoder or get_geocoder()
+    try:
+        coords = geocoder.geocode(query)
+    except (URLError, OSError, KeyError, ValueError):
+        return None  # сбой сервиса не кэшируем: следующий запуск спросит снова
+    _store(query, coords, geocoder.provider)
+    known[query] = coords
+    return coords
+
+
+def locate(record, geocoder=None, known=None):
+    """Coordinates of a catalog record from its most precise resolvable query."""
+    queries = candidate_queries(record)
+    known = cached(queries) if known is None else known
+    for query in queries:
+        coords = geocode(query, geocoder, known)
+        if coords:
+            return coords
+    return None
+
+
+def locate_cached(record):
+    """Like ``locate``, but without remote calls; None if the answer depends on a query not cached yet."""
+    queries = candidate_queries(record)
+    known = cached(queries)
+    for query in queries:
+        if query not in known:
+            return None
+        if known[query]:
+            return known[query]
+    return None
+
+
+@retry_on_locked
+def _save_locations(model, records):
+    now = timezone.now()
+    for record in records:
+        record.updated_at = now  # координаты видны в API и ленте изменений
+    model.all_objects.bulk_update(records, ["latitude", "longitude", "geohash", "updated_at"])
+
+
+def geocode_missing(model, batch_size=100, geocoder=None):
+    """Geocode rows without coordinates; yields (located, not found) per batch.
+
+    Rows the geocoder cannot place stay empty; the cached "not found" makes
+    the next run skip them without a remote call.
+    """
+    last_pk = 0
+    while True:
+        records = list(
+            model.all_objects.filter(pk__gt=last_pk, latitude__isnull=True)
+            .order_by("pk")
+            .only("pk", "title", "city", "address")[:batch_size]
+        )
+        if not records:
+            return
+        last_pk = records[-1].pk
+        # Кэш на всю пачку одним запросом; новые ответы дописываются в тот же словарь
+        known = cached({query for record in records for query in candidate_queries(record)})
+        located = []
+        for record in records:
+            coords = locate(record, geocoder, known)
+            if coords:
+                record.set_location(coords)
+                located.append(record)
+        if located:
+            _save_locations(model, located)
+        yield len(located), len(records) - len(located)
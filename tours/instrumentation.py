@@ -0,0 +1,89 @@
+"""Per-request SQL / template timing and repeated-query detection."""
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+_current_stats = ContextVar("tours_request_stats", default=None)
+
+# "IN (%s, %s, %s)" -> "IN (...)": prefetch на 3 и на 30 объектов — один и тот же запрос
+_IN_LIST_RE = re.compile(r"IN \((?:%s, )*%s\)")
+
+
+class RepeatedQueryError(Exception):
+    """Raised in strict mode when one query shape repeats too often in a request."""
+
+
+def query_shape(sql):
+    return _IN_LIST_RE.sub("IN (...)", sql)
+
+
+class RequestStats:
+    def __init__(self):
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.shapes = Counter()
+        # Async-вьюхи выполняют запросы одного HTTP-запроса в нескольких потоках сразу
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, duration):
+        shape = query_shape(sql)
+        with self._lock:
+            self.query_count += 1
+            self.sql_time += duration
+            self.shapes[shape] += 1
+
+    def repeated(self, limit):
+        """Query shapes executed more than ``limit`` times, most frequent first."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > limit]
+
+    def duplicate_count(self):
+        return sum(count - 1 for count in self.shapes.values() if count > 1)
+
+    def server_timing(self, total):
+        return ", ".join(
+            (
+                f'db;dur={self.sql_time * 1000:.1f};desc="{self.query_count} queries"',
+                f"tpl;dur={self.template_time * 1000:.1f}",
+                f"total;dur={total * 1000:.1f}",
+            )
+        )
+
+
+def current_stats():
+    return _current_stats.get()
+
+
+def collect():
+    """Start collecting stats for the current request; returns (stats, token)."""
+    stats = RequestStats()
+    return stats, _current_stats.set(stats)
+
+
+def stop_collecting(token):
+    _current_stats.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection; a no-op outside requests."""
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created hook.
+
+    The wrapper lives on the connection rather than being pushed per request,
+    so queries made from worker threads (async views) are counted as well:
+    the ContextVar with the request's stats travels with the context.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
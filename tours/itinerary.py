@@ -0,0 +1,148 @@
+"""Suggested visiting order for the attractions of a tour day.
+
+The stops with coordinates get a haversine distance matrix in one NumPy
+expression; a nearest-neighbour route is then improved by 2-opt, reversing
+the segment that shortens the route most, until no reversal helps. The
+route starts at the day's own location when it is geocoded (otherwise at
+any stop, nearest-neighbour beginning with the current first one) and ends
+at whichever stop comes last. Stops without coordinates keep their order
+after the others.
+
+The schedule of an order adds the travel time at
+``ITINERARY_TRAVEL_SPEED_KMH`` and each attraction's ``duration_hours``,
+and marks the stops that end after the day's own ``duration_hours``.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+
+from . import geo
+
+_EPSILON = 1e-9
+
+
+def distance_matrix(latitudes, longitudes):
+    """Haversine distances in km between every pair of points."""
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lng = np.radians(np.asarray(longitudes, dtype=float))
+    a = (
+        np.sin((lat[:, None] - lat[None, :]) / 2) ** 2
+        + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin((lng[:, None] - lng[None, :]) / 2) ** 2
+    )
+    return 2 * geo.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _nearest_neighbour(dist, first):
+    route = [first]
+    visited = np.zeros(len(dist), dtype=bool)
+    visited[first] = True
+    for _ in range(len(dist) - 1):
+        following = int(np.argmin(np.where(visited, np.inf, dist[route[-1]])))
+        route.append(following)
+        visited[following] = True
+    return route
+
+
+def _two_opt(dist, route):
+    """Best-improvement 2-opt over ``route``; its first and last nodes stay in place."""
+    route = np.asarray(route)
+    positions = np.arange(1, len(route) - 1)
+    upper = np.triu(np.ones((len(positions), len(positions)), dtype=bool), k=1)
+    while len(positions) > 1:
+        before, node, after = route[positions - 1], route[positions], route[positions + 1]
+        # Разворот route[i..j]: рёбра (i-1, i) и (j, j+1) меняются на (i-1, j) и (i, j+1)
+        delta = (
+            dist[before[:, None], node[None, :]]
+            + dist[node[:, None], after[None, :]]
+            - dist[before, node][:, None]
+            - dist[node, after][None, :]
+        )
+        delta = np.where(upper, delta, 0.0)
+        i, j = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[i, j] >= -_EPSILON:
+            break
+        route[positions[i] : positions[j] + 1] = route[positions[i] : positions[j] + 1][::-1]
+    return route.tolist()
+
+
+def optimize(points, start=None):
+    """Order (indices into ``points``) of (latitude, longitude) pairs with a short open route.
+
+    ``start`` — where the route begins, if anywhere in particular.
+    """
+    count = len(points)
+    if count == 0 or (count < 3 and start is None):
+        return list(range(count))
+    latitudes = [lat for lat, _ in points] + [start[0] if start else 0.0]
+    longitudes = [lng for _, lng in points] + [start[1] if start else 0.0]
+    # Узлы: остановки, начало (точка дня или «где угодно» — нули) и фиктивный конец с нулями
+    dist = np.zeros((count + 2, count + 2))
+    dist[: count + 1, : count + 1] = distance_matrix(latitudes, longitudes)
+    if start is None:
+        dist[count, :] = dist[:, count] = 0.0
+        first = 0
+    else:
+        first = int(np.argmin(dist[count, :count]))
+    route = _nearest_neighbour(dist[:count, :count], first)
+    route = _two_opt(dist, [count, *route, count + 1])
+    return route[1:-1]
+
+
+def schedule(stops, start=None, day_hours=None):
+    """Legs, arrival and departure times (hours from the start) of ``stops`` in this order.
+
+    ``stops`` — attractions; a leg to or from one without coordinates counts as unknown.
+    """
+    speed = settings.ITINERARY_TRAVEL_SPEED_KMH
+    rows = []
+    clock = distance = 0.0
+    previous = start
+    for attraction in stops:
+        here = attraction.location
+        leg = geo.haversine_km(*previous, *here) if previous and here else None
+        if leg is not None:
+            distance += leg
+            clock += leg / speed
+        arrival = clock
+        clock += float(attraction.duration_hours)
+        rows.append(
+            {
+                "attraction": attraction,
+                "leg_km": leg,
+                "arrival_hours": arrival,
+                "departure_hours": clock,
+                "over": day_hours is not None and clock > day_hours + _EPSILON,
+            }
+        )
+        previous = here or previous
+    return {
+        "stops": rows,
+        "distance_km": distance,
+        "hours": clock,
+        "fits": day_hours is None or clock <= day_hours + _EPSILON,
+    }
+
+
+def plan(tours_day, links):
+    """Current and suggested order of a day's ``ToursDayAttraction`` links (ordered by position)."""
+    started = time.perf_counter()
+    located = [link for link in links if link.attraction.location]
+    unlocated = [link for link in links if not link.attraction.location]
+    start = tours_day.location
+    order = optimize([link.attraction.location for link in located], start)
+    suggested = [located[index] for index in order] + unlocated
+    day_hours = float(tours_day.duration_hours) if tours_day.duration_hours else None
+    current = schedule([link.attraction for link in links], start, day_hours)
+    proposal = schedule([link.attraction for link in suggested], start, day_hours)
+    if not unlocated and proposal["distance_km"] >= current["distance_km"] - _EPSILON:
+        # Эвристика не нашла ничего короче ручного порядка — его и оставляем
+        suggested, proposal = list(links), current
+    return {
+        "current": current,
+        "suggested": proposal,
+        "suggested_links": suggested,
+        "unlocated": [link.attraction for link in unlocated],
+        "changed": [link.pk for link in suggested] != [link.pk for link in links],
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+    }
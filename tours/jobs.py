@@ -0,0 +1,395 @@
+"""Background jobs in a SQLite table, run by ``manage.py runworker``.
+
+A job is a ``Job`` row: a registered task name, JSON arguments, a priority
+and the time it becomes due. A worker claims one with a single conditional
+UPDATE: ``status = 'running' WHERE id = (the best due queued job) AND
+status = 'queued'``. SQLite runs one writer at a time, so two workers never
+take the same row, and nobody waits on a row lock (the effect of ``FOR
+UPDATE SKIP LOCKED`` elsewhere). Idle workers only peek with a read, so
+they stay off the write lock. A claimed job holds a lease; when a worker
+dies, ``reap_expired`` hands the job back to the queue. A failed attempt is
+retried with exponential backoff until ``max_attempts``, and the traceback
+stays in ``last_error``. With a ``unique_key``, at most one equal job waits
+in the queue: repeated requests for the same recompute share it.
+
+``JOB_SCHEDULE`` lists cron entries (five fields, local time). Workers
+enqueue their tasks when due; a compare-and-set on ``next_run_at`` lets
+only one of them do it. Tasks live in ``tours.tasks``.
+"""
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, F, Min, Subquery
+from django.utils import timezone
+
+from .db import retry_on_locked
+from .models import Job, JobSchedule
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница паузы между попытками, сек.
+MAX_RETRY_DELAY = 3600
+ERROR_LIMIT = 10000
+
+
+class Task:
+    def __init__(self, name, func, lease, max_attempts, priority):
+        self.name = name
+        self.func = func
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.priority = priority
+
+
+_registry = {}
+
+
+def register(name, *, lease=None, max_attempts=None, priority=0):
+    """Decorator: make ``func`` runnable as task ``name``; ``lease`` (seconds) bounds one attempt."""
+
+    def decorator(func):
+        _registry[name] = Task(name, func, lease, max_attempts, priority)
+        return func
+
+    return decorator
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f"Unknown task {name!r}") from None
+
+
+# --- постановка в очередь ---
+
+
+def enqueue(task, args=None, *, priority=None, delay=0, run_at=None, unique_key="", max_attempts=None):
+    """Queue ``task``; with ``unique_key`` an equal job still waiting in the queue is returned instead."""
+    spec = get_task(task)
+    job = Job(
+        task=task,
+        args=args or {},
+        priority=spec.priority if priority is None else priority,
+        run_at=run_at or timezone.now() + timedelta(seconds=delay),
+        unique_key=unique_key,
+        max_attempts=max_attempts or spec.max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+    return _insert(job)
+
+
+@retry_on_locked
+def _insert(job):
+    if job.unique_key:
+        queued = Job.objects.filter(status=Job.QUEUED, unique_key=job.unique_key).first()
+        if queued is not None:
+            return queued
+    try:
+        # Точка сохранения: при вызове из чужой транзакции конфликт ключа не ломает её
+        with transaction.atomic():
+            job.save(force_insert=True)
+    except IntegrityError:
+        return Job.objects.get(status=Job.QUEUED, unique_key=job.unique_key)
+    return job
+
+
+# --- выборка и выполнение ---
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(worker):
+    """Take the most urgent due job for ``worker``; None when nothing is due."""
+    now = timezone.now()
+    # Чтение без блокировки записи: простаивающие воркеры не мешают сайту
+    if not Job.objects.filter(status=Job.QUEUED, run_at__lte=now).exists():
+        return None
+    return _take(f"{worker}:{uuid.uuid4().hex[:12]}", now)
+
+
+@retry_on_locked
+def _take(token, now):
+    # Первым идёт UPDATE: выбор и захват строки — один оператор под блокировкой записи
+    best = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by("-priority", "run_at", "id").values("pk")
+    taken = Job.objects.filter(pk=Subquery(best[:1]), status=Job.QUEUED).update(
+        status=Job.RUNNING,
+        claim=token,
+        attempts=F("attempts") + 1,
+        started_at=now,
+        lease_until=now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+    )
+    if not taken:
+        return None
+    job = Job.objects.get(claim=token)
+    task = _registry.get(job.task)
+    if task is not None and task.lease:
+        job.lease_until = now + timedelta(seconds=task.lease)
+        Job.objects.filter(pk=job.pk).update(lease_until=job.lease_until)
+    return job
+
+
+def run(job):
+    """Run a claimed job and record the outcome; True when it succeeded."""
+    started = time.monotonic()
+    try:
+        result = get_task(job.task).func(**job.args)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) attempt %s failed:\n%s", job.pk, job.task, job.attempts, error)
+        _retry_or_fail(job.pk, job.claim, job.attempts, job.max_attempts, error)
+        return False
+    finished = _finish(job, result)
+    logger.info("Job %s (%s) done in %.2fs", job.pk, job.task, time.monotonic() - started)
+    return finished
+
+
+@retry_on_locked
+def _finish(job, result):
+    done = Job.objects.filter(pk=job.pk, status=Job.RUNNING, claim=job.claim).update(
+        status=Job.DONE, result=result, finished_at=timezone.now(), lease_until=None, last_error=""
+    )
+    if not done:
+        # Аренда истекла, задачу уже вернули в очередь: результат этой попытки не пишем
+        logger.warning("Job %s (%s) finished after its lease expired", job.pk, job.task)
+    return bool(done)
+
+
+def retry_delay(attempt):
+    """Seconds before the next attempt: exponential with jitter, capped at ``MAX_RETRY_DELAY``."""
+    delay = settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempt - 1) * (1 + random.random())
+    return min(delay, MAX_RETRY_DELAY)
+
+
+@retry_on_locked
+def _retry_or_fail(pk, claim_token, attempts, max_attempts, error):
+    now = timezone.now()
+    running = Job.objects.filter(pk=pk, status=Job.RUNNING, claim=claim_token)
+    error = error[-ERROR_LIMIT:]
+    if attempts >= max_attempts:
+        return running.update(status=Job.FAILED, finished_at=now, lease_until=None, last_error=error)
+    try:
+        with transaction.atomic():
+            return running.update(
+                status=Job.QUEUED,
+                claim="",
+                lease_until=None,
+                run_at=now + timedelta(seconds=retry_delay(attempts)),
+                last_error=error,
+            )
+    except IntegrityError:
+        # В очереди уже ждёт такая же задача — повтор не нужен
+        return running.update(
+            status=Job.FAILED, finished_at=now, lease_until=None, last_error=f"{error}\nSuperseded by a queued job."
+        )
+
+
+def reap_expired():
+    """Hand jobs of dead or stuck workers back to the queue; returns how many were reaped."""
+    expired = Job.objects.filter(status=Job.RUNNING, lease_until__lt=timezone.now())
+    reaped = 0
+    for pk, claim_token, attempts, max_attempts, task in expired.values_list(
+        "pk", "claim", "attempts", "max_attempts", "task"
+    ):
+        logger.warning("Job %s (%s) lease of %s expired", pk, task, claim_token)
+        reaped += _retry_or_fail(pk, claim_token, attempts, max_attempts, f"Lease of {claim_token} expired.")
+    return reaped
+
+
+# --- расписание ---
+
+
+class Cron:
+    """Five-field cron expression: minute, hour, day of month, month, day of week (0 or 7 is Sunday).
+
+    Fields take ``*``, numbers, ranges ``a-b``, steps ``*/n`` / ``a-b/n`` and
+    comma lists. When both day fields are restricted, either may match.
+    """
+
+    BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"{expression!r}: expected 5 fields")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.BOUNDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day, self.any_weekday = fields[2] == "*", fields[4] == "*"
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(","):
+            span, _, step = part.partition("/")
+            if span == "*":
+                start, end = low, high
+            elif "-" in span:
+                start, end = (int(value) for value in span.split("-", 1))
+            else:
+                start = end = int(span)
+            step = int(step) if step else 1
+            if not (low <= start <= end <= high) or step < 1:
+                raise ValueError(f"{field!r}: out of range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, after):
+        """The first matching minute strictly after ``after`` (aware datetime, local time zone)."""
+        tz = timezone.get_current_timezone()
+        moment = timezone.localtime(after, tz).replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return timezone.make_aware(moment, tz)
+        raise ValueError(f"{self.expression!r} never matches")
+
+
+@retry_on_locked
+def sync_schedules():
+    """Make ``JobSchedule`` rows follow ``settings.JOB_SCHEDULE``; a changed entry is rescheduled."""
+    now = timezone.now()
+    wanted = settings.JOB_SCHEDULE
+    JobSchedule.objects.exclude(pk__in=list(wanted)).delete()
+    existing = JobSchedule.objects.in_bulk(list(wanted))
+    for name, (cron, task) in wanted.items():
+        get_task(task)
+        schedule = existing.get(name)
+        if schedule is not None and (schedule.cron, schedule.task) == (cron, task):
+            continue
+        JobSchedule.objects.update_or_create(
+            name=name, defaults={"cron": cron, "task": task, "next_run_at": Cron(cron).next_after(now)}
+        )
+
+
+def enqueue_due():
+    """Queue the tasks of due schedules; returns how many were queued."""
+    now = timezone.now()
+    return sum(_fire(schedule, now) for schedule in JobSchedule.objects.filter(next_run_at__lte=now))
+
+
+@retry_on_locked
+def _fire(schedule, now):
+    # Пропущенные запуски не догоняются: следующий срок считается от текущего момента
+    fired = JobSchedule.objects.filter(pk=schedule.pk, next_run_at=schedule.next_run_at).update(
+        next_run_at=Cron(schedule.cron).next_after(now), last_enqueued_at=now
+    )
+    if fired:
+        enqueue(schedule.task, unique_key=f"schedule:{schedule.name}")
+    return fired
+
+
+# --- воркер ---
+
+
+def work(worker, stop, *, poll=None, burst=False):
+    """Run jobs until ``stop`` (a ``threading.Event``) is set; with ``burst``, until nothing is due.
+
+    A job in progress is always finished first. Returns the number of jobs run.
+    """
+    poll = poll or settings.JOB_POLL_SECONDS
+    ran = 0
+    maintenance_at = 0.0
+    while not stop.is_set():
+        if time.monotonic() >= maintenance_at:
+            reap_expired()
+            enqueue_due()
+            maintenance_at = time.monotonic() + poll
+        close_old_connections()
+        job = claim(worker)
+        if job is None:
+            if burst:
+                return ran
+            stop.wait(poll)
+            continue
+        run(job)
+        ran += 1
+    return ran
+
+
+# --- состояние очереди ---
+
+
+def _percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def queue_depth(now=None):
+    """(due queued jobs, seconds the oldest of them has waited)."""
+    now = now or timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).aggregate(count=Count("pk"), oldest=Min("run_at"))
+    return due["count"], (now - due["oldest"]).total_seconds() if due["oldest"] else 0.0
+
+
+def stats(window=timedelta(hours=1), limit=5000):
+    """Queue depth and per-task latency of the jobs finished within ``window``."""
+    now = timezone.now()
+    depth, oldest = queue_depth(now)
+    by_task = {}
+    for task, status, count in Job.objects.values_list("task", "status").annotate(count=Count("pk")).order_by():
+        by_task.setdefault(task, {"task": task, "counts": dict.fromkeys((s for s, _ in Job.STATUS_CHOICES), 0)})
+        by_task[task]["counts"][status] = count
+
+    finished = (
+        Job.objects.filter(status__in=(Job.DONE, Job.FAILED), finished_at__gte=now - window)
+        .order_by("-finished_at")
+        .values_list("task", "status", "run_at", "started_at", "finished_at")[:limit]
+    )
+    samples = {}
+    for task, status, run_at, started_at, finished_at in finished:
+        sample = samples.setdefault(task, {"wait": [], "run": [], "failed": 0})
+        sample["wait"].append((started_at - run_at).total_seconds())
+        sample["run"].append((finished_at - started_at).total_seconds())
+        sample["failed"] += status == Job.FAILED
+    latency = [
+        {
+            "task": task,
+            "finished": len(sample["run"]),
+            "failed": sample["failed"],
+            "wait_p50": _percentile(sample["wait"], 0.5),
+            "wait_p95": _percentile(sample["wait"], 0.95),
+            "run_p50": _percentile(sample["run"], 0.5),
+            "run_p95": _percentile(sample["run"], 0.95),
+        }
+        for task, sample in sorted(samples.items())
+    ]
+    return {
+        "due": depth,
+        "oldest_wait": oldest,
+        "scheduled": Job.objects.filter(status=Job.QUEUED, run_at__gt=now).count(),
+        "tasks": sorted(by_task.values(), key=lambda row: row["task"]),
+        "latency": latency,
+        "window_minutes": int(window.total_seconds() // 60),
+        "running": list(Job.objects.filter(status=Job.RUNNING).order_by("started_at")),
+        "failures": list(Job.objects.filter(status=Job.FAILED).order_by("-finished_at")[:20]),
+        "schedules": list(JobSchedule.objects.all()),
+    }
@@ -0,0 +1,219 @@
+"""Lead capture: site requests go to a local journal first, to the database later.
+
+A submitted form ("For organizations", the journey wizard) is one INSERT
+into ``LEADS_JOURNAL_PATH``. That is a small append-only SQLite file of its
+own (WAL, ``synchronous = full``: a committed entry survives a crash). The
+request never waits for the catalog database's write lock, and a burst of
+submissions costs a burst of appends. ``manage.py drain_leads`` moves the
+entries in batches into ``LeadContact`` / ``Lead`` (one transaction per
+batch, contacts merged by email), then deletes them from the journal. An
+entry keeps its key in ``Lead.key``, so an entry drained twice after a
+crash is stored once. New leads are then handed to the notifier,
+``settings.LEADS_NOTIFIER``: a dotted path to a class with
+``send(leads)``. A lead whose notification failed stays pending and is
+retried by the next run.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+from .db import retry_on_locked
+from .models import Attraction, Lead, LeadContact
+
+logger = logging.getLogger(__name__)
+
+LEAD_FIELDS = (
+    "experience",
+    "wishes",
+    "start_month",
+    "days",
+    "adults",
+    "children",
+    "cities",
+    "country",
+    "accommodation",
+    "comments",
+    "health",
+)
+
+
+class Journal:
+    """Append-only queue of JSON entries in a SQLite file, one connection per thread and process."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=20, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = wal")
+            conn.execute("PRAGMA synchronous = full")
+            # AUTOINCREMENT: номера не переиспользуются после очистки, «всё до id» однозначно
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entry ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL)"
+            )
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def append(self, kind, payload):
+        self._connection().execute(
+            "INSERT INTO entry (kind, payload) VALUES (?, ?)", (kind, json.dumps(payload, ensure_ascii=False))
+        )
+
+    def read(self, limit):
+        """The oldest ``limit`` entries as (id, kind, payload)."""
+        rows = self._connection().execute("SELECT id, kind, payload FROM entry ORDER BY id LIMIT ?", (limit,))
+        return [(entry_id, kind, json.loads(payload)) for entry_id, kind, payload in rows]
+
+    def remove_through(self, entry_id):
+        self._connection().execute("DELETE FROM entry WHERE id <= ?", (entry_id,))
+
+    def __len__(self):
+        return self._connection().execute("SELECT count(*) FROM entry").fetchone()[0]
+
+
+@lru_cache(maxsize=None)
+def get_journal():
+    return Journal(str(settings.LEADS_JOURNAL_PATH))
+
+
+def submit(source, name, email, **details):
+    """Queue a lead; ``details`` are ``LEAD_FIELDS`` values and ``places`` (attraction ids)."""
+    payload = {
+        "key": uuid.uuid4().hex,
+        "submitted_at": timezone.now().isoformat(),
+        "name": name,
+        "email": email,
+        **details,
+    }
+    get_journal().append(source, payload)
+
+
+# --- разбор журнала ---
+
+
+@retry_on_locked
+def _store(entries):
+    """Leads of the entries not stored yet; contacts are created or renamed by email."""
+    keys = [payload["key"] for _, _, payload in entries]
+    stored = set(Lead.objects.filter(key__in=keys).values_list("key", flat=True))
+    entries = [(kind, payload) for _, kind, payload in entries if payload["key"] not in stored]
+    if not entries:
+        return []
+
+    names = {}
+    for _, payload in entries:
+        names[payload["email"].strip().lower()] = payload["name"]  # у повторной заявки имя новее
+    contacts = LeadContact.objects.in_bulk(list(names), field_name="email")
+    renamed = []
+    for email, name in names.items():
+        contact = contacts.get(email)
+        if contact is None:
+            contacts[email] = LeadContact(email=email, name=name)
+        elif name and contact.name != name:
+            contact.name = name
+            renamed.append(contact)
+    LeadContact.objects.bulk_create([contact for contact in contacts.values() if contact.pk is None])
+    LeadContact.objects.bulk_update(renamed, ["name"])
+
+    leads = Lead.objects.bulk_create(
+        Lead(
+            key=payload["key"],
+            source=kind,
+            contact=contacts[payload["email"].strip().lower()],
+            submitted_at=parse_datetime(payload["submitted_at"]),
+            **{field: payload[field] for field in LEAD_FIELDS if payload.get(field) not in (None, "")},
+        )
+        for kind, payload in entries
+    )
+    places = {lead.pk: payload.get("places", []) for lead, (_, payload) in zip(leads, entries)}
+    wanted = {pk for ids in places.values() for pk in ids}
+    known = set(Attraction.all_objects.filter(pk__in=wanted).values_list("pk", flat=True))
+    Lead.places.through.objects.bulk_create(
+        Lead.places.through(lead_id=lead_pk, attraction_id=attraction_pk)
+        for lead_pk, ids in places.items()
+        for attraction_pk in dict.fromkeys(ids)
+        if attraction_pk in known
+    )
+    return leads
+
+
+def drain(batch_size=None):
+    """Move journal entries into the database batch by batch; returns the number of new leads."""
+    journal = get_journal()
+    batch_size = batch_size or settings.LEADS_DRAIN_BATCH
+    created = 0
+    while True:
+        entries = journal.read(batch_size)
+        if not entries:
+            return created
+        created += len(_store(entries))
+        # Удаляем после коммита: упав между ними, следующий запуск пропустит записи по ключу
+        journal.remove_through(entries[-1][0])
+
+
+# --- уведомления ---
+
+
+@lru_cache(maxsize=None)
+def get_notifier():
+    return import_string(settings.LEADS_NOTIFIER)()
+
+
+class LogNotifier:
+    """Stand-in for development and tests: writes the leads to the ``tours.leads`` log."""
+
+    def send(self, leads):
+        for lead in leads:
+            logger.info("New %s lead %s from %s <%s>", lead.source, lead.pk, lead.contact.name, lead.contact.email)
+
+
+class EmailNotifier:
+    """One email per batch to ``LEADS_NOTIFY_EMAILS`` through Django's mail backend."""
+
+    def __init__(self, recipients=None):
+        self.recipients = recipients or settings.LEADS_NOTIFY_EMAILS
+
+    def send(self, leads):
+        lines = [
+            f"{lead.get_source_display()}: {lead.contact.name} <{lead.contact.email}>, "
+            f"{lead.submitted_at:%Y-%m-%d %H:%M}"
+            for lead in leads
+        ]
+        send_mail(f"po.tours: {len(leads)} new request(s)", "\n".join(lines), None, self.recipients)
+
+
+def notify_pending(batch_size=None):
+    """Send the leads not notified yet, oldest first; returns how many were sent."""
+    batch_size = batch_size or settings.LEADS_DRAIN_BATCH
+    notifier = get_notifier()
+    sent = 0
+    while True:
+        leads = list(
+            Lead.objects.filter(notified_at__isnull=True).select_related("contact").order_by("submitted_at", "pk")[
+                :batch_size
+            ]
+        )
+        if not leads:
+            return sent
+        try:
+            notifier.send(leads)
+        except Exception:  # уведомление повторит следующий запуск
+            logger.exception("Lead notification failed, %s lead(s) left pending", len(leads))
+            return sent
+        Lead.objects.filter(pk__in=[lead.pk for lead in leads]).update(notified_at=timezone.now())
+        sent += len(leads)
@@ -0,0 +1,123 @@
+"""EXPLAIN QUERY PLAN for every query the tours views run.
+
+The audit runs against a scratch SQLite file filled by ``generate_catalog``
+with a fixed ``--scale`` and ``--seed``, so the plans do not depend on
+whatever the local database holds. Each named GET route served by
+``tours.views`` is requested through the test client (as an anonymous
+visitor and as a logged-in editor); every SELECT it executes is explained
+and full table scans / temporary B-tree sorts are reported.
+
+The baseline maps each accepted finding to the reason it is accepted.
+Findings missing from it fail the command, so CI catches plan regressions;
+``--update-baseline`` keeps the reasons of the findings still present.
+"""
+import json
+import logging
+import re
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+from tours.benchmarking import audited_routes, scratch_database
+from tours.routers import primary_only
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / "query_plan_baseline.json"
+
+# "SCAN t" без USING INDEX — полный проход по таблице
+FULL_SCAN_RE = re.compile(r"^SCAN \w+$")
+FROM_RE = re.compile(r'\bFROM "(\w+)"')
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_findings(plan):
+    findings = []
+    for detail in plan:
+        if "USE TEMP B-TREE" in detail:
+            findings.append(detail)
+        elif FULL_SCAN_RE.match(detail):
+            findings.append(detail)
+    return findings
+
+
+class Command(BaseCommand):
+    help = "Explain every query the views run; fail on full scans / temp sorts missing from the baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+        parser.add_argument("--scale", type=float, default=0.05, help="generate_catalog --scale of the audited data.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--update-baseline", action="store_true",
+            help="Accept the current findings and write them to the baseline file.",
+        )
+        parser.add_argument("--verbose-plans", action="store_true", help="Print every plan.")
+
+    def handle(self, *args, **options):
+        findings = {}
+        # 404/405 на POST-only маршрутах ожидаемы, не засоряем вывод
+        logging.getLogger("django.request").setLevel(logging.ERROR)
+        logging.getLogger("tours.requests").setLevel(logging.WARNING)
+        with scratch_database(), override_settings(
+            SQLITE_REPLICA_ENABLED=False, QUERY_STRICT_MODE=False, PROFILE_SAMPLE_RATE=0
+        ), primary_only():
+            call_command("generate_catalog", scale=options["scale"], seed=options["seed"], stdout=StringIO())
+            editor = get_user_model().objects.create_user(username="__query_plan_audit__")
+            for logged_in in (False, True):
+                client = Client()
+                if logged_in:
+                    client.force_login(editor)
+                for name, path in audited_routes():
+                    for sql, params in self._capture(client, path):
+                        plan = explain(sql, params)
+                        if options["verbose_plans"]:
+                            self.stdout.write(f"{name}: {sql}\n    " + "\n    ".join(plan))
+                        match = FROM_RE.search(sql)
+                        table = match.group(1) if match else "?"
+                        for detail in plan_findings(plan):
+                            findings.setdefault(f"{name}: {table}: {detail}", sql)
+
+        baseline_path = Path(options["baseline"])
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        if options["update_baseline"]:
+            accepted = {key: baseline.get(key, "") for key in sorted(findings)}
+            baseline_path.write_text(json.dumps(accepted, indent=2, ensure_ascii=False) + "\n")
+            self.stdout.write(f"Baseline written: {len(accepted)} accepted finding(s).")
+            for key, reason in accepted.items():
+                if not reason:
+                    self.stdout.write(self.style.WARNING(f"No reason given for {key}"))
+            return
+
+        new = sorted(set(findings) - set(baseline))
+        fixed = sorted(set(baseline) - set(findings))
+        for key in sorted(findings):
+            marker = "NEW " if key in new else "    "
+            self.stdout.write(f"{marker}{key}")
+        for key in fixed:
+            self.stdout.write(self.style.SUCCESS(f"GONE {key} (run with --update-baseline)"))
+        if new:
+            for key in new:
+                self.stderr.write(f"{key}\n    {findings[key]}")
+            raise CommandError(f"{len(new)} query plan regression(s) against {baseline_path.name}.")
+        self.stdout.write(self.style.SUCCESS(f"{len(findings)} finding(s), all in baseline."))
+
+    def _capture(self, client, path):
+        captured = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith("SELECT"):
+                captured.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            client.get(path)
+        return captured
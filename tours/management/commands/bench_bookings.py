@@ -0,0 +1,160 @@
+"""Contention benchmark of seat booking: hundreds of bookers, one departure.
+
+On a scratch SQLite file (WAL and the rest of ``SQLITE_PRAGMAS``)
+``--processes`` × ``--threads`` bookers wait for a common start signal and
+each books 1 to ``--max-seats`` seats of the same departure; a ``--repeat``
+share submits its idempotency key twice, like a double click. ``atomic``
+goes through ``tours.booking.book`` (conditional UPDATE); ``naive`` reads
+``seats_left`` and writes back the difference, as a plain form handler
+would. After each run the stored bookings are checked against the capacity
+and the seats left; an inconsistent ``atomic`` run fails the command.
+"""
+import multiprocessing
+import random
+import statistics
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, OperationalError, connections
+from django.db.models import Count, Sum
+from django.test import override_settings
+from django.utils import timezone
+
+from tours import booking
+from tours.benchmarking import scratch_database
+from tours.models import Booking, Departure, GroupTour
+
+
+def _naive_book(departure_id, seats, idempotency_key):
+    # Без транзакции и без условия в UPDATE: между чтением и записью успевают другие покупатели
+    if Booking.objects.filter(idempotency_key=idempotency_key).exists():
+        return False
+    left = Departure.objects.values_list("seats_left", flat=True).get(pk=departure_id)
+    if left < seats:
+        raise booking.BookingError("Not enough seats left on this departure.")
+    Departure.objects.filter(pk=departure_id).update(seats_left=left - seats)
+    Booking.objects.create(
+        departure_id=departure_id, seats=seats, idempotency_key=idempotency_key, name="Bench", email="bench@example.com"
+    )
+    return True
+
+
+def _booker(mode, departure_id, idempotency_key, seats, submits, start, results):
+    start.wait()
+    outcomes = []
+    for _ in range(submits):
+        started = time.perf_counter()
+        try:
+            if mode == "atomic":
+                _, created = booking.book(
+                    departure_id, seats, idempotency_key, name="Bench", email="bench@example.com"
+                )
+            else:
+                created = _naive_book(departure_id, seats, idempotency_key)
+            status = "booked" if created else "replayed"
+        except booking.BookingError:
+            status = "sold_out"
+        except (IntegrityError, OperationalError):
+            status = "errors"
+        outcomes.append((status, (time.perf_counter() - started) * 1000))
+    connections.close_all()
+    results.put(outcomes)
+
+
+def _process(mode, departure_id, bookers, start, results):
+    threads = [
+        threading.Thread(target=_booker, args=(mode, departure_id, key, seats, submits, start, results))
+        for key, seats, submits in bookers
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class Command(BaseCommand):
+    help = "Book seats of one departure from many processes and threads at once; check the seat counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument("--threads", type=int, default=100, help="Bookers per process.")
+        parser.add_argument("--capacity", type=int, default=300)
+        parser.add_argument("--max-seats", type=int, default=3, help="Seats per booking: 1 to this number.")
+        parser.add_argument("--repeat", type=float, default=0.2, help="Share of bookers that submit twice.")
+        parser.add_argument("--mode", choices=("both", "naive", "atomic"), default="both")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        modes = ("naive", "atomic") if options["mode"] == "both" else (options["mode"],)
+        self.stdout.write(
+            f"bookers={options['processes']}×{options['threads']} capacity={options['capacity']} "
+            f"max_seats={options['max_seats']} repeat={options['repeat']}"
+        )
+        failed = []
+        with scratch_database(), override_settings(SQLITE_REPLICA_ENABLED=False, QUERY_STRICT_MODE=False):
+            group_tour = GroupTour.objects.create(
+                title="Bench tour", short_description="", description="", group_size=options["capacity"]
+            )
+            for offset, mode in enumerate(modes, start=1):
+                departure = Departure.objects.create(
+                    group_tour=group_tour, starts_on=timezone.localdate() + timedelta(days=offset)
+                )
+                result = self._run(mode, departure.pk, options)
+                self.stdout.write(
+                    f"{mode:>7}: booked={result['booked']} replayed={result['replayed']} "
+                    f"sold_out={result['sold_out']} errors={result['errors']} "
+                    f"({result['per_s']:.0f} req/s, p50={result['p50']:.1f}ms p99={result['p99']:.1f}ms) | "
+                    f"stored bookings={result['bookings']} seats={result['seats']} "
+                    f"seats_left={result['seats_left']} of {options['capacity']} -> {result['verdict']}"
+                )
+                if mode == "atomic" and result["verdict"] != "consistent":
+                    failed.append(mode)
+        if failed:
+            raise CommandError("Seat counts do not add up under contention.")
+
+    def _run(self, mode, departure_id, options):
+        rng = random.Random(options["seed"])
+        plans = [
+            [
+                (f"{mode}-{process}-{thread}", rng.randint(1, options["max_seats"]), 2 if rng.random() < options["repeat"] else 1)
+                for thread in range(options["threads"])
+            ]
+            for process in range(options["processes"])
+        ]
+        # Дочерние процессы открывают свои соединения: унаследованное SQLite-соединение использовать нельзя
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        start, results = context.Event(), context.Queue()
+        processes = [
+            context.Process(target=_process, args=(mode, departure_id, bookers, start, results)) for bookers in plans
+        ]
+        for process in processes:
+            process.start()
+        time.sleep(0.5)  # все потоки успевают встать на ожидание старта
+        started = time.perf_counter()
+        start.set()
+        outcomes = [outcome for _ in range(options["processes"] * options["threads"]) for outcome in results.get()]
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+
+        counts = {status: 0 for status in ("booked", "replayed", "sold_out", "errors")}
+        for status, _ in outcomes:
+            counts[status] += 1
+        latencies = [latency for _, latency in outcomes]
+        stored = Booking.objects.filter(departure_id=departure_id).aggregate(bookings=Count("pk"), seats=Sum("seats"))
+        seats = stored["seats"] or 0
+        seats_left = Departure.objects.values_list("seats_left", flat=True).get(pk=departure_id)
+        consistent = seats + seats_left == options["capacity"] and stored["bookings"] == counts["booked"]
+        return {
+            **counts,
+            "per_s": len(outcomes) / elapsed,
+            "p50": statistics.median(latencies),
+            "p99": statistics.quantiles(latencies, n=100)[98] if len(latencies) > 1 else latencies[0],
+            "bookings": stored["bookings"],
+            "seats": seats,
+            "seats_left": seats_left,
+            "verdict": "consistent" if consistent else f"OFF BY {seats + seats_left - options['capacity']} seats",
+        }
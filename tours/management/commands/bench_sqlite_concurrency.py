@@ -0,0 +1,144 @@
+"""Concurrency benchmark: N reader threads against M writer threads on SQLite.
+
+Runs the same workload twice on a scratch database file — once with the
+stock settings (rollback journal, Django's default 5 s timeout) and once with
+``SQLITE_PRAGMAS`` — and reports read latency and lock errors for both.
+"""
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+BODY = "x" * 400
+
+
+def _connect(path, tuned):
+    conn = sqlite3.connect(path, timeout=20 if tuned else 5, isolation_level=None,
+                           check_same_thread=False)
+    if tuned:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+    else:
+        conn.execute("PRAGMA journal_mode = delete")
+    return conn
+
+
+def _prepare(path, rows, tuned):
+    conn = _connect(path, tuned)
+    conn.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, title TEXT, body TEXT, version INTEGER)")
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO item (title, body, version) VALUES (?, ?, 0)",
+        ((f"Item {i}", BODY) for i in range(rows)),
+    )
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+class Command(BaseCommand):
+    help = "Benchmark SQLite readers vs writers with default and tuned settings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per run.")
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument(
+            "--hold", type=float, default=0.02,
+            help="Seconds a writer keeps its transaction open (simulates a slow catalog save).",
+        )
+        parser.add_argument("--mode", choices=("both", "default", "tuned"), default="both")
+
+    def handle(self, *args, **options):
+        modes = ("default", "tuned") if options["mode"] == "both" else (options["mode"],)
+        self.stdout.write(
+            f"readers={options['readers']} writers={options['writers']} "
+            f"duration={options['duration']}s rows={options['rows']}"
+        )
+        for mode in modes:
+            with tempfile.TemporaryDirectory() as tmp:
+                result = self._run(Path(tmp) / "bench.sqlite3", mode == "tuned", options)
+            self.stdout.write(
+                f"{mode:>8}: reads={result['reads']} ({result['reads_per_s']:.0f}/s) "
+                f"p50={result['p50']:.2f}ms p99={result['p99']:.2f}ms max={result['max']:.2f}ms "
+                f"read_errors={result['read_errors']} writes={result['writes']} "
+                f"write_errors={result['write_errors']}"
+            )
+
+    def _run(self, path, tuned, options):
+        _prepare(str(path), options["rows"], tuned)
+        stop = threading.Event()
+        latencies, lock = [], threading.Lock()
+        counters = {"read_errors": 0, "writes": 0, "write_errors": 0}
+
+        def reader():
+            conn = _connect(str(path), tuned)
+            local = []
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    conn.execute(
+                        "SELECT count(*), max(version) FROM item WHERE id > ?",
+                        (len(local) % options["rows"],),
+                    ).fetchone()
+                except sqlite3.OperationalError:
+                    with lock:
+                        counters["read_errors"] += 1
+                    continue
+                local.append((time.perf_counter() - start) * 1000)
+            conn.close()
+            with lock:
+                latencies.extend(local)
+
+        def writer():
+            conn = _connect(str(path), tuned)
+            n = 0
+            while not stop.is_set():
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute(
+                        "UPDATE item SET version = version + 1 WHERE id BETWEEN ? AND ?",
+                        (n % options["rows"], n % options["rows"] + 200),
+                    )
+                    time.sleep(options["hold"])
+                    conn.execute("COMMIT")
+                    n += 1
+                except sqlite3.OperationalError:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    with lock:
+                        counters["write_errors"] += 1
+            with lock:
+                counters["writes"] += n
+            conn.close()
+
+        threads = [threading.Thread(target=reader) for _ in range(options["readers"])]
+        threads += [threading.Thread(target=writer) for _ in range(options["writers"])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options["duration"])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        return {
+            "reads": len(latencies),
+            "reads_per_s": len(latencies) / options["duration"],
+            "p50": statistics.median(latencies) if latencies else 0.0,
+            "p99": _percentile(latencies, 99),
+            "max": max(latencies, default=0.0),
+            **counters,
+        }
@@ -0,0 +1,144 @@
+"""Benchmark every tours view against generated catalogs of several sizes.
+
+For each ``--sizes`` scale a scratch SQLite file is filled by
+``generate_catalog`` and every named GET route (see
+``tours.benchmarking.audited_routes``) is requested through the test
+client: public pages anonymously, /catalog/ pages as a staff user. Median
+wall time, query count, response bytes and tracemalloc peak go to a JSON
+file. Against a baseline, an extra query or response bytes grown beyond
+``--threshold`` fail the command. Time and peak memory depend on the
+machine: they are only reported, unless ``--host-metrics`` is given and the
+baseline was recorded on this host.
+"""
+import json
+import logging
+import platform
+import time
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from tours.benchmarking import HOST_METRICS, audited_routes, compare, measure, scratch_database
+from tours.routers import primary_only
+
+DEFAULT_OUTPUT_DIR = Path(settings.BASE_DIR) / "var" / "bench"
+# Эталон хранится в репозитории рядом с query_plan_baseline.json; результаты прогонов — в var/
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / "bench_views_baseline.json"
+
+
+def _route_key(name, path):
+    _, _, query = path.partition("?")
+    return f"{name}?{query}" if query else name
+
+
+class Command(BaseCommand):
+    help = "Time, query count, bytes and peak memory of every view on generated datasets; compare to a baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default="0.05,0.25,1",
+            help="Comma-separated generate_catalog --scale values (1 is about 20k rows).",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Timed requests per view.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--only", help="Substring of the route names to run.")
+        parser.add_argument("--output", help="Result file (default: var/bench/views-<timestamp>.json).")
+        parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+        parser.add_argument(
+            "--update-baseline", action="store_true", help="Write this run as the new baseline.",
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=0.3,
+            help="Allowed relative growth of time / bytes / memory before a view counts as regressed.",
+        )
+        parser.add_argument(
+            "--host-metrics", action="store_true",
+            help="Also fail on time / memory growth; needs a baseline recorded on this host.",
+        )
+
+    def handle(self, *args, **options):
+        sizes = [size.strip() for size in options["sizes"].split(",") if size.strip()]
+        logging.getLogger("django.request").setLevel(logging.ERROR)
+        logging.getLogger("tours.requests").setLevel(logging.WARNING)
+
+        results = {}
+        with scratch_database() as directory, override_settings(
+            SQLITE_REPLICA_ENABLED=False,
+            QUERY_STRICT_MODE=False,
+            PROFILE_SAMPLE_RATE=0,
+            METRICS_DIR=Path(directory) / "metrics",
+        ), primary_only():
+            staff = get_user_model().objects.create_user(username="__bench__", is_staff=True)
+            for size in sizes:
+                results[size] = self._run_size(size, staff, options)
+
+        output = Path(options["output"] or DEFAULT_OUTPUT_DIR / f"views-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "repeat": options["repeat"],
+            "results": results,
+        }
+        output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+        self.stdout.write(f"Results written to {output}")
+
+        baseline_path = Path(options["baseline"])
+        if options["update_baseline"]:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+            return
+        if not baseline_path.exists():
+            self.stdout.write("No baseline to compare with (run with --update-baseline).")
+            return
+        baseline = json.loads(baseline_path.read_text())
+        regressions = compare(results, baseline["results"], options["threshold"])
+        drift = compare(results, baseline["results"], options["threshold"], HOST_METRICS)
+        if options["host_metrics"]:
+            if baseline.get("host") != platform.node():
+                raise CommandError(
+                    f"{baseline_path.name} was recorded on {baseline.get('host') or 'another host'}, "
+                    "regenerate it here with --update-baseline to compare time and memory."
+                )
+            regressions += drift
+        else:
+            # Время и память другой машины не повод падать: только показываем
+            for size, route, metric, old, new in drift:
+                self.stdout.write(f"scale {size} {route}: {metric} {old} -> {new} (not gated)")
+        for size, route, metric, old, new in regressions:
+            self.stderr.write(f"scale {size} {route}: {metric} {old} -> {new}")
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) against {baseline_path.name}.")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def _run_size(self, size, staff, options):
+        call_command("flush", interactive=False, verbosity=0)
+        staff.save()  # flush удалил и пользователя
+        call_command("generate_catalog", scale=float(size), seed=options["seed"], stdout=StringIO())
+
+        anonymous = Client()
+        editor = Client()
+        editor.force_login(staff)
+        measured = {}
+        self.stdout.write(f"scale {size}:")
+        self.stdout.write(f"  {'route':<48} {'status':>6} {'ms':>9} {'queries':>7} {'KiB':>9} {'peak KiB':>9}")
+        for name, path in audited_routes():
+            if options["only"] and options["only"] not in name:
+                continue
+            client = editor if path.startswith("/catalog/") else anonymous
+            row = measure(client, path, repeat=options["repeat"])
+            if row["status"] == 405:
+                continue  # POST-only действие
+            measured[_route_key(name, path)] = row
+            self.stdout.write(
+                f"  {_route_key(name, path):<48} {row['status']:>6} {row['time_ms']:>9.1f} "
+                f"{row['queries'] if row['queries'] is not None else '-':>7} "
+                f"{row['bytes'] / 1024:>9.1f} {row['peak_kb']:>9.1f}"
+            )
+        return measured
@@ -0,0 +1,19 @@
+"""Store the related posts of every blog post (see ``tours.related_posts``)."""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tours.related_posts import refresh
+from tours.replica import refresh_replica
+
+
+class Command(BaseCommand):
+    help = "Recompute related blog posts from the TF-IDF vectors of all active posts."
+
+    def handle(self, *args, **options):
+        stats = refresh()
+        self.stdout.write(
+            f"{stats['posts']} post(s), {stats['pairs']} related post(s) in {stats['seconds']:.1f}s."
+        )
+        # bulk_create не шлёт сигналов, поэтому реплику обновляем сами
+        if settings.SQLITE_REPLICA_ENABLED:
+            refresh_replica()
@@ -0,0 +1,23 @@
+"""Store the most similar tours of every tour (see ``tours.similarity``)."""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tours.replica import refresh_replica
+from tours.similarity import refresh
+
+
+class Command(BaseCommand):
+    help = "Refresh MinHash signatures and similar-tour lists of the tours changed since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Re-sign and re-rank every tour.")
+
+    def handle(self, *args, **options):
+        stats = refresh(full=options["full"])
+        self.stdout.write(
+            f"{stats['changed']} changed tour(s), {stats['signed']} signed, {stats['ranked']} list(s) ranked "
+            f"with {stats['pairs']} similar tour(s) in {stats['seconds']:.1f}s."
+        )
+        # bulk_create не шлёт сигналов, поэтому реплику обновляем сами
+        if settings.SQLITE_REPLICA_ENABLED and stats["ranked"]:
+            refresh_replica()
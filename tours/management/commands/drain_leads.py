@@ -0,0 +1,29 @@
+"""Move queued site requests into the database and notify about them (see ``tours.leads``)."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from tours import leads
+
+
+class Command(BaseCommand):
+    help = "Drain the lead journal into LeadContact / Lead in batches, then send the pending notifications."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, help="Entries per transaction (default: LEADS_DRAIN_BATCH).")
+        parser.add_argument("--loop", action="store_true", help="Keep draining until interrupted.")
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds between passes with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            created = leads.drain(options["batch"])
+            sent = leads.notify_pending(options["batch"])
+            if created or sent or not options["loop"]:
+                self.stdout.write(
+                    f"{created} new lead(s), {sent} notification(s) in {time.monotonic() - started:.2f}s; "
+                    f"{len(leads.get_journal())} entr(ies) left in the journal."
+                )
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,28 @@
+"""Write one catalog kind as JSONL or CSV (see ``tours.catalog_io``)."""
+import sys
+
+from django.core.management.base import BaseCommand
+
+from tours.catalog_io import EXPORT_BATCH_SIZE, FORMATS, KINDS, encode_records, export_records
+
+
+class Command(BaseCommand):
+    help = "Stream attractions, includes, tour days or group tours to a JSONL / CSV file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(KINDS))
+        parser.add_argument("--format", choices=FORMATS, default="jsonl")
+        parser.add_argument("--output", help="File to write (default: stdout).")
+        parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="Rows read per query.")
+
+    def handle(self, *args, **options):
+        records = export_records(options["kind"], batch_size=options["batch_size"])
+        chunks = encode_records(records, options["kind"], options["format"])
+        if not options["output"]:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+        # newline="": csv сам пишет \r\n, JSONL — \n
+        with open(options["output"], "w", encoding="utf-8", newline="") as handle:
+            handle.writelines(chunks)
+        self.stderr.write(f"{options['kind']} written to {options['output']}")
@@ -0,0 +1,303 @@
+"""Synthetic catalog for scale testing.
+
+Generates attractions, includes, tour days with their attractions / includes,
+group tours with itineraries and media rows, and blog posts. Attractions and
+tour days are geocoded around their city's centre, with a geohash. Rows are built
+in memory from a seeded RNG (same ``--seed`` and ``--scale`` — same catalog)
+and inserted with ``bulk_create``, one short transaction per batch, so
+``--scale 50`` (about a million rows) takes minutes. Images are a small set
+of Pillow placeholders written once and shared by all rows.
+"""
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tours.db import retry_on_locked
+from tours.models import (
+    Attraction,
+    BlogPost,
+    GroupTour,
+    GroupTourDay,
+    GroupTourMedia,
+    Include,
+    ToursDay,
+    ToursDayAttraction,
+    ToursDayInclude,
+)
+from tours.replica import refresh_replica
+
+# Строк каждой модели при --scale 1; связи считаются от них (примерно 20 тыс. строк всего)
+BASE_COUNTS = {
+    "includes": 40,
+    "attractions": 2000,
+    "tours_days": 2000,
+    "group_tours": 400,
+    "blog_posts": 200,
+}
+ATTRACTIONS_PER_DAY = (2, 5)
+INCLUDES_PER_DAY = (1, 4)
+DAYS_PER_TOUR = (3, 10)
+MEDIA_PER_TOUR = (0, 4)
+
+GENERATED_DIR = "catalog/generated"
+# Даты публикации — от фиксированных границ, а не от сегодня: тот же --seed даёт те же строки в любой день
+BLOG_FIRST_DAY = date(2020, 1, 1)
+BLOG_LAST_DAY = date(2025, 12, 31)
+
+# Центры городов: координаты строк разбросаны вокруг них на CITY_JITTER градусов
+CITY_CENTERS = {
+    "Москва": (55.7558, 37.6173),
+    "Санкт-Петербург": (59.9343, 30.3351),
+    "Казань": (55.7963, 49.1088),
+    "Нижний Новгород": (56.3269, 44.0059),
+    "Ярославль": (57.6261, 39.8845),
+    "Суздаль": (56.4197, 40.4493),
+    "Калининград": (54.7104, 20.4522),
+    "Сочи": (43.5855, 39.7231),
+    "Екатеринбург": (56.8389, 60.6057),
+    "Иркутск": (52.287, 104.305),
+    "Мурманск": (68.9585, 33.0827),
+    "Владивосток": (43.1155, 131.8855),
+    "Псков": (57.8194, 28.3318),
+    "Великий Новгород": (58.5213, 31.2755),
+    "Тверь": (56.8587, 35.9176),
+    "Кострома": (57.7677, 40.9264),
+    "Дербент": (42.0578, 48.2889),
+    "Петрозаводск": (61.7849, 34.3469),
+}
+CITIES = list(CITY_CENTERS)
+CITY_JITTER = 0.08  # ~9 км; по долготе градусов вдвое больше — на этих широтах примерно те же км
+PLACES = [
+    "Кремль", "Собор", "Монастырь", "Набережная", "Музей", "Парк", "Маяк", "Усадьба",
+    "Водопад", "Крепость", "Рынок", "Театр", "Смотровая площадка", "Заповедник", "Озеро",
+]
+ADJECTIVES = [
+    "Старый", "Северный", "Белый", "Речной", "Горный", "Тихий", "Купеческий", "Лесной",
+    "Исторический", "Каменный", "Южный", "Дальний",
+]
+STREETS = ["ул. Ленина", "пр. Мира", "ул. Набережная", "ул. Садовая", "пл. Соборная", "ул. Кремлёвская"]
+WORDS = (
+    "экскурсия маршрут прогулка история архитектура вид природа традиции кухня ремёсла "
+    "музей храм река берег лес гора город улица площадь мастер гид группа день вечер утро "
+    "закат рассвет остров тропа дорога деревня усадьба сад фестиваль ярмарка"
+).split()
+INCLUDE_ITEMS = [
+    "Трансфер", "Проживание", "Завтрак", "Обед", "Ужин", "Входные билеты", "Услуги гида",
+    "Страховка", "Сувенир", "Дегустация", "Прокат снаряжения", "Фотосессия",
+]
+DURATIONS = [Decimal(value) for value in ("1.00", "1.50", "2.00", "2.50", "3.00", "4.00", "6.00", "8.00")]
+COLORS = [(46, 94, 170), (214, 116, 54), (60, 140, 90), (150, 70, 140), (200, 170, 60), (70, 150, 160)]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _text(rng, words):
+    return " ".join(rng.choices(WORDS, k=words)).capitalize() + "."
+
+
+def _placeholder(kind, index, size):
+    """A gradient placeholder; written once per name, re-used on the next run."""
+    from PIL import Image, ImageDraw
+
+    name = f"{GENERATED_DIR}/{kind}-{index}.png"
+    if default_storage.exists(name):
+        return name
+    width, height = size
+    start = COLORS[index % len(COLORS)]
+    end = COLORS[(index + 1) % len(COLORS)]
+    image = Image.new("RGB", size)
+    draw = ImageDraw.Draw(image)
+    for y in range(height):
+        ratio = y / max(height - 1, 1)
+        draw.line([(0, y), (width, y)], fill=tuple(int(a + (b - a) * ratio) for a, b in zip(start, end)))
+    draw.text((width // 20, height // 20), f"{kind} {index}", fill=(255, 255, 255))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+class Command(BaseCommand):
+    help = "Generate a deterministic synthetic catalog with bulk inserts (--scale 50 is about 1M rows)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for BASE_COUNTS.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--batch-size", type=int, default=2000, help="Rows per INSERT transaction.")
+        parser.add_argument("--images", type=int, default=6, help="Distinct placeholder images.")
+        parser.add_argument("--archived-share", type=float, default=0.05)
+        parser.add_argument("--user", help="Username set as creator of the generated rows.")
+
+    def handle(self, *args, **options):
+        if options["scale"] <= 0:
+            raise CommandError("--scale must be positive.")
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.archived_share = options["archived_share"]
+        self.now = timezone.now()
+        self.user = None
+        if options["user"]:
+            try:
+                self.user = get_user_model().objects.get(username=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User {options['user']!r} does not exist.")
+        counts = {key: max(1, int(value * options["scale"])) for key, value in BASE_COUNTS.items()}
+
+        self.photos = [_placeholder("photo", i, (640, 400)) for i in range(options["images"])]
+        self.icons = [_placeholder("icon", i, (64, 64)) for i in range(options["images"])]
+
+        started = time.monotonic()
+        self.total = 0
+        include_ids = self._insert(Include, self._includes(counts["includes"]))
+        attraction_ids = self._insert(Attraction, self._attractions(counts["attractions"]))
+        day_ids = self._insert(ToursDay, self._tours_days(counts["tours_days"]))
+        self._insert(ToursDayAttraction, self._links(day_ids, attraction_ids, ATTRACTIONS_PER_DAY, "attraction"))
+        self._insert(ToursDayInclude, self._links(day_ids, include_ids, INCLUDES_PER_DAY, "include"))
+        tour_ids = self._insert(GroupTour, self._group_tours(counts["group_tours"]))
+        self._insert(GroupTourDay, self._itineraries(tour_ids, day_ids))
+        self._insert(GroupTourMedia, self._media(tour_ids))
+        self._insert(BlogPost, self._blog_posts(counts["blog_posts"]))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.total} rows in {elapsed:.1f}s ({self.total / max(elapsed, 1e-9):.0f} rows/s)."
+        ))
+        # bulk_create не шлёт post_save, поэтому реплику обновляем сами
+        if settings.SQLITE_REPLICA_ENABLED:
+            refresh_replica()
+            self.stdout.write("Replica refreshed.")
+
+    def _insert(self, model, rows):
+        """bulk_create ``rows`` batch by batch, one transaction each; returns the new pks."""
+        started = time.monotonic()
+        ids = []
+        for chunk in _chunks(rows, self.batch_size):
+            if hasattr(model, "refresh_derived_fields"):
+                for obj in chunk:
+                    obj.refresh_derived_fields()  # bulk_create не вызывает save()
+            retry_on_locked(model._base_manager.bulk_create)(chunk)
+            ids.extend(obj.pk for obj in chunk)
+        self.total += len(ids)
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"{model.__name__}: {len(ids)} rows in {elapsed:.1f}s")
+        return ids
+
+    def _location(self, city):
+        """Coordinates near the city centre; the geohash is derived in ``_insert``."""
+        latitude, longitude = CITY_CENTERS[city]
+        return {
+            "latitude": round(latitude + self.rng.uniform(-CITY_JITTER, CITY_JITTER), 6),
+            "longitude": round(longitude + self.rng.uniform(-CITY_JITTER, CITY_JITTER) * 2, 6),
+        }
+
+    def _archivable(self):
+        if self.rng.random() < self.archived_share:
+            return {"is_archived": True, "archived_at": self.now}
+        return {}
+
+    def _maybe(self, choices, share):
+        return self.rng.choice(choices) if self.rng.random() < share else None
+
+    def _includes(self, count):
+        rng = self.rng
+        for i in range(count):
+            yield Include(
+                description=f"{rng.choice(INCLUDE_ITEMS)} #{i + 1}: {_text(rng, 8)}",
+                icon_path=rng.choice(self.icons),
+                **self._archivable(),
+            )
+
+    def _attractions(self, count):
+        rng = self.rng
+        for i in range(count):
+            city = rng.choice(CITIES)
+            yield Attraction(
+                title=f"{rng.choice(ADJECTIVES)} {rng.choice(PLACES).lower()} #{i + 1}",
+                description=_text(rng, rng.randint(30, 120)),
+                city=city,
+                address=f"{city}, {rng.choice(STREETS)}, {rng.randint(1, 150)}",
+                **self._location(city),
+                duration_hours=rng.choice(DURATIONS),
+                photo=self._maybe(self.photos, 0.7),
+                user=self.user,
+                **self._archivable(),
+            )
+
+    def _tours_days(self, count):
+        rng = self.rng
+        for i in range(count):
+            city = rng.choice(CITIES)
+            yield ToursDay(
+                title=f"{city}: {rng.choice(WORDS)} и {rng.choice(WORDS)} #{i + 1}",
+                description=_text(rng, rng.randint(40, 160)),
+                city=city,
+                address=f"{city}, {rng.choice(STREETS)}, {rng.randint(1, 150)}",
+                **self._location(city),
+                duration_hours=rng.choice(DURATIONS),
+                photo=self._maybe(self.photos, 0.7),
+                user=self.user,
+                **self._archivable(),
+            )
+
+    def _links(self, day_ids, target_ids, per_day, field):
+        model = ToursDayAttraction if field == "attraction" else ToursDayInclude
+        low, high = per_day
+        for day_id in day_ids:
+            picked = self.rng.sample(target_ids, min(len(target_ids), self.rng.randint(low, high)))
+            for position, target_id in enumerate(picked, start=1):
+                yield model(tours_day_id=day_id, position=position, **{f"{field}_id": target_id})
+
+    def _group_tours(self, count):
+        rng = self.rng
+        for i in range(count):
+            yield GroupTour(
+                title=f"{rng.choice(ADJECTIVES)} маршрут: {rng.choice(CITIES)} #{i + 1}",
+                short_description=_text(rng, 10)[:255],
+                description=_text(rng, rng.randint(60, 240)),
+                group_size=rng.randint(4, 30),
+                user=self.user,
+                **self._archivable(),
+            )
+
+    def _itineraries(self, tour_ids, day_ids):
+        low, high = DAYS_PER_TOUR
+        for tour_id in tour_ids:
+            picked = self.rng.sample(day_ids, min(len(day_ids), self.rng.randint(low, high)))
+            for day_number, day_id in enumerate(picked, start=1):
+                yield GroupTourDay(group_tour_id=tour_id, tours_day_id=day_id, day_number=day_number)
+
+    def _media(self, tour_ids):
+        low, high = MEDIA_PER_TOUR
+        for tour_id in tour_ids:
+            for _ in range(self.rng.randint(low, high)):
+                yield GroupTourMedia(
+                    group_tour_id=tour_id,
+                    file=self.rng.choice(self.photos),
+                    media_type=GroupTourMedia.IMAGE,
+                )
+
+    def _blog_posts(self, count):
+        rng = self.rng
+        span = (BLOG_LAST_DAY - BLOG_FIRST_DAY).days
+        for i in range(count):
+            yield BlogPost(
+                title=f"{rng.choice(ADJECTIVES)} {rng.choice(CITIES)}: {rng.choice(WORDS)} #{i + 1}",
+                body="\n\n".join(_text(rng, rng.randint(40, 120)) for _ in range(rng.randint(3, 8))),
+                published_at=BLOG_FIRST_DAY + timedelta(days=rng.randint(0, span)),
+                image=self._maybe(self.photos, 0.8),
+                user=self.user,
+                **self._archivable(),
+            )
@@ -0,0 +1,39 @@
+"""Fill coordinates of attractions and tour days (see ``tours.geocoding``)."""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tours.geocoding import GEOCODED_MODELS, geocode_missing, get_geocoder
+from tours.replica import refresh_replica
+
+MODEL_NAMES = {model._meta.model_name: model for model in GEOCODED_MODELS}
+
+
+class Command(BaseCommand):
+    help = "Geocode catalog rows without coordinates through settings.GEOCODER and the local cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model", action="append", choices=sorted(MODEL_NAMES), help="Limit to these models (repeatable).",
+        )
+        parser.add_argument("--batch-size", type=int, default=100, help="Rows per update transaction.")
+
+    def handle(self, *args, **options):
+        models = [MODEL_NAMES[name] for name in options["model"]] if options["model"] else GEOCODED_MODELS
+        geocoder = get_geocoder()
+        changed = 0
+        for model in models:
+            started = time.monotonic()
+            located = missing = 0
+            for done, absent in geocode_missing(model, options["batch_size"], geocoder):
+                located += done
+                missing += absent
+            changed += located
+            self.stdout.write(
+                f"{model._meta.model_name}: {located} located, {missing} not found "
+                f"({geocoder.provider}) in {time.monotonic() - started:.1f}s."
+            )
+        # bulk_update не шлёт сигналов, поэтому реплику обновляем сами
+        if settings.SQLITE_REPLICA_ENABLED and changed:
+            refresh_replica()
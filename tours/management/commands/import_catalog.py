@@ -0,0 +1,54 @@
+"""Upsert one catalog kind from a JSONL or CSV file (see ``tours.catalog_io``).
+
+Import in dependency order — includes and attractions, then tours_days,
+then group_tours — so references resolve.
+"""
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tours.catalog_io import FORMATS, IMPORT_BATCH_SIZE, KINDS, import_records, read_records
+from tours.replica import refresh_replica
+
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = "Import attractions, includes, tour days or group tours from JSONL / CSV, upserting by natural key."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(KINDS))
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=FORMATS, help="Default: from the file extension.")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Rows per transaction.")
+        parser.add_argument(
+            "--strict", action="store_true", help="Exit with an error when any row was skipped.",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        fmt = options["format"] or path.suffix.lstrip(".").lower()
+        if fmt not in FORMATS:
+            raise CommandError(f"Cannot tell the format of {path.name}; pass --format.")
+
+        started = time.monotonic()
+        with open(path, encoding="utf-8-sig", newline="") as handle:
+            result = import_records(
+                options["kind"], read_records(handle, options["kind"], fmt), batch_size=options["batch_size"]
+            )
+        elapsed = time.monotonic() - started
+
+        for number, message in result.errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(f"line {number}: {message}")
+        if result.skipped > MAX_REPORTED_ERRORS:
+            self.stderr.write(f"... and {result.skipped - MAX_REPORTED_ERRORS} more")
+        self.stdout.write(
+            f"{result.created} created, {result.updated} updated, {result.skipped} skipped in {elapsed:.1f}s."
+        )
+        # bulk_create / bulk_update не шлют сигналов, поэтому реплику обновляем сами
+        if settings.SQLITE_REPLICA_ENABLED and result.created + result.updated:
+            refresh_replica()
+        if options["strict"] and result.skipped:
+            raise CommandError(f"{result.skipped} row(s) skipped.")
@@ -0,0 +1,54 @@
+"""Delete catalog rows archived longer than the retention period (see ``tours.retention``)."""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tours.retention import RETENTION_MODELS, purge, report, retention_days
+
+MODEL_NAMES = {model._meta.model_name: model for model in RETENTION_MODELS}
+
+
+class Command(BaseCommand):
+    help = "Purge long-archived catalog rows in small batches (CATALOG_RETENTION_DAYS per model)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted.")
+        parser.add_argument(
+            "--model", action="append", choices=sorted(MODEL_NAMES), help="Limit to these models (repeatable).",
+        )
+        parser.add_argument("--days", type=int, help="Override the retention period of every selected model.")
+        parser.add_argument("--batch-size", type=int, default=200, help="Rows per delete transaction.")
+        parser.add_argument("--pause", type=float, default=0.05, help="Seconds to sleep between batches.")
+        parser.add_argument(
+            "--no-archive-copy", action="store_true",
+            help="Do not append purged rows to CATALOG_RETENTION_DIR/<model>-<date>.jsonl.",
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] is not None and options["days"] < 0:
+            raise CommandError("--days must not be negative.")
+        models = [MODEL_NAMES[name] for name in options["model"]] if options["model"] else RETENTION_MODELS
+        archive_dir = None if options["no_archive_copy"] else settings.CATALOG_RETENTION_DIR
+
+        for model in models:
+            name = model._meta.model_name
+            days = options["days"] if options["days"] is not None else retention_days(model)
+            if days is None:
+                self.stdout.write(f"{name}: kept forever (no retention period).")
+                continue
+            if options["dry_run"]:
+                stats = report(model, days)
+                oldest = f", oldest archived {stats['oldest']:%Y-%m-%d}" if stats["oldest"] else ""
+                self.stdout.write(
+                    f"{name}: {stats['purge']} to purge after {days} days, "
+                    f"{stats['in_use']} kept (used by active records){oldest}."
+                )
+                continue
+            started = time.monotonic()
+            deleted, total = purge(
+                model, days, batch_size=options["batch_size"], pause=options["pause"], archive_dir=archive_dir,
+            )
+            self.stdout.write(
+                f"{name}: {deleted} purged ({total} rows with links) in {time.monotonic() - started:.1f}s."
+            )
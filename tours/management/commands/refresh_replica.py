@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tours.replica import refresh_replica, replication_lag
+
+
+class Command(BaseCommand):
+    help = "Copy db.sqlite3 into the read-only replica (once, or periodically with --interval)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=0,
+            help="Keep running and refresh every N seconds (for a scheduler-less deployment).",
+        )
+        parser.add_argument("--pages", type=int, default=1024, help="Pages copied per backup step.")
+
+    def handle(self, *args, **options):
+        while True:
+            elapsed = refresh_replica(pages=options["pages"])
+            self.stdout.write(f"Replica refreshed in {elapsed:.3f}s, lag={replication_lag()}")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
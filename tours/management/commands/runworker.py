@@ -0,0 +1,80 @@
+"""Run background jobs (see ``tours.jobs``) in one or more worker processes.
+
+The parent syncs ``JOB_SCHEDULE`` into the database, then forks
+``--processes`` workers and restarts any that dies. SIGTERM or Ctrl-C stops
+them gracefully: each finishes its current job first.
+"""
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from tours import jobs
+
+
+def _stop_on_signals(stop):
+    def handler(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+
+
+def _worker(poll, burst):
+    # Соединения родителя не наследуем: у каждого процесса своё
+    connections.close_all()
+    stop = threading.Event()
+    _stop_on_signals(stop)
+    jobs.work(jobs.worker_name(), stop, poll=poll, burst=burst)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Claim and run queued jobs, enqueue scheduled ones; stop gracefully on SIGTERM / Ctrl-C."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, help="Worker processes (default: JOB_WORKER_PROCESSES).")
+        parser.add_argument("--poll", type=float, help="Seconds between polls of an empty queue.")
+        parser.add_argument("--burst", action="store_true", help="Exit once no job is due.")
+
+    def handle(self, *args, **options):
+        processes = options["processes"] or settings.JOB_WORKER_PROCESSES
+        if processes < 1:
+            raise CommandError("--processes must be at least 1.")
+        poll, burst = options["poll"], options["burst"]
+        jobs.sync_schedules()
+        self.stdout.write(f"{processes} worker(s), {len(settings.JOB_SCHEDULE)} schedule(s).")
+
+        if processes == 1:
+            stop = threading.Event()
+            _stop_on_signals(stop)
+            ran = jobs.work(jobs.worker_name(), stop, poll=poll, burst=burst)
+            self.stdout.write(f"Stopped after {ran} job(s).")
+            return
+
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        stop = threading.Event()
+        _stop_on_signals(stop)
+        workers = [self._spawn(context, poll, burst) for _ in range(processes)]
+        while workers and not stop.is_set():
+            stop.wait(1)
+            alive = [worker for worker in workers if worker.is_alive()]
+            if not burst:
+                for worker in set(workers) - set(alive):
+                    self.stderr.write(f"Worker {worker.pid} exited with {worker.exitcode}, restarting.")
+                    alive.append(self._spawn(context, poll, burst))
+            workers = alive
+        for worker in workers:
+            worker.terminate()  # SIGTERM: текущая задача доделывается
+        for worker in workers:
+            worker.join()
+        self.stdout.write("Stopped.")
+
+    def _spawn(self, context, poll, burst):
+        worker = context.Process(target=_worker, args=(poll, burst))
+        worker.start()
+        return worker
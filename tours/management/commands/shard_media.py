@@ -0,0 +1,159 @@
+"""Move existing uploads into hash-sharded directories (see ``tours.storage``).
+
+Per batch: files are hard-linked (copied on storages without local paths)
+to their sharded name, the rows are rewritten in one short transaction, the
+replica is refreshed, and only then are the old names removed, so a page
+rendered from the primary or from the replica finds its file at every
+moment. Old names waiting for removal are listed in a journal; a run
+interrupted anywhere is resumed by running the command again.
+"""
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tours.db import retry_on_locked
+from tours.models import Attraction, BlogPost, GroupTour, GroupTourMedia, ToursDay
+from tours.replica import refresh_replica
+from tours.storage import is_sharded, shard_name
+
+FIELDS = (
+    (Attraction, "photo"),
+    (ToursDay, "photo"),
+    (GroupTourMedia, "file"),
+    (BlogPost, "image"),
+)
+JOURNAL = Path(settings.BASE_DIR) / "var" / "shard_media.journal"
+
+
+def _referenced(names):
+    """Which of ``names`` some row still points at."""
+    found = set()
+    for model, field in FIELDS:
+        found.update(model._base_manager.filter(**{f"{field}__in": names}).values_list(field, flat=True))
+    return found
+
+
+def _link(old, new):
+    """Make the file at ``old`` also available as ``new``; returns the name actually used."""
+    try:
+        old_path = default_storage.path(old)
+    except NotImplementedError:
+        # Хранилище без локальных путей: копия через API хранилища
+        with default_storage.open(old) as handle:
+            return default_storage.save(new, handle)
+    if default_storage.exists(new) and not os.path.samefile(old_path, default_storage.path(new)):
+        new = default_storage.get_available_name(new)  # под этим именем уже другой файл
+    new_path = default_storage.path(new)
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    if not os.path.exists(new_path):
+        os.link(old_path, new_path)
+    return new
+
+
+@retry_on_locked
+def _rewrite(model, field, updates):
+    """Point rows at their new names; the record (or the tour of a media row) counts as changed."""
+    now = timezone.now()
+    objects = [model(pk=pk, **{field: name}) for pk, name in updates]
+    fields = [field]
+    if model is GroupTourMedia:
+        tour_ids = model.objects.filter(pk__in=[pk for pk, _ in updates]).values_list("group_tour_id", flat=True)
+        GroupTour.all_objects.filter(pk__in=set(tour_ids)).update(updated_at=now)
+    else:
+        for obj in objects:
+            obj.updated_at = now
+        fields.append("updated_at")
+    model._base_manager.bulk_update(objects, fields)
+
+
+class Command(BaseCommand):
+    help = "Move uploaded catalog files into <prefix>/ab/cd/<name> directories and rewrite the file fields."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows rewritten per transaction.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count files still to move.")
+
+    def handle(self, *args, **options):
+        if not options["dry_run"]:
+            self._finish_journal()
+        for model, field in FIELDS:
+            prefix = model._meta.get_field(field).upload_to.prefix
+            label = f"{model.__name__}.{field}"
+            if options["dry_run"]:
+                pending = sum(1 for _, name in self._rows(model, field, prefix) if not is_sharded(prefix, name))
+                self.stdout.write(f"{label}: {pending} row(s) with files to move.")
+                continue
+            started = time.monotonic()
+            moved, missing = self._shard(model, field, prefix, options["batch_size"])
+            self.stdout.write(
+                f"{label}: {moved} moved, {missing} missing on disk in {time.monotonic() - started:.1f}s."
+            )
+
+    def _rows(self, model, field, prefix, batch_size=2000):
+        """(pk, name) of rows with a file under ``prefix``, walking the table by pk."""
+        last_pk = 0
+        while True:
+            rows = list(
+                model._base_manager.filter(pk__gt=last_pk, **{f"{field}__startswith": prefix})
+                .order_by("pk")
+                .values_list("pk", field)[:batch_size]
+            )
+            if not rows:
+                return
+            yield from rows
+            last_pk = rows[-1][0]
+
+    def _shard(self, model, field, prefix, batch_size):
+        moved = missing = 0
+        batch = []
+        for pk, name in self._rows(model, field, prefix, batch_size):
+            if is_sharded(prefix, name):
+                continue
+            batch.append((pk, name))
+            if len(batch) >= batch_size:
+                done, absent = self._move_batch(model, field, prefix, batch)
+                moved, missing, batch = moved + done, missing + absent, []
+        if batch:
+            done, absent = self._move_batch(model, field, prefix, batch)
+            moved, missing = moved + done, missing + absent
+        return moved, missing
+
+    def _move_batch(self, model, field, prefix, batch):
+        targets = {}
+        missing = 0
+        for _, name in batch:
+            if name in targets:
+                continue
+            if not default_storage.exists(name):
+                missing += 1
+                self.stderr.write(f"missing: {name}")
+                continue
+            targets[name] = _link(name, shard_name(prefix, name))
+        if not targets:
+            return 0, missing
+
+        # Журнал пишется до перезаписи строк: после сбоя старые имена удалит следующий запуск
+        JOURNAL.parent.mkdir(parents=True, exist_ok=True)
+        with open(JOURNAL, "a", encoding="utf-8") as handle:
+            handle.writelines(f"{name}\n" for name in targets)
+        _rewrite(model, field, [(pk, targets[name]) for pk, name in batch if name in targets])
+        self._finish_journal()
+        return len(targets), missing
+
+    def _finish_journal(self):
+        """Delete old names from the journal that no row refers to any more, then clear it."""
+        if not JOURNAL.exists():
+            return
+        names = [line for line in JOURNAL.read_text(encoding="utf-8").splitlines() if line]
+        if names and settings.SQLITE_REPLICA_ENABLED:
+            # Реплика должна увидеть новые имена раньше, чем пропадут старые файлы
+            refresh_replica()
+        referenced = _referenced(names) if names else set()
+        for name in set(names) - referenced:
+            default_storage.delete(name)
+        JOURNAL.unlink()
@@ -0,0 +1,317 @@
+"""Prometheus-style metrics shared by all worker processes.
+
+Every process appends its samples to its own memory-mapped file in
+``METRICS_DIR`` (no cross-process locking at all, and inside a process one
+uncontended lock around a float add). ``/metrics`` reads all files and sums
+them, so counters and histograms aggregate over every worker, including the
+ones that have already exited: ``/metrics`` folds the file of an exited
+process into ``metrics-exited.db`` and removes it, so totals stay and the
+directory does not grow with every restarted worker.
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+_HEADER = struct.Struct("<Q")  # занятая длина файла
+_KEY_LEN = struct.Struct("<I")
+_VALUE = struct.Struct("<d")
+_INITIAL_SIZE = 64 * 1024
+EXITED_FILE = "metrics-exited.db"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _padded(length):
+    return (length + 7) & ~7
+
+
+class MmapValues:
+    """key -> float64 slots in one process' file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a+b")
+        if os.path.getsize(self.path) < _INITIAL_SIZE:
+            self._file.truncate(_INITIAL_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        self._offsets = {key: offset for key, offset, _ in _read_entries(self._map, self._used)}
+
+    def _grow(self, needed):
+        size = len(self._map)
+        while size < needed:
+            size *= 2
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def _slot(self, key):
+        offset = self._offsets.get(key)
+        if offset is not None:
+            return offset
+        encoded = key.encode("utf-8")
+        entry_size = _KEY_LEN.size + _padded(len(encoded)) + _VALUE.size
+        if self._used + entry_size > len(self._map):
+            self._grow(self._used + entry_size)
+        position = self._used
+        _KEY_LEN.pack_into(self._map, position, len(encoded))
+        self._map[position + _KEY_LEN.size:position + _KEY_LEN.size + len(encoded)] = encoded
+        offset = position + _KEY_LEN.size + _padded(len(encoded))
+        _VALUE.pack_into(self._map, offset, 0.0)
+        self._used += entry_size
+        # Длину публикуем последней: читатель никогда не видит недописанную запись
+        _HEADER.pack_into(self._map, 0, self._used)
+        self._offsets[key] = offset
+        return offset
+
+    def add(self, key, amount):
+        offset = self._slot(key)
+        value = _VALUE.unpack_from(self._map, offset)[0]
+        _VALUE.pack_into(self._map, offset, value + amount)
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+def _read_entries(buffer, used):
+    position = _HEADER.size
+    while position < used:
+        (length,) = _KEY_LEN.unpack_from(buffer, position)
+        key = bytes(buffer[position + _KEY_LEN.size:position + _KEY_LEN.size + length]).decode("utf-8")
+        offset = position + _KEY_LEN.size + _padded(length)
+        yield key, offset, _VALUE.unpack_from(buffer, offset)[0]
+        position = offset + _VALUE.size
+
+
+_lock = threading.Lock()
+_store = None
+_store_pid = None
+
+
+def _values():
+    """This process' store; reopened after fork so children never share a file."""
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store is None or _store_pid != pid:
+        _store = MmapValues(Path(settings.METRICS_DIR) / f"metrics-{pid}.db")
+        _store_pid = pid
+    return _store
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())], ensure_ascii=False)
+
+
+def inc(name, labels, amount=1.0):
+    with _lock:
+        _values().add(_key(name, labels), amount)
+
+
+def observe(name, labels, value, buckets):
+    """Histogram observation: cumulative ``_bucket`` counters plus ``_sum`` / ``_count``."""
+    with _lock:
+        store = _values()
+        for bound in buckets:
+            # Пустые корзины тоже заводим: Prometheus ждёт полный набор le
+            store.add(_key(f"{name}_bucket", {**labels, "le": repr(float(bound))}), 1.0 if value <= bound else 0.0)
+        store.add(_key(f"{name}_bucket", {**labels, "le": "+Inf"}), 1.0)
+        store.add(_key(f"{name}_sum", labels), value)
+        store.add(_key(f"{name}_count", labels), 1.0)
+
+
+def record_cache(cache, hit):
+    inc("potours_cache_requests_total", {"cache": cache, "result": "hit" if hit else "miss"})
+
+
+def record_request(view, status, duration, size, query_count, sql_time):
+    labels = {"view": view}
+    inc("potours_http_requests_total", {"view": view, "status": str(status)})
+    observe("potours_http_request_duration_seconds", labels, duration, LATENCY_BUCKETS)
+    if size is not None:
+        observe("potours_http_response_size_bytes", labels, size, SIZE_BUCKETS)
+    inc("potours_db_queries_total", labels, query_count)
+    inc("potours_db_query_seconds_total", labels, sql_time)
+
+
+def _file_entries(path):
+    with open(path, "rb") as handle:
+        data = handle.read()
+    if len(data) < _HEADER.size:
+        return []
+    return [(key, value) for key, _, value in _read_entries(data, min(_HEADER.unpack_from(data, 0)[0], len(data)))]
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def prune_exited():
+    """Fold the files of exited processes into ``EXITED_FILE`` and delete them; returns how many."""
+    directory = Path(settings.METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    pruned = 0
+    # Под файловой блокировкой: два параллельных /metrics не перенесут один файл дважды
+    with open(directory / ".prune.lock", "a+b") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        exited = None
+        for path in directory.glob("metrics-*.db"):
+            pid = path.stem.removeprefix("metrics-")
+            if not pid.isdigit() or _alive(int(pid)):
+                continue
+            exited = exited or MmapValues(directory / EXITED_FILE)
+            for key, value in _file_entries(path):
+                exited.add(key, value)
+            path.unlink()
+            pruned += 1
+        if exited is not None:
+            exited.close()
+    return pruned
+
+
+def collect():
+    """Sum the samples of every process file: {(name, labels tuple): value}."""
+    totals = {}
+    for path in sorted(Path(settings.METRICS_DIR).glob("metrics-*.db")):
+        for key, value in _file_entries(path):
+            name, labels = json.loads(key)
+            sample = (name, tuple(tuple(pair) for pair in labels))
+            totals[sample] = totals.get(sample, 0.0) + value
+    return totals
+
+
+def _bucket_quantile(quantile, buckets):
+    """Estimate a quantile from cumulative (upper bound, count) pairs, as histogram_quantile() does."""
+    total = buckets[-1][1]
+    if not total:
+        return None
+    rank = quantile * total
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+TYPES = {
+    "potours_http_requests_total": ("counter", "Responses per resolved URL name and status."),
+    "potours_http_request_duration_seconds": ("histogram", "Request latency per URL name."),
+    "potours_http_response_size_bytes": ("histogram", "Response body size per URL name."),
+    "potours_db_queries_total": ("counter", "SQL queries executed per URL name."),
+    "potours_db_query_seconds_total": ("counter", "Time spent in SQL per URL name."),
+    "potours_cache_requests_total": ("counter", "Cache lookups by result."),
+}
+
+
+def render(extra_gauges=()):
+    """Prometheus text exposition of all processes' metrics.
+
+    ``extra_gauges`` are (name, help, labels, value) computed at scrape time.
+    """
+    samples = collect()
+    families = {}
+    for (name, labels), value in samples.items():
+        family = name
+        for suffix in ("_bucket", "_sum", "_count"):
+            if name.endswith(suffix) and name[: -len(suffix)] in TYPES:
+                family = name[: -len(suffix)]
+        families.setdefault(family, []).append((name, labels, value))
+
+    lines = []
+    for family in sorted(families):
+        kind, help_text = TYPES.get(family, ("untyped", ""))
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        for name, labels, value in sorted(families[family], key=_sample_order):
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+    gauges = list(extra_gauges) + _latency_quantiles(samples) + _cache_ratios(samples)
+    seen = set()
+    for name, help_text, labels, value in gauges:
+        if name not in seen:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(sorted(labels.items()))} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def _sample_order(sample):
+    name, labels, _ = sample
+    le = dict(labels).get("le")
+    bound = float("inf") if le in (None, "+Inf") else float(le)
+    return name, tuple(pair for pair in labels if pair[0] != "le"), bound
+
+
+def _latency_quantiles(samples):
+    per_view = {}
+    for (name, labels), value in samples.items():
+        if name != "potours_http_request_duration_seconds_bucket":
+            continue
+        labels = dict(labels)
+        bound = float("inf") if labels["le"] == "+Inf" else float(labels["le"])
+        per_view.setdefault(labels["view"], []).append((bound, value))
+    gauges = []
+    for view, buckets in sorted(per_view.items()):
+        buckets.sort()
+        for quantile in QUANTILES:
+            estimate = _bucket_quantile(quantile, buckets)
+            if estimate is not None:
+                gauges.append(
+                    (
+                        "potours_http_request_duration_seconds_estimate",
+                        "Latency quantile estimated from the histogram buckets.",
+                        {"view": view, "quantile": str(quantile)},
+                        estimate,
+                    )
+                )
+    return gauges
+
+
+def _cache_ratios(samples):
+    counts = {}
+    for (name, labels), value in samples.items():
+        if name == "potours_cache_requests_total":
+            labels = dict(labels)
+            counts.setdefault(labels["cache"], {}).setdefault(labels["result"], 0.0)
+            counts[labels["cache"]][labels["result"]] += value
+    gauges = []
+    for cache, results in sorted(counts.items()):
+        lookups = results.get("hit", 0.0) + results.get("miss", 0.0)
+        if lookups:
+            gauges.append(
+                ("potours_cache_hit_ratio", "Share of cache lookups that hit.", {"cache": cache},
+                 results.get("hit", 0.0) / lookups)
+            )
+    return gauges
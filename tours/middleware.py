@@ -0,0 +1,238 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics, profiling
+from .instrumentation import RepeatedQueryError, collect, stop_collecting
+from .routers import PRIMARY, REPLICA, read_from
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+request_logger = logging.getLogger("tours.requests")
+
+
+class HybridMiddleware:
+    """Base for middleware that works in both the WSGI and the ASGI chain.
+
+    Subclasses implement ``__call__`` for sync and ``__acall__`` for async
+    requests. Without it Django would wrap every sync-only middleware of an
+    async chain in a thread hop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @property
+    def is_async(self):
+        return iscoroutinefunction(self)
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """Latency, response size, status and query count per resolved URL name."""
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - start)
+        return response
+
+    def _record(self, request, response, duration):
+        match = getattr(request, "resolver_match", None)
+        view = (match.url_name or match.view_name) if match else "unresolved"
+        stats = getattr(request, "query_stats", None)
+        size = None if response.streaming else len(response.content)
+        metrics.record_request(
+            view=view,
+            status=response.status_code,
+            duration=duration,
+            size=size,
+            query_count=stats.query_count if stats else 0,
+            sql_time=stats.sql_time if stats else 0.0,
+        )
+
+
+class QueryInstrumentationMiddleware(HybridMiddleware):
+    """Query count, SQL / template time and repeated queries for every request.
+
+    Results go to the ``Server-Timing`` header and one JSON line on the
+    ``tours.requests`` logger; they also stay on ``request.query_stats``.
+    With ``QUERY_STRICT_MODE`` a query shape repeated more than
+    ``QUERY_REPEAT_LIMIT`` times raises ``RepeatedQueryError`` (N+1 guard
+    for tests and local runs).
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token = collect()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_collecting(token)
+        return self._finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats, token = collect()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_collecting(token)
+        return self._finish(request, response, stats, time.perf_counter() - start)
+
+    def _finish(self, request, response, stats, total):
+        request.query_stats = stats
+
+        response["Server-Timing"] = stats.server_timing(total)
+        match = getattr(request, "resolver_match", None)
+        request_logger.info(
+            json.dumps(
+                {
+                    "path": request.path,
+                    "view": match.view_name if match else None,
+                    "status": response.status_code,
+                    "total_ms": round(total * 1000, 1),
+                    "queries": stats.query_count,
+                    "sql_ms": round(stats.sql_time * 1000, 1),
+                    "template_ms": round(stats.template_time * 1000, 1),
+                    "duplicate_queries": stats.duplicate_count(),
+                },
+                ensure_ascii=False,
+            )
+        )
+
+        if settings.QUERY_STRICT_MODE:
+            repeated = stats.repeated(settings.QUERY_REPEAT_LIMIT)
+            if repeated:
+                shape, count = repeated[0]
+                raise RepeatedQueryError(
+                    f"{request.path}: query executed {count} times "
+                    f"(limit {settings.QUERY_REPEAT_LIMIT}): {shape}"
+                )
+        return response
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """Public read-only requests read the catalog from the replica.
+
+    Writes, authenticated users (editors must see their own changes) and
+    everything under /catalog/ keep reading from the primary.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        alias = PRIMARY
+        if self._may_use_replica(request):
+            user = getattr(request, "user", None)
+            alias = PRIMARY if user is not None and user.is_authenticated else REPLICA
+        with read_from(alias):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        alias = PRIMARY
+        if self._may_use_replica(request):
+            user = await request.auser() if hasattr(request, "auser") else None
+            alias = PRIMARY if user is not None and user.is_authenticated else REPLICA
+        with read_from(alias):
+            return await self.get_response(request)
+
+    def _may_use_replica(self, request):
+        """Checks that do not need the user (loading it costs a session lookup)."""
+        if not settings.SQLITE_REPLICA_ENABLED:
+            return False
+        if request.method not in SAFE_METHODS:
+            return False
+        return not request.path.startswith("/catalog/")
+
+
+class ProfilingMiddleware(HybridMiddleware):
+    """Profile one request on demand, or every N-th request in the background.
+
+    Staff turn it on with the ``X-Profile: cprofile|sample`` header; a signed
+    ``?_profile=`` link (issued on the catalog profiles page) works without a
+    staff session, for the path it was issued for. The stored file name comes
+    back in ``X-Profile-Id``.
+
+    Under ASGI the profilers watch the event loop thread: work done in
+    ``sync_to_async`` threads shows up as waiting, and requests served
+    concurrently on the loop end up in the same profile.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        user = getattr(request, "user", None) if request.headers.get("X-Profile") else None
+        mode = self._requested_mode(request, user)
+        profiler = self._start(mode)
+        if profiler is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self._stop(profiler)
+        return self._finish(request, response, profiler, mode)
+
+    async def __acall__(self, request):
+        user = None
+        if request.headers.get("X-Profile") and hasattr(request, "auser"):
+            user = await request.auser()
+        mode = self._requested_mode(request, user)
+        profiler = self._start(mode)
+        if profiler is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._stop(profiler)
+        return self._finish(request, response, profiler, mode)
+
+    def _requested_mode(self, request, user):
+        token = request.GET.get("_profile")
+        if token:
+            return profiling.unsign_profile_link(token, request.path)
+        mode = request.headers.get("X-Profile")
+        if mode in profiling.MODES and user is not None and user.is_staff:
+            return mode
+        return None
+
+    def _start(self, mode):
+        """A running profiler for this request, or None when it is not profiled."""
+        if mode:
+            profiler = profiling.make_profiler(mode)
+        elif profiling.should_sample_in_background():
+            profiler = profiling.StackSampler()
+        else:
+            return None
+        profiler.start()
+        return profiler
+
+    def _stop(self, profiler):
+        profiler.stop()
+        profiling.release_profiler(profiler)
+
+    def _finish(self, request, response, profiler, mode):
+        if not mode:
+            profiling.add_background_sample(profiler.stacks)
+            return response
+        match = getattr(request, "resolver_match", None)
+        name = profiling.save_profile(profiler, match.url_name if match and match.url_name else request.path)
+        response["X-Profile-Id"] = name
+        return response
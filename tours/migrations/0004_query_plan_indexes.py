@@ -0,0 +1,69 @@
+# Generated by Django 5.2.11 on 2026-10-19 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0003_blog_post'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attraction',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['title'], name='attraction_active_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attraction',
+            index=models.Index(condition=models.Q(('is_archived', True)), fields=['title'], name='attraction_archived_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['-published_at', '-created_at'], name='blogpost_active_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(condition=models.Q(('is_archived', True)), fields=['-published_at', '-created_at'], name='blogpost_archived_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grouptour',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['title'], name='grouptour_active_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grouptour',
+            index=models.Index(condition=models.Q(('is_archived', True)), fields=['title'], name='grouptour_archived_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grouptour',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['-created_at'], name='grouptour_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grouptour',
+            index=models.Index(fields=['-created_at'], name='grouptour_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grouptourday',
+            index=models.Index(fields=['group_tour', 'day_number'], name='grouptourday_tour_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grouptourmedia',
+            index=models.Index(fields=['group_tour', '-created_at'], name='gtmedia_tour_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='include',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['description'], name='include_active_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='include',
+            index=models.Index(condition=models.Q(('is_archived', True)), fields=['description'], name='include_archived_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='toursday',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['title'], name='toursday_active_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='toursday',
+            index=models.Index(condition=models.Q(('is_archived', True)), fields=['title'], name='toursday_archived_title_idx'),
+        ),
+    ]
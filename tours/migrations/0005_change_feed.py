@@ -0,0 +1,58 @@
+# Generated by Django 5.2.11 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0004_query_plan_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attraction',
+            name='restored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='restored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='grouptour',
+            name='restored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='include',
+            name='restored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='toursday',
+            name='restored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='attraction',
+            index=models.Index(fields=['updated_at', 'id'], name='attraction_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['updated_at', 'id'], name='blogpost_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grouptour',
+            index=models.Index(fields=['updated_at', 'id'], name='grouptour_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='include',
+            index=models.Index(fields=['updated_at', 'id'], name='include_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='toursday',
+            index=models.Index(fields=['updated_at', 'id'], name='toursday_updated_idx'),
+        ),
+    ]
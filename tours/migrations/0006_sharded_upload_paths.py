@@ -0,0 +1,34 @@
+# Generated by Django 5.2.11 on 2026-10-19 18:25
+
+from django.db import migrations, models
+import tours.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0005_change_feed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attraction',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, upload_to=tours.storage.ShardedUploadTo('catalog/attractions/photos/'), verbose_name='Фотография'),
+        ),
+        migrations.AlterField(
+            model_name='blogpost',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to=tours.storage.ShardedUploadTo('catalog/blog/images/'), verbose_name='Изображение'),
+        ),
+        migrations.AlterField(
+            model_name='grouptourmedia',
+            name='file',
+            field=models.FileField(upload_to=tours.storage.ShardedUploadTo('catalog/group_tours/media/'), verbose_name='Файл'),
+        ),
+        migrations.AlterField(
+            model_name='toursday',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, upload_to=tours.storage.ShardedUploadTo('catalog/tours_days/photos/'), verbose_name='Фотография'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.11 on 2026-10-19 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0006_sharded_upload_paths'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=500, unique=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('provider', models.CharField(max_length=40)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=9),
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='Широта'),
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='Долгота'),
+        ),
+        migrations.AddField(
+            model_name='toursday',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=9),
+        ),
+        migrations.AddField(
+            model_name='toursday',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='Широта'),
+        ),
+        migrations.AddField(
+            model_name='toursday',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='Долгота'),
+        ),
+        migrations.AddIndex(
+            model_name='attraction',
+            index=models.Index(fields=['geohash'], name='attraction_geohash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='toursday',
+            index=models.Index(fields=['geohash'], name='toursday_geohash_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.11 on 2026-10-19 19:05
+
+from django.db import migrations, models
+
+# Копия правил Attraction.CATEGORY_WORDS на момент миграции
+CATEGORY_WORDS = (
+    ('nature', ('beach', 'mountain', 'lake', 'park', 'forest', 'nature')),
+    ('city', ('city', 'square', 'center', 'old town')),
+)
+BATCH_SIZE = 2000
+
+
+def fill_categories(apps, schema_editor):
+    Attraction = apps.get_model('tours', 'Attraction')
+    last_pk = 0
+    while True:
+        rows = list(
+            Attraction.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', 'title', 'description', 'city')[:BATCH_SIZE]
+        )
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        by_category = {}
+        for pk, title, description, city in rows:
+            text = f'{title} {description} {city}'.lower()
+            category = next(
+                (category for category, words in CATEGORY_WORDS if any(word in text for word in words)),
+                'historical',
+            )
+            by_category.setdefault(category, []).append(pk)
+        for category, pks in by_category.items():
+            if category != 'historical':
+                Attraction.objects.filter(pk__in=pks).update(category=category)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0007_geocoding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attraction',
+            name='category',
+            field=models.CharField(choices=[('historical', 'Historical'), ('city', 'City'), ('nature', 'Nature')], default='historical', editable=False, max_length=20, verbose_name='Категория'),
+        ),
+        migrations.RunPython(fill_categories, migrations.RunPython.noop),
+    ]
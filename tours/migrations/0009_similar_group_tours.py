@@ -0,0 +1,36 @@
+# Generated by Django 5.2.11 on 2026-10-19 19:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0008_attraction_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupTourSignature',
+            fields=[
+                ('group_tour', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='tours.grouptour')),
+                ('minhash', models.BinaryField()),
+                ('catalog_version', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarGroupTour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('group_tour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_links', to='tours.grouptour')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tours.grouptour')),
+            ],
+            options={
+                'ordering': ['group_tour', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('group_tour', 'rank'), name='similartour_tour_rank_uniq')],
+            },
+        ),
+    ]
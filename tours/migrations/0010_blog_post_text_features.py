@@ -0,0 +1,64 @@
+# Generated by Django 5.2.11 on 2026-10-19 19:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Чистые функции без моделей: их можно вызывать из миграции
+from tours import text
+
+BATCH_SIZE = 500
+
+
+def fill_text_features(apps, schema_editor):
+    BlogPost = apps.get_model('tours', 'BlogPost')
+    last_pk = 0
+    while True:
+        posts = list(BlogPost.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'title', 'body')[:BATCH_SIZE])
+        if not posts:
+            return
+        last_pk = posts[-1].pk
+        for post in posts:
+            post.excerpt = text.excerpt(post.body)
+            post.reading_minutes = text.reading_minutes(post.body)
+            post.term_weights = text.term_weights(post.title, post.body)
+        BlogPost.objects.bulk_update(posts, ['excerpt', 'reading_minutes', 'term_weights'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0009_similar_group_tours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=300, verbose_name='Excerpt'),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='reading_minutes',
+            field=models.PositiveSmallIntegerField(default=1, editable=False, verbose_name='Reading time, min'),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='term_weights',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.CreateModel(
+            name='RelatedBlogPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='tours.blogpost')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tours.blogpost')),
+            ],
+            options={
+                'ordering': ['post', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('post', 'rank'), name='relatedpost_post_rank_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_text_features, migrations.RunPython.noop),
+    ]
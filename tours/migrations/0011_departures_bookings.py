@@ -0,0 +1,53 @@
+# Generated by Django 5.2.11 on 2026-10-19 20:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0010_blog_post_text_features'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Departure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('starts_on', models.DateField(verbose_name='Start date')),
+                ('capacity', models.PositiveIntegerField(blank=True, verbose_name='Seats')),
+                ('seats_left', models.PositiveIntegerField(editable=False, verbose_name='Seats left')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('group_tour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='departures', to='tours.grouptour')),
+            ],
+            options={
+                'verbose_name': 'Departure',
+                'verbose_name_plural': 'Departures',
+                'ordering': ['starts_on', 'id'],
+                'constraints': [
+                    models.UniqueConstraint(fields=('group_tour', 'starts_on'), name='departure_tour_date_uniq'),
+                    models.CheckConstraint(condition=models.Q(('seats_left__lte', models.F('capacity'))), name='departure_seats_lte_capacity'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='Booking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=64, unique=True)),
+                ('seats', models.PositiveSmallIntegerField(verbose_name='Seats')),
+                ('name', models.CharField(max_length=120, verbose_name='Name')),
+                ('email', models.EmailField(max_length=254, verbose_name='Email')),
+                ('notes', models.TextField(blank=True, verbose_name='Notes')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('departure', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='tours.departure')),
+            ],
+            options={
+                'verbose_name': 'Booking',
+                'verbose_name_plural': 'Bookings',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
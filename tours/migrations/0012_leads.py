@@ -0,0 +1,56 @@
+# Generated by Django 5.2.11 on 2026-10-19 20:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0011_departures_bookings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadContact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True, verbose_name='Email')),
+                ('name', models.CharField(max_length=120, verbose_name='Name')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Lead contact',
+                'verbose_name_plural': 'Lead contacts',
+            },
+        ),
+        migrations.CreateModel(
+            name='Lead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=32, unique=True)),
+                ('source', models.CharField(choices=[('organizations', 'For organizations'), ('journey', 'Begin your journey')], max_length=20, verbose_name='Source')),
+                ('submitted_at', models.DateTimeField(verbose_name='Submitted at')),
+                ('experience', models.CharField(blank=True, max_length=20, verbose_name='Experience')),
+                ('wishes', models.TextField(blank=True, verbose_name='Wishes')),
+                ('start_month', models.CharField(blank=True, max_length=7, verbose_name='Start month')),
+                ('days', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Days')),
+                ('adults', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Adults')),
+                ('children', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Children')),
+                ('cities', models.CharField(blank=True, max_length=255, verbose_name='Cities')),
+                ('country', models.CharField(blank=True, max_length=100, verbose_name='Country')),
+                ('accommodation', models.CharField(blank=True, max_length=100, verbose_name='Accommodation')),
+                ('comments', models.TextField(blank=True, verbose_name='Comments')),
+                ('health', models.TextField(blank=True, verbose_name='Health considerations')),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('places', models.ManyToManyField(blank=True, related_name='leads', to='tours.attraction', verbose_name='Places')),
+                ('contact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leads', to='tours.leadcontact')),
+            ],
+            options={
+                'verbose_name': 'Lead',
+                'verbose_name_plural': 'Leads',
+                'ordering': ['-submitted_at'],
+                'indexes': [models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['submitted_at', 'id'], name='lead_pending_idx')],
+            },
+        ),
+    ]
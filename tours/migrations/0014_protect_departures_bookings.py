@@ -0,0 +1,24 @@
+# Generated by Django 5.2.11 on 2026-10-19 21:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0013_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='departure',
+            name='group_tour',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='departures', to='tours.grouptour'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='departure',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='bookings', to='tours.departure'),
+        ),
+    ]
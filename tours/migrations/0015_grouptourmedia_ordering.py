@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-19 21:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0014_protect_departures_bookings'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='grouptourmedia',
+            options={'ordering': ['group_tour_id', '-created_at'], 'verbose_name': 'Медиа GroupTour', 'verbose_name_plural': 'Медиа GroupTour'},
+        ),
+    ]
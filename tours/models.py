@@ -1,9 +1,39 @@
 from django.conf import settings
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, router, transaction
+from django.db.models import Q
 from django.utils import timezone
 
+from . import geo, text
+from .db import retry_on_locked
+from .signals import archive_changed
+from .storage import ShardedUploadTo
 
-class ActiveManager(models.Manager):
+
+class ArchivableQuerySet(models.QuerySet):
+    """Bulk archive / restore: one UPDATE for the whole selection, one ``archive_changed`` per call."""
+
+    def archive(self):
+        now = timezone.now()
+        return self._set_archived(True, archived_at=now, updated_at=now)
+
+    def restore(self):
+        now = timezone.now()
+        return self._set_archived(False, archived_at=None, restored_at=now, updated_at=now)
+
+    @retry_on_locked
+    def _set_archived(self, archived, **values):
+        """Number of rows whose state actually changed."""
+        selection = self.filter(is_archived=not archived)
+        # pk читаем в той же транзакции; UPDATE — с тем же WHERE, без списка id в параметрах
+        pks = list(selection.values_list("pk", flat=True))
+        if pks:
+            selection.update(is_archived=archived, **values)
+            archive_changed.send(sender=self.model, pks=pks, archived=archived, using="default")
+        return len(pks)
+
+
+class ActiveManager(models.Manager.from_queryset(ArchivableQuerySet)):
     def get_queryset(self):
         return super().get_queryset().filter(is_archived=False)
 
@@ -13,22 +43,67 @@ class ArchivableModel(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_archived = models.BooleanField(default=False)
     archived_at = models.DateTimeField(null=True, blank=True)
+    restored_at = models.DateTimeField(null=True, blank=True)
 
     objects = ActiveManager()
-    all_objects = models.Manager()
+    all_objects = ArchivableQuerySet.as_manager()
+
+    # Поля, вычисляемые из остальных при save(); bulk-операции вызывают refresh_derived_fields() сами
+    derived_fields = ()
 
     class Meta:
         abstract = True
 
+    def refresh_derived_fields(self):
+        pass
+
+    def save(self, *args, **kwargs):
+        self.refresh_derived_fields()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and self.derived_fields:
+            kwargs["update_fields"] = {*update_fields, *self.derived_fields}
+        super().save(*args, **kwargs)
+
+    @retry_on_locked
     def archive(self):
         self.is_archived = True
         self.archived_at = timezone.now()
         self.save(update_fields=["is_archived", "archived_at", "updated_at"])
 
+    @retry_on_locked
     def restore(self):
         self.is_archived = False
         self.archived_at = None
-        self.save(update_fields=["is_archived", "archived_at", "updated_at"])
+        self.restored_at = timezone.now()
+        self.save(update_fields=["is_archived", "archived_at", "restored_at", "updated_at"])
+
+
+class GeoLocatedModel(ArchivableModel):
+    """Coordinates plus their geohash, the key of the spatial index (see ``tours.geo``)."""
+
+    latitude = models.FloatField("Широта", null=True, blank=True)
+    longitude = models.FloatField("Долгота", null=True, blank=True)
+    geohash = models.CharField(max_length=geo.GEOHASH_PRECISION, blank=True, editable=False)
+
+    derived_fields = ("geohash",)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def location(self):
+        """(latitude, longitude), or None while either is unknown."""
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
+    def set_location(self, coords):
+        self.latitude, self.longitude = coords or (None, None)
+        self.geohash = geo.encode(*coords) if coords else ""
+
+    def refresh_derived_fields(self):
+        super().refresh_derived_fields()
+        self.set_location(self.location)
 
 
 class Include(ArchivableModel):
@@ -39,6 +114,11 @@ class Include(ArchivableModel):
         verbose_name = "Include"
         verbose_name_plural = "Includes"
         ordering = ["description"]
+        indexes = [
+            models.Index(fields=["description"], condition=Q(is_archived=False), name="include_active_desc_idx"),
+            models.Index(fields=["description"], condition=Q(is_archived=True), name="include_archived_desc_idx"),
+            models.Index(fields=["updated_at", "id"], name="include_updated_idx"),
+        ]
 
     def __str__(self):
         return self.description[:80]
@@ -50,13 +130,30 @@ class Include(ArchivableModel):
         return f"{settings.MEDIA_URL}{self.icon_path}"
 
 
-class Attraction(ArchivableModel):
+class Attraction(GeoLocatedModel):
+    HISTORICAL = "historical"
+    CITY = "city"
+    NATURE = "nature"
+    CATEGORY_CHOICES = (
+        (HISTORICAL, "Historical"),
+        (CITY, "City"),
+        (NATURE, "Nature"),
+    )
+    # Ключевые слова категорий; проверяются по порядку, по умолчанию — historical
+    CATEGORY_WORDS = (
+        (NATURE, ("beach", "mountain", "lake", "park", "forest", "nature")),
+        (CITY, ("city", "square", "center", "old town")),
+    )
+
     title = models.CharField("Заголовок", max_length=255)
     description = models.TextField("Описание")
     city = models.CharField("Город", max_length=120)
     address = models.CharField("Адрес", max_length=255)
     duration_hours = models.DecimalField("Длительность, часов", max_digits=5, decimal_places=2)
-    photo = models.ImageField("Фотография", upload_to="catalog/attractions/photos/", null=True, blank=True)
+    photo = models.ImageField("Фотография", upload_to=ShardedUploadTo("catalog/attractions/photos/"), null=True, blank=True)
+    category = models.CharField(
+        "Категория", max_length=20, choices=CATEGORY_CHOICES, default=HISTORICAL, editable=False
+    )
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -70,18 +167,34 @@ class Attraction(ArchivableModel):
         verbose_name = "Достопримечательность"
         verbose_name_plural = "Достопримечательности"
         ordering = ["title"]
+        indexes = [
+            models.Index(fields=["title"], condition=Q(is_archived=False), name="attraction_active_title_idx"),
+            models.Index(fields=["title"], condition=Q(is_archived=True), name="attraction_archived_title_idx"),
+            models.Index(fields=["updated_at", "id"], name="attraction_updated_idx"),
+            models.Index(fields=["geohash"], name="attraction_geohash_idx"),
+        ]
+
+    derived_fields = GeoLocatedModel.derived_fields + ("category",)
 
     def __str__(self):
         return self.title
 
+    def refresh_derived_fields(self):
+        super().refresh_derived_fields()
+        text = f"{self.title} {self.description} {self.city}".lower()
+        self.category = next(
+            (category for category, words in self.CATEGORY_WORDS if any(word in text for word in words)),
+            self.HISTORICAL,
+        )
+
 
-class ToursDay(ArchivableModel):
+class ToursDay(GeoLocatedModel):
     title = models.CharField("Заголовок", max_length=255)
     description = models.TextField("Описание")
     city = models.CharField("Город", max_length=120)
     address = models.CharField("Адрес", max_length=255)
     duration_hours = models.DecimalField("Длительность, часов", max_digits=5, decimal_places=2)
-    photo = models.ImageField("Фотография", upload_to="catalog/tours_days/photos/", null=True, blank=True)
+    photo = models.ImageField("Фотография", upload_to=ShardedUploadTo("catalog/tours_days/photos/"), null=True, blank=True)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -109,6 +222,12 @@ class ToursDay(ArchivableModel):
         verbose_name = "ToursDay"
         verbose_name_plural = "ToursDays"
         ordering = ["title"]
+        indexes = [
+            models.Index(fields=["title"], condition=Q(is_archived=False), name="toursday_active_title_idx"),
+            models.Index(fields=["title"], condition=Q(is_archived=True), name="toursday_archived_title_idx"),
+            models.Index(fields=["updated_at", "id"], name="toursday_updated_idx"),
+            models.Index(fields=["geohash"], name="toursday_geohash_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -169,6 +288,13 @@ class GroupTour(ArchivableModel):
         verbose_name = "GroupTour"
         verbose_name_plural = "GroupTours"
         ordering = ["title"]
+        indexes = [
+            models.Index(fields=["title"], condition=Q(is_archived=False), name="grouptour_active_title_idx"),
+            models.Index(fields=["title"], condition=Q(is_archived=True), name="grouptour_archived_title_idx"),
+            models.Index(fields=["-created_at"], condition=Q(is_archived=False), name="grouptour_active_created_idx"),
+            models.Index(fields=["-created_at"], name="grouptour_created_idx"),
+            models.Index(fields=["updated_at", "id"], name="grouptour_updated_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -182,6 +308,9 @@ class GroupTourDay(models.Model):
     class Meta:
         unique_together = ("group_tour", "tours_day")
         ordering = ["day_number", "id"]
+        indexes = [
+            models.Index(fields=["group_tour", "day_number"], name="grouptourday_tour_day_idx"),
+        ]
         verbose_name = "Связь GroupTour -> ToursDay"
         verbose_name_plural = "Связи GroupTour -> ToursDay"
 
@@ -198,19 +327,142 @@ class GroupTourMedia(models.Model):
     )
 
     group_tour = models.ForeignKey(GroupTour, on_delete=models.CASCADE, related_name="media_items")
-    file = models.FileField("Файл", upload_to="catalog/group_tours/media/")
+    file = models.FileField("Файл", upload_to=ShardedUploadTo("catalog/group_tours/media/"))
     media_type = models.CharField("Тип медиа", max_length=10, choices=MEDIA_TYPE_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name = "Медиа GroupTour"
         verbose_name_plural = "Медиа GroupTour"
-        ordering = ["-created_at"]
+        # Сначала тур: prefetch по списку туров (group_tour_id IN ...) читает индекс без сортировки
+        ordering = ["group_tour_id", "-created_at"]
+        indexes = [
+            models.Index(fields=["group_tour", "-created_at"], name="gtmedia_tour_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.group_tour}: {self.media_type}"
 
 
+class Departure(models.Model):
+    """A dated run of a group tour; ``seats_left`` changes only through ``tours.booking`` and capacity edits."""
+
+    # PROTECT: удаление тура не должно молча уносить отправления с бронями
+    group_tour = models.ForeignKey(GroupTour, on_delete=models.PROTECT, related_name="departures")
+    starts_on = models.DateField("Start date")
+    # Пусто при создании — берётся численность группы тура
+    capacity = models.PositiveIntegerField("Seats", blank=True)
+    seats_left = models.PositiveIntegerField("Seats left", editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Departure"
+        verbose_name_plural = "Departures"
+        ordering = ["starts_on", "id"]
+        constraints = [
+            models.UniqueConstraint(fields=["group_tour", "starts_on"], name="departure_tour_date_uniq"),
+            models.CheckConstraint(condition=Q(seats_left__lte=models.F("capacity")), name="departure_seats_lte_capacity"),
+        ]
+
+    def __str__(self):
+        return f"{self.group_tour} / {self.starts_on:%Y-%m-%d}"
+
+    def clean(self):
+        super().clean()
+        if self.pk is None or self.capacity is None:
+            return
+        booked = (
+            Departure.objects.filter(pk=self.pk)
+            .annotate(booked=models.F("capacity") - models.F("seats_left"))
+            .values_list("booked", flat=True)
+            .first()
+        )
+        if booked is not None and self.capacity < booked:
+            raise ValidationError({"capacity": f"{booked} seat(s) are already booked."})
+
+    def save(self, *args, **kwargs):
+        if self.capacity is None:
+            self.capacity = self.group_tour.group_size
+        if self._state.adding:
+            self.seats_left = self.capacity
+            super().save(*args, **kwargs)
+            return
+        if kwargs.get("update_fields") is not None:
+            super().save(*args, **kwargs)
+            return
+        # Остаток мест мог уйти вперёд в другом запросе: сохранение объекта его не перезаписывает,
+        # а новая вместимость сдвигает его на ту же разницу одним условным UPDATE
+        kwargs["update_fields"] = [
+            field.name
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in ("seats_left", "capacity")
+        ]
+        with transaction.atomic(using=kwargs.get("using") or router.db_for_write(Departure)):
+            resized = Departure.objects.filter(
+                pk=self.pk, seats_left__gte=models.F("capacity") - self.capacity
+            ).update(
+                capacity=self.capacity,
+                seats_left=models.F("seats_left") + self.capacity - models.F("capacity"),
+            )
+            if not resized:
+                raise ValidationError({"capacity": "More seats are already booked than the new capacity."})
+            self.seats_left = Departure.objects.values_list("seats_left", flat=True).get(pk=self.pk)
+            super().save(*args, **kwargs)
+
+
+class Booking(models.Model):
+    """Seats of a departure taken by one request; ``idempotency_key`` is unique per submitted form."""
+
+    departure = models.ForeignKey(Departure, on_delete=models.PROTECT, related_name="bookings")
+    idempotency_key = models.CharField(max_length=64, unique=True)
+    seats = models.PositiveSmallIntegerField("Seats")
+    name = models.CharField("Name", max_length=120)
+    email = models.EmailField("Email")
+    notes = models.TextField("Notes", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Booking"
+        verbose_name_plural = "Bookings"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.departure}: {self.seats} × {self.name}"
+
+
+class GroupTourSignature(models.Model):
+    """MinHash signature of a tour's attractions and cities (see ``tours.similarity``)."""
+
+    group_tour = models.OneToOneField(
+        GroupTour, on_delete=models.CASCADE, primary_key=True, related_name="signature"
+    )
+    minhash = models.BinaryField()
+    # Версия каталога (новейший updated_at), на которой подпись посчитана
+    catalog_version = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.group_tour_id}: {self.catalog_version:%Y-%m-%d %H:%M}"
+
+
+class SimilarGroupTour(models.Model):
+    """One of the precomputed most similar tours of ``group_tour``, best first by ``rank``."""
+
+    group_tour = models.ForeignKey(GroupTour, on_delete=models.CASCADE, related_name="similar_links")
+    similar = models.ForeignKey(GroupTour, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["group_tour", "rank"]
+        constraints = [
+            models.UniqueConstraint(fields=["group_tour", "rank"], name="similartour_tour_rank_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.group_tour_id} ~ {self.similar_id} ({self.score:.2f})"
+
+
 class BlogPost(ArchivableModel):
     """Blog post: image, date, title, body (full article on separate page)."""
     title = models.CharField("Title", max_length=255)
@@ -218,7 +470,7 @@ class BlogPost(ArchivableModel):
     published_at = models.DateField("Publication date", null=True, blank=True)
     image = models.ImageField(
         "Image",
-        upload_to="catalog/blog/images/",
+        upload_to=ShardedUploadTo("catalog/blog/images/"),
         null=True,
         blank=True,
     )
@@ -230,11 +482,189 @@ class BlogPost(ArchivableModel):
         related_name="created_blog_posts",
         verbose_name="Author",
     )
+    excerpt = models.CharField("Excerpt", max_length=300, blank=True, editable=False)
+    reading_minutes = models.PositiveSmallIntegerField("Reading time, min", default=1, editable=False)
+    # Частоты слов (TF); IDF и похожие посты считает manage.py build_related_posts
+    term_weights = models.JSONField(default=dict, editable=False)
 
     class Meta:
         verbose_name = "Blog post"
         verbose_name_plural = "Blog"
         ordering = ["-published_at", "-created_at"]
+        indexes = [
+            models.Index(
+                fields=["-published_at", "-created_at"],
+                condition=Q(is_archived=False),
+                name="blogpost_active_published_idx",
+            ),
+            models.Index(
+                fields=["-published_at", "-created_at"],
+                condition=Q(is_archived=True),
+                name="blogpost_archived_pub_idx",
+            ),
+            models.Index(fields=["updated_at", "id"], name="blogpost_updated_idx"),
+        ]
+
+    derived_fields = ArchivableModel.derived_fields + ("excerpt", "reading_minutes", "term_weights")
 
     def __str__(self):
         return self.title[:80]
+
+    def refresh_derived_fields(self):
+        super().refresh_derived_fields()
+        self.excerpt = text.excerpt(self.body)
+        self.reading_minutes = text.reading_minutes(self.body)
+        self.term_weights = text.term_weights(self.title, self.body)
+
+
+class RelatedBlogPost(models.Model):
+    """One of the precomputed most similar posts of ``post``, best first by ``rank``."""
+
+    post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name="related_links")
+    related = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["post", "rank"]
+        constraints = [
+            models.UniqueConstraint(fields=["post", "rank"], name="relatedpost_post_rank_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} ~ {self.related_id} ({self.score:.2f})"
+
+
+class LeadContact(models.Model):
+    """A visitor who sent a request; one row per email address."""
+
+    email = models.EmailField("Email", unique=True)
+    name = models.CharField("Name", max_length=120)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Lead contact"
+        verbose_name_plural = "Lead contacts"
+
+    def __str__(self):
+        return f"{self.name} <{self.email}>"
+
+
+class Lead(models.Model):
+    """A request from the site, moved here from the lead journal by ``manage.py drain_leads``."""
+
+    ORGANIZATIONS = "organizations"
+    JOURNEY = "journey"
+    SOURCE_CHOICES = (
+        (ORGANIZATIONS, "For organizations"),
+        (JOURNEY, "Begin your journey"),
+    )
+
+    # Ключ записи журнала: запись, разобранная повторно, не создаёт второй заявки
+    key = models.CharField(max_length=32, unique=True)
+    contact = models.ForeignKey(LeadContact, on_delete=models.CASCADE, related_name="leads")
+    source = models.CharField("Source", max_length=20, choices=SOURCE_CHOICES)
+    submitted_at = models.DateTimeField("Submitted at")
+    experience = models.CharField("Experience", max_length=20, blank=True)
+    wishes = models.TextField("Wishes", blank=True)
+    start_month = models.CharField("Start month", max_length=7, blank=True)  # YYYY-MM
+    days = models.PositiveSmallIntegerField("Days", null=True, blank=True)
+    adults = models.PositiveSmallIntegerField("Adults", null=True, blank=True)
+    children = models.PositiveSmallIntegerField("Children", null=True, blank=True)
+    cities = models.CharField("Cities", max_length=255, blank=True)
+    country = models.CharField("Country", max_length=100, blank=True)
+    accommodation = models.CharField("Accommodation", max_length=100, blank=True)
+    comments = models.TextField("Comments", blank=True)
+    health = models.TextField("Health considerations", blank=True)
+    places = models.ManyToManyField(Attraction, related_name="leads", blank=True, verbose_name="Places")
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Lead"
+        verbose_name_plural = "Leads"
+        ordering = ["-submitted_at"]
+        indexes = [
+            models.Index(fields=["submitted_at", "id"], condition=Q(notified_at__isnull=True), name="lead_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_source_display()}: {self.contact_id} ({self.submitted_at:%Y-%m-%d})"
+
+
+class Job(models.Model):
+    """A unit of background work for ``manage.py runworker`` (see ``tours.jobs``)."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0)  # больше — раньше
+    # Непустой ключ: одновременно в очереди не больше одной задачи с ним
+    unique_key = models.CharField(max_length=200, blank=True)
+    run_at = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    claim = models.CharField(max_length=100, blank=True)  # воркер и попытка, взявшие задачу
+    lease_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                models.F("priority").desc(), "run_at", "id", condition=Q(status="queued"), name="job_queued_idx"
+            ),
+            models.Index(fields=["lease_until"], condition=Q(status="running"), name="job_running_idx"),
+            models.Index(fields=["status", "-finished_at"], name="job_status_finished_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["unique_key"], condition=Q(status="queued") & ~Q(unique_key=""), name="job_queued_key_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.task} ({self.status})"
+
+
+class JobSchedule(models.Model):
+    """A cron entry of ``JOB_SCHEDULE``; workers enqueue its task when ``next_run_at`` comes."""
+
+    name = models.CharField(max_length=100, primary_key=True)
+    task = models.CharField(max_length=100)
+    cron = models.CharField(max_length=100)
+    next_run_at = models.DateTimeField()
+    last_enqueued_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["next_run_at"]
+
+    def __str__(self):
+        return f"{self.name}: {self.cron}"
+
+
+class GeocodeCache(models.Model):
+    """Geocoder answers by normalized query; empty coordinates mean "not found"."""
+
+    query = models.CharField(max_length=500, unique=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    provider = models.CharField(max_length=40)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.query
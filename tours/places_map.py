@@ -0,0 +1,247 @@
+"""Map data for the journey step-3 page: clustered tiles and a place list.
+
+``/api/v1/map/tiles/?bbox=s,w,n,e&zoom=z`` answers for one map tile in the
+format of Yandex Maps' ``RemoteObjectManager``: the attractions of the tile
+grouped by geohash cell (see ``tours.geo``) at a precision chosen from the
+zoom, a cell with several attractions sent as one cluster. Above
+``CLUSTER_MAX_ZOOM`` every attraction is a point of its own.
+``/api/v1/map/places/`` is the side list: attractions in the viewport, or in
+the whole catalog without ``bbox``, by title.
+
+Both take ``q`` (a substring of title, city or address) and ``category``
+(comma-separated) and are cached per (request parameters, catalog
+version); the version is the newest ``updated_at`` of attractions, which
+every edit, archive and geocoding run moves forward.
+"""
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Avg, Count, Max, Min, Q
+from django.db.models.functions import Substr
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+
+from . import geo
+from .api import ApiError, _error
+from .metrics import record_cache
+from .models import Attraction
+
+CLUSTER_MAX_ZOOM = 14
+CLUSTER_CELLS_PER_TILE = 4  # по ширине тайла: ячейка ~64 px
+MAX_TILE_POINTS = 500
+DEFAULT_PLACES = 30
+MAX_PLACES = 100
+
+PLACE_FIELDS = ("id", "title", "city", "address", "duration_hours", "category", "photo", "latitude", "longitude")
+_CALLBACK_RE = re.compile(r"^[A-Za-z_$][\w$.]{0,63}$")
+
+
+def place(row):
+    """A place as the step-3 list and map show it."""
+    return {
+        "id": row["id"],
+        "title": row["title"],
+        "city": row["city"],
+        "address": row["address"],
+        "duration_hours": str(row["duration_hours"]),
+        "category": row["category"],
+        "photo_url": (
+            default_storage.url(row["photo"])
+            if row["photo"]
+            else f"{settings.MEDIA_URL}working/test1/origOf1icon.jpg"
+        ),
+        "lat": row["latitude"],
+        "lng": row["longitude"],
+    }
+
+
+def _filters(request):
+    """(q, categories) from the query string."""
+    q = request.GET.get("q", "").strip()[:100]
+    raw = request.GET.get("category", "")
+    categories = sorted({name.strip() for name in raw.split(",") if name.strip()})
+    known = {value for value, _ in Attraction.CATEGORY_CHOICES}
+    unknown = [name for name in categories if name not in known]
+    if unknown:
+        raise ApiError(f"Unknown category: {', '.join(unknown)}.")
+    return q, categories
+
+
+def _bbox(request, required=True):
+    raw = request.GET.get("bbox")
+    if not raw:
+        if required:
+            raise ApiError("bbox is required.")
+        return None
+    try:
+        south, west, north, east = (float(part) for part in raw.split(","))
+    except ValueError:
+        raise ApiError("bbox must be south,west,north,east.")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ApiError("bbox is out of range.")
+    return south, west, north, east
+
+
+def _zoom(request):
+    try:
+        zoom = int(request.GET["zoom"])
+    except (KeyError, ValueError):
+        raise ApiError("zoom must be an integer.")
+    return max(0, min(zoom, 23))
+
+
+def attractions(q="", categories=()):
+    qs = Attraction.objects.all()
+    if q:
+        qs = qs.filter(Q(title__icontains=q) | Q(city__icontains=q) | Q(address__icontains=q))
+    if categories:
+        qs = qs.filter(category__in=categories)
+    return qs
+
+
+def cluster_precision(zoom):
+    """Geohash precision of the cluster grid: the finest cells at least 1/4 of a tile wide."""
+    target = 360.0 / 2 ** zoom / CLUSTER_CELLS_PER_TILE
+    precision = 1
+    while precision < geo.GEOHASH_PRECISION and geo.cell_size(precision + 1)[1] >= target:
+        precision += 1
+    return precision
+
+
+def tile_features(bbox, zoom, q="", categories=()):
+    """Clusters and points of one tile, as ``RemoteObjectManager`` features."""
+    qs = geo.in_bbox(attractions(q, categories), *bbox)
+    if zoom > CLUSTER_MAX_ZOOM:
+        rows = qs.order_by().values(*PLACE_FIELDS)[:MAX_TILE_POINTS]
+        return [_point_feature(row) for row in rows]
+
+    precision = cluster_precision(zoom)
+    cells = (
+        qs.annotate(cell=Substr("geohash", 1, precision))
+        .order_by()
+        .values("cell")
+        .annotate(
+            number=Count("id"),
+            first_id=Min("id"),
+            center_lat=Avg("latitude"),
+            center_lng=Avg("longitude"),
+            south=Min("latitude"),
+            west=Min("longitude"),
+            north=Max("latitude"),
+            east=Max("longitude"),
+        )
+    )
+    features = []
+    single_ids = []
+    bbox_key = ",".join(f"{value:g}" for value in bbox)
+    for cell in cells:
+        if cell["number"] == 1:
+            single_ids.append(cell["first_id"])
+            continue
+        features.append(
+            {
+                "type": "Cluster",
+                # Ячейка geohash может попасть в два тайла: id уникален вместе с тайлом
+                "id": f"{zoom}:{cell['cell']}:{bbox_key}",
+                "number": cell["number"],
+                "bbox": [[cell["south"], cell["west"]], [cell["north"], cell["east"]]],
+                "geometry": {"type": "Point", "coordinates": [cell["center_lat"], cell["center_lng"]]},
+                "properties": {"iconContent": cell["number"]},
+            }
+        )
+    if single_ids:
+        # Ячейка с одной достопримечательностью — точка; её id уже известен из группировки
+        rows = Attraction.objects.filter(pk__in=single_ids[:MAX_TILE_POINTS]).order_by().values(*PLACE_FIELDS)
+        features.extend(_point_feature(row) for row in rows)
+    return features
+
+
+def _point_feature(row):
+    item = place(row)
+    return {
+        "type": "Feature",
+        "id": item["id"],
+        "geometry": {"type": "Point", "coordinates": [item["lat"], item["lng"]]},
+        "properties": item,
+    }
+
+
+def places(q="", categories=(), bbox=None, limit=DEFAULT_PLACES):
+    qs = attractions(q, categories)
+    if bbox is not None:
+        qs = geo.in_bbox(qs, *bbox)
+    return [place(row) for row in qs.order_by("title").values(*PLACE_FIELDS)[:limit]]
+
+
+def _catalog_version():
+    latest = Attraction.all_objects.aggregate(latest=Max("updated_at"))["latest"]
+    return latest.isoformat() if latest else "empty"
+
+
+def _cached_json(name, params, build):
+    """(body, cache key) for ``build()``, cached per parameters and catalog version."""
+    key_source = json.dumps([name, _catalog_version(), params], cls=DjangoJSONEncoder)
+    key = f"places-map:{hashlib.sha1(key_source.encode()).hexdigest()}"
+    body = cache.get(key)
+    record_cache(name, body is not None)
+    if body is None:
+        body = json.dumps(build(), cls=DjangoJSONEncoder, ensure_ascii=False)
+        cache.set(key, body, settings.PLACES_MAP_CACHE_SECONDS)
+    return body, key
+
+
+def _response(request, body, key, callback=None):
+    etag = f'"{hashlib.sha1(f"{key}:{callback}".encode()).hexdigest()}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    if callback:
+        response = HttpResponse(f"{callback}({body});", content_type="application/javascript")
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    response["Cache-Control"] = f"public, max-age={settings.PLACES_MAP_BROWSER_CACHE_SECONDS}"
+    return response
+
+
+@require_safe
+def tile(request):
+    """One tile; ``callback`` switches to JSONP, as ``RemoteObjectManager`` requests it."""
+    try:
+        bbox = _bbox(request)
+        zoom = _zoom(request)
+        q, categories = _filters(request)
+        callback = request.GET.get("callback") or None
+        if callback and not _CALLBACK_RE.match(callback):
+            raise ApiError("Invalid callback.")
+    except ApiError as exc:
+        return _error(str(exc))
+
+    def build():
+        collection = {"type": "FeatureCollection", "features": tile_features(bbox, zoom, q, categories)}
+        return {"error": None, "data": collection} if callback else collection
+
+    body, key = _cached_json("map_tiles", [bbox, zoom, q, categories, bool(callback)], build)
+    return _response(request, body, key, callback)
+
+
+@require_safe
+def place_list(request):
+    try:
+        bbox = _bbox(request, required=False)
+        q, categories = _filters(request)
+        limit = max(1, min(int(request.GET.get("limit", DEFAULT_PLACES)), MAX_PLACES))
+    except ValueError:
+        return _error("limit must be an integer.")
+    except ApiError as exc:
+        return _error(str(exc))
+    body, key = _cached_json(
+        "map_places", [bbox, q, categories, limit], lambda: {"results": places(q, categories, bbox, limit)}
+    )
+    return _response(request, body, key)
@@ -0,0 +1,289 @@
+"""On-demand request profiling.
+
+Two profilers share one interface (``start()`` / ``stop()`` / ``save(path)``):
+
+* ``cprofile`` — deterministic, exact call counts, saved as a pstats ``.prof``
+  file (``python -m pstats``, snakeviz);
+* ``sample`` — a background thread reads the request thread's stack every
+  ``PROFILE_SAMPLE_INTERVAL`` seconds, saved as collapsed stacks ``.folded``
+  (flamegraph.pl, speedscope). Overhead does not depend on the call count,
+  so it is also used for the 1-in-``PROFILE_SAMPLE_RATE`` background mode.
+"""
+import atexit
+import cProfile
+import fcntl
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+
+from .metrics import _alive
+
+MODES = ("cprofile", "sample")
+EXTENSIONS = {"cprofile": ".prof", "sample": ".folded"}
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.(prof|folded)$")
+BACKGROUND_PREFIX = "background-"
+
+_SIGNING_SALT = "tours.profiling"
+_SLUG_RE = re.compile(r"[^\w-]+")
+
+# cProfile нельзя запускать в двух потоках одновременно — второй запрос получает sampler
+_cprofile_lock = threading.Lock()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    # Родительский каталог различает base.py из db/, handlers/, template/...
+    filename = "/".join(Path(code.co_filename).parts[-2:])
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame):
+    """``root;caller;...;leaf`` for a frame, the flamegraph collapsed format."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class CProfileProfiler:
+    mode = "cprofile"
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def save(self, path):
+        self._profile.dump_stats(path)
+
+
+class StackSampler:
+    """Samples one thread's stack from a helper thread."""
+
+    mode = "sample"
+
+    def __init__(self, interval=None, thread_id=None):
+        self.interval = interval or settings.PROFILE_SAMPLE_INTERVAL
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="tours-stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            # Проснулись уже после stop(): поток запроса стоит в join(), это не его работа
+            if frame is not None and not self._stopped.is_set():
+                self.stacks[collapse_stack(frame)] += 1
+
+    def save(self, path):
+        write_folded(path, self.stacks)
+
+
+def write_folded(path, stacks):
+    tmp = Path(f"{path}.tmp")
+    tmp.write_text("".join(f"{stack} {count}\n" for stack, count in stacks.items()), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def read_folded(path):
+    stacks = Counter()
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack and count.isdigit():
+                stacks[stack] += int(count)
+    return stacks
+
+
+def make_profiler(mode):
+    """A profiler for ``mode``; cProfile falls back to sampling when one is already running."""
+    if mode == "cprofile" and _cprofile_lock.acquire(blocking=False):
+        return CProfileProfiler()
+    return StackSampler()
+
+
+def release_profiler(profiler):
+    if isinstance(profiler, CProfileProfiler):
+        _cprofile_lock.release()
+
+
+def profile_dir():
+    path = Path(settings.PROFILE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save_profile(profiler, label):
+    """Store a request profile and drop the oldest ones beyond ``PROFILE_KEEP``; returns the file name."""
+    directory = profile_dir()
+    slug = _SLUG_RE.sub("-", label).strip("-")[:60] or "request"
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{slug}{EXTENSIONS[profiler.mode]}"
+    profiler.save(directory / name)
+    prune_profiles()
+    return name
+
+
+def prune_profiles():
+    """Apply the retention limits to the profile directory; returns how many files were deleted.
+
+    Request profiles beyond ``PROFILE_KEEP`` go first; background files of
+    exited processes go once older than ``PROFILE_BACKGROUND_MAX_AGE`` seconds
+    or beyond the ``PROFILE_KEEP`` newest of them.
+    """
+    directory = profile_dir()
+    pruned = 0
+    # Под файловой блокировкой: процессы, пишущие профили одновременно, не удаляют одно и то же
+    with open(directory / ".prune.lock", "a+b") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        stale = [item["path"] for item in list_profiles()[settings.PROFILE_KEEP:]]
+        exited = []
+        for path in directory.glob(f"{BACKGROUND_PREFIX}*.folded"):
+            pid = path.stem.removeprefix(BACKGROUND_PREFIX)
+            if pid.isdigit() and not _alive(int(pid)):
+                exited.append((path.stat().st_mtime, path))
+        exited.sort(reverse=True)
+        oldest = time.time() - settings.PROFILE_BACKGROUND_MAX_AGE
+        for position, (mtime, path) in enumerate(exited):
+            if position >= settings.PROFILE_KEEP or mtime < oldest:
+                stale.append(path)
+        for path in stale:
+            path.unlink(missing_ok=True)
+            pruned += 1
+    return pruned
+
+
+def list_profiles():
+    """Per-request profiles, newest first."""
+    if not Path(settings.PROFILE_DIR).is_dir():
+        return []
+    profiles = []
+    for path in Path(settings.PROFILE_DIR).iterdir():
+        if PROFILE_NAME_RE.match(path.name) and not path.name.startswith(BACKGROUND_PREFIX):
+            stat = path.stat()
+            profiles.append({"name": path.name, "path": path, "size": stat.st_size, "mtime": stat.st_mtime})
+    profiles.sort(key=lambda item: item["mtime"], reverse=True)
+    return profiles
+
+
+def profile_path(name):
+    """Path of a stored profile, or None for names that are not ours."""
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = Path(settings.PROFILE_DIR) / name
+    return path if path.is_file() else None
+
+
+def sign_profile_link(path, mode):
+    """Token for ``?_profile=``: lets whoever holds the link profile ``path`` for a while."""
+    return signing.dumps({"path": path, "mode": mode}, salt=_SIGNING_SALT)
+
+
+def unsign_profile_link(token, path):
+    try:
+        data = signing.loads(token, salt=_SIGNING_SALT, max_age=settings.PROFILE_LINK_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if data.get("path") != path or data.get("mode") not in MODES:
+        return None
+    return data["mode"]
+
+
+# Фоновый режим: каждый N-й запрос процесса сэмплируется, стеки копятся в памяти
+# и раз в PROFILE_BACKGROUND_FLUSH_SECONDS пишутся в background-<pid>.folded;
+# отчёт складывает файлы всех процессов
+OTHER_STACKS = "(other stacks)"
+_background_counter = itertools.count(1)
+_background_lock = threading.Lock()
+_background_stacks = Counter()
+_background_pid = None
+_background_timer = None
+
+
+def should_sample_in_background():
+    rate = settings.PROFILE_SAMPLE_RATE
+    return rate > 0 and next(_background_counter) % rate == 0
+
+
+def add_background_sample(stacks):
+    """Count ``stacks``; beyond PROFILE_BACKGROUND_MAX_STACKS distinct stacks new ones go to OTHER_STACKS."""
+    global _background_pid, _background_timer
+    with _background_lock:
+        if _background_pid != os.getpid():
+            # После fork стеки и таймер — родительские: начинаем свой файл с нуля
+            _background_stacks.clear()
+            _background_pid, _background_timer = os.getpid(), None
+        limit = settings.PROFILE_BACKGROUND_MAX_STACKS
+        for stack, count in stacks.items():
+            if stack not in _background_stacks and len(_background_stacks) >= limit:
+                stack = OTHER_STACKS
+            _background_stacks[stack] += count
+        if _background_timer is None:
+            _background_timer = threading.Timer(settings.PROFILE_BACKGROUND_FLUSH_SECONDS, flush_background)
+            _background_timer.daemon = True
+            _background_timer.start()
+
+
+def flush_background():
+    """Write this process' background stacks to its ``.folded`` file."""
+    global _background_timer
+    with _background_lock:
+        _background_timer = None
+        if _background_pid != os.getpid() or not _background_stacks:
+            return
+        stacks = dict(_background_stacks)
+    write_folded(profile_dir() / f"{BACKGROUND_PREFIX}{os.getpid()}.folded", stacks)
+    prune_profiles()
+
+
+atexit.register(flush_background)
+
+
+def background_stacks():
+    stacks = Counter()
+    directory = Path(settings.PROFILE_DIR)
+    if directory.is_dir():
+        for path in directory.glob(f"{BACKGROUND_PREFIX}*.folded"):
+            stacks.update(read_folded(path))
+    return stacks
+
+
+def hot_functions(stacks, limit=30):
+    """Rows of (function, self samples, total samples, self share) by self time.
+
+    *Self* counts samples where the function was on top of the stack,
+    *total* — samples where it was anywhere in it (recursion counted once).
+    """
+    own = Counter()
+    inclusive = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for frame in set(frames):
+            inclusive[frame] += count
+    total = sum(stacks.values()) or 1
+    return [
+        {"function": function, "self": samples, "total": inclusive[function], "share": samples / total}
+        for function, samples in own.most_common(limit)
+    ]
@@ -0,0 +1,297 @@
+"""Group tours ranked against the answers of the "Begin your journey" wizard.
+
+Every active tour is a row of NumPy arrays kept in the process: the shares
+of historical / city / nature attractions, the cities it visits (one column
+per city), its number of days, hours and group size, and an inverted index
+from attraction to the tours that include it. A visitor's answers — kept in
+a signed cookie as the wizard goes, see ``tours.views`` — become a
+profile of the same shape, and ranking is a handful of vectorized
+operations over all tours.
+
+The arrays are built on first use. A save, delete or archive of a tour, a
+day, an attraction or a link between them in this process marks them
+stale; the next ranking recomputes only the tours changed since the last
+one, found through the ``updated_at`` indexes (links bump ``updated_at`` of
+their parent, see ``tours.changes``). Other processes' writes are picked up
+the same way at most once per ``RECOMMENDER_SYNC_SECONDS``.
+"""
+import functools
+import re
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+from .changes import group_tours_changed_since
+from .geocoding import normalize_query
+from .models import Attraction, GroupTour, GroupTourDay, ToursDay, ToursDayAttraction
+from .routers import primary_only
+
+MAX_PLACES = 50
+
+# Тип путешествия (шаг 1) -> веса категорий достопримечательностей
+EXPERIENCES = {
+    "recreational": {Attraction.NATURE: 1.0},
+    "sightseeing": {Attraction.CITY: 0.6, Attraction.NATURE: 0.4},
+    "historical": {Attraction.HISTORICAL: 1.0},
+    "generations": {Attraction.HISTORICAL: 0.6, Attraction.CITY: 0.4},
+}
+CATEGORIES = [value for value, _ in Attraction.CATEGORY_CHOICES]
+
+# Вклад признаков в оценку; каждый признак сам по себе в пределах 0..1
+WEIGHTS = {"places": 3.0, "cities": 2.0, "categories": 1.5, "days": 1.0, "group": 0.5}
+
+_BATCH = 500
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+@functools.lru_cache(maxsize=4096)
+def _city_key(city):
+    # Городов немного, а строк с ними — сотни тысяч: ключ считается один раз на написание
+    return normalize_query(city or "")
+
+
+def update_journey(journey, **answers):
+    """A copy of the wizard answers with ``answers`` merged in; empty values clear an answer."""
+    journey = dict(journey)
+    for name, value in answers.items():
+        if value in (None, "", []):
+            journey.pop(name, None)
+        else:
+            journey[name] = value
+    return journey
+
+
+class TourFeatures:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._stale = False
+        self._synced_at = 0.0
+        self._watermark = None
+        self._rows = {}  # pk тура -> строка
+        self._city_columns = {}  # ключ города -> столбец
+        self._attraction_rows = {}  # id достопримечательности -> строки туров с ней
+        self._row_attractions = {}  # строка -> id её достопримечательностей
+        self._count = 0  # занятые строки; массивы растут с запасом
+        self._allocate(0, 0)
+
+    def _allocate(self, rows, columns):
+        self.pks = np.zeros(rows, dtype=np.int64)
+        self.active = np.zeros(rows, dtype=bool)
+        self.categories = np.zeros((rows, len(CATEGORIES)), dtype=np.float32)
+        self.cities = np.zeros((rows, columns), dtype=np.float32)
+        self.days = np.zeros(rows, dtype=np.float32)
+        self.hours = np.zeros(rows, dtype=np.float32)
+        self.group_size = np.zeros(rows, dtype=np.float32)
+
+    def _arrays(self):
+        return self.pks, self.active, self.categories, self.cities, self.days, self.hours, self.group_size
+
+    def city_keys(self):
+        return set(self._city_columns)
+
+    # --- ранжирование ---
+
+    def rank(self, profile, limit=6):
+        """(tour pk, score) of the best ``limit`` tours for ``profile`` (see ``profile()``)."""
+        self.ensure_current()
+        with self._lock:
+            count = self._count
+            scores = np.zeros(count, dtype=np.float32)
+            if profile["places"]:
+                rows = [row for pk in profile["places"] for row in self._attraction_rows.get(pk, ())]
+                hits = np.bincount(np.array(rows, dtype=np.int64), minlength=count)
+                scores += WEIGHTS["places"] * hits / len(profile["places"])
+            columns = [self._city_columns[key] for key in profile["cities"] if key in self._city_columns]
+            if columns:
+                scores += WEIGHTS["cities"] * self.cities[:count, columns].mean(axis=1)
+            if profile["categories"] is not None:
+                scores += WEIGHTS["categories"] * (self.categories[:count] @ profile["categories"])
+            if profile["days"]:
+                wanted = profile["days"]
+                scores += WEIGHTS["days"] / (1.0 + np.abs(self.days[:count] - wanted) / wanted)
+            if profile["people"]:
+                scores += WEIGHTS["group"] * (self.group_size[:count] >= profile["people"])
+            scores[~self.active[:count]] = -np.inf
+            limit = min(limit, int(self.active[:count].sum()))
+            if limit <= 0:
+                return []
+            best = np.argpartition(-scores, limit - 1)[:limit]
+            best = best[np.lexsort((self.pks[best], -scores[best]))]  # при равной оценке — по pk
+            return [(int(self.pks[row]), float(scores[row])) for row in best]
+
+    def ensure_current(self):
+        fresh = time.monotonic() - self._synced_at < settings.RECOMMENDER_SYNC_SECONDS
+        if self._built and not self._stale and fresh:
+            return
+        with self._lock:
+            if not self._built:
+                self._build()
+            else:
+                self._sync()
+            self._stale = False
+            self._synced_at = time.monotonic()
+
+    def mark_stale(self, *args, **kwargs):
+        """Signal handler: recompute changed tours on the next ranking."""
+        self._stale = True
+
+    # --- построение ---
+
+    def _build(self):
+        with primary_only():
+            self._watermark = _catalog_version()
+            pks = list(GroupTour.objects.order_by("pk").values_list("pk", flat=True))
+            self._load(pks)
+        self._built = True
+
+    def _sync(self):
+        since = self._watermark
+        if since is None:
+            return self._build()
+        # Окно назад: updated_at ставится до коммита, медленная транзакция появляется «в прошлом»
+        since -= timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+        with primary_only():
+            self._watermark = _catalog_version()
+            self._load(sorted(group_tours_changed_since(since)))
+
+    def _load(self, pks):
+        """(Re)compute the rows of tours ``pks``; archived or deleted ones are switched off."""
+        for start in range(0, len(pks), _BATCH):
+            batch = pks[start : start + _BATCH]
+            tours = dict(GroupTour.objects.filter(pk__in=batch).order_by().values_list("pk", "group_size"))
+            days = {pk: [] for pk in tours}
+            for tour_pk, city, hours in GroupTourDay.objects.filter(
+                group_tour_id__in=tours, tours_day__is_archived=False
+            ).order_by().values_list("group_tour_id", "tours_day__city", "tours_day__duration_hours"):
+                days[tour_pk].append((city, hours))
+            attractions = {pk: [] for pk in tours}
+            links = ToursDayAttraction.objects.filter(
+                tours_day__grouptourday__group_tour_id__in=tours,
+                tours_day__is_archived=False,
+                attraction__is_archived=False,
+            ).order_by()
+            for tour_pk, attraction_pk, category, city in links.values_list(
+                "tours_day__grouptourday__group_tour_id", "attraction_id", "attraction__category", "attraction__city"
+            ):
+                attractions[tour_pk].append((attraction_pk, category, city))
+            for pk in batch:
+                if pk in tours:
+                    self._set_row(pk, tours[pk], days[pk], attractions[pk])
+                elif pk in self._rows:
+                    self._clear_row(self._rows[pk])
+
+    def _row_for(self, pk):
+        row = self._rows.get(pk)
+        if row is None:
+            row = self._count
+            self._reserve(rows=row + 1)
+            self._count += 1
+            self._rows[pk] = row
+            self.pks[row] = pk
+        return row
+
+    def _column_for(self, city_key):
+        column = self._city_columns.get(city_key)
+        if column is None:
+            column = len(self._city_columns)
+            self._reserve(columns=column + 1)
+            self._city_columns[city_key] = column
+        return column
+
+    def _reserve(self, rows=0, columns=0):
+        """Room for ``rows`` rows and ``columns`` cities; arrays grow twofold to keep appends cheap."""
+        capacity, width = self.cities.shape
+        if rows <= capacity and columns <= width:
+            return
+        old = self._arrays()
+        self._allocate(
+            max(rows, capacity * 2) if rows > capacity else capacity,
+            max(columns, width * 2) if columns > width else width,
+        )
+        for target, source in zip(self._arrays(), old):
+            target[tuple(slice(0, size) for size in source.shape)] = source
+
+    def _set_row(self, pk, group_size, days, attractions):
+        row = self._row_for(pk)
+        self._clear_row(row)
+        counts = np.zeros(len(CATEGORIES), dtype=np.float32)
+        for attraction_pk, category, _ in attractions:
+            if category in CATEGORIES:
+                counts[CATEGORIES.index(category)] += 1
+            self._attraction_rows.setdefault(attraction_pk, set()).add(row)
+        self._row_attractions[row] = {attraction_pk for attraction_pk, _, _ in attractions}
+        if counts.sum():
+            self.categories[row] = counts / counts.sum()
+        for city in {city for city, _ in days} | {city for _, _, city in attractions}:
+            key = _city_key(city)
+            if key:
+                column = self._column_for(key)  # может заменить self.cities бо́льшим массивом
+                self.cities[row, column] = 1.0
+        self.days[row] = len(days)
+        self.hours[row] = float(sum(hours or 0 for _, hours in days))
+        self.group_size[row] = group_size
+        self.active[row] = True
+
+    def _clear_row(self, row):
+        for attraction_pk in self._row_attractions.pop(row, ()):
+            rows = self._attraction_rows.get(attraction_pk)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._attraction_rows[attraction_pk]
+        self.active[row] = False
+        self.categories[row] = 0.0
+        self.cities[row] = 0.0
+
+
+def _catalog_version():
+    models = (GroupTour, ToursDay, Attraction)
+    versions = [model.all_objects.aggregate(latest=Max("updated_at"))["latest"] for model in models]
+    return max(filter(None, versions), default=None)
+
+
+features = TourFeatures()
+
+
+def profile(journey):
+    """Wizard answers as ranking inputs: category weights, city keys, places, days and people."""
+    places = [pk for pk in journey.get("places", []) if isinstance(pk, int)][:MAX_PLACES]
+    categories = np.zeros(len(CATEGORIES), dtype=np.float32)
+    for category, weight in EXPERIENCES.get(journey.get("experience"), {}).items():
+        categories[CATEGORIES.index(category)] += weight
+    cities = set()
+    for category, city in Attraction.objects.filter(pk__in=places).values_list("category", "city"):
+        if category in CATEGORIES:
+            categories[CATEGORIES.index(category)] += 1.0 / len(places)
+        cities.add(normalize_query(city))
+    text = normalize_query(" ".join(journey.get(name, "") for name in ("dream", "topic")))
+    if text:
+        words = set(_WORD_RE.findall(text))
+        for category, keywords in Attraction.CATEGORY_WORDS:
+            if words & set(keywords):
+                categories[CATEGORIES.index(category)] += 0.5
+        cities.update(key for key in features.city_keys() if key in words)
+    for city in journey.get("cities", []):
+        cities.add(normalize_query(city))
+    total = categories.sum()
+    return {
+        "places": places,
+        "cities": sorted(key for key in cities if key),
+        "categories": categories / total if total else None,
+        "days": journey.get("days"),
+        "people": journey.get("people"),
+    }
+
+
+def recommend(journey, limit=6):
+    """Tour pks best matching the wizard answers, best first; empty until there is an answer."""
+    features.ensure_current()
+    answers = profile(journey)
+    if answers["categories"] is None and not any(answers[name] for name in ("places", "cities", "days", "people")):
+        return []
+    return [pk for pk, score in features.rank(answers, limit) if score > 0]
@@ -0,0 +1,120 @@
+"""Precomputed "related posts" of the blog: cosine similarity of TF-IDF vectors.
+
+Every post keeps its term frequencies (``BlogPost.term_weights``, computed
+at save, see ``tours.text``). ``manage.py build_related_posts`` gathers them
+into one sparse matrix (CSR arrays: row pointers, term ids, weights),
+multiplies in the inverse document frequencies, normalizes the rows and
+compares every post with every other in blocks of rows, keeping the best
+``RELATED_POSTS_PER_POST`` per post in ``RelatedBlogPost``. Only the terms
+found in at least two posts can make two posts similar, so the product runs
+over those columns alone. A detail page reads its related posts with one
+indexed query.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .db import retry_on_locked
+from .models import BlogPost, RelatedBlogPost
+
+MIN_SCORE = 0.05
+BLOCK_CELLS = 4_000_000  # строк блока × постов: предел памяти на одно умножение
+
+
+def tfidf_matrix(rows):
+    """CSR arrays (indptr, indices, data) of L2-normalized TF-IDF rows and the number of terms.
+
+    ``rows`` — term weight dicts, one per post.
+    """
+    vocabulary = {}
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indices, data = [], []
+    for row, weights in enumerate(rows):
+        for term, weight in weights.items():
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            data.append(weight)
+        indptr[row + 1] = len(indices)
+    indices = np.array(indices, dtype=np.int64)
+    data = np.array(data, dtype=np.float32)
+    document_frequency = np.bincount(indices, minlength=len(vocabulary))
+    idf = np.log((1 + len(rows)) / (1 + document_frequency)) + 1
+    data *= idf[indices].astype(np.float32)
+    row_ids = np.repeat(np.arange(len(rows)), np.diff(indptr))
+    norms = np.sqrt(np.bincount(row_ids, weights=data.astype(np.float64) ** 2, minlength=len(rows)))
+    data /= np.maximum(norms, 1e-12)[row_ids].astype(np.float32)
+    return indptr, indices, data, len(vocabulary)
+
+
+def most_similar(pks, indptr, indices, data, terms, limit):
+    """pk -> [(related pk, cosine)] of the best ``limit`` posts, best first, ties by pk."""
+    count = len(pks)
+    row_ids = np.repeat(np.arange(count), np.diff(indptr))
+    # Слова одного поста в числитель косинуса ничего не дают — оставляем общие столбцы
+    shared = np.bincount(indices, minlength=terms) > 1
+    columns = np.cumsum(shared) - 1
+    keep = shared[indices]
+    matrix = np.zeros((count, int(shared.sum())), dtype=np.float32)
+    matrix[row_ids[keep], columns[indices[keep]]] = data[keep]
+
+    result = {}
+    block = max(1, BLOCK_CELLS // max(count, 1))
+    for start in range(0, count, block):
+        scores = matrix[start : start + block] @ matrix.T
+        rows = np.arange(len(scores))
+        scores[rows, start + rows] = -1.0  # сам с собой
+        take = min(limit, count - 1)
+        if take <= 0:
+            break
+        best = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+        for row, candidates in enumerate(best):
+            values = scores[row, candidates]
+            order = np.lexsort((pks[candidates], -values))
+            result[int(pks[start + row])] = [
+                (int(pks[candidates[i]]), float(values[i])) for i in order if values[i] >= MIN_SCORE
+            ]
+    return result
+
+
+@retry_on_locked
+def _store(lists):
+    RelatedBlogPost.objects.all().delete()
+    RelatedBlogPost.objects.bulk_create(
+        (
+            RelatedBlogPost(post_id=pk, related_id=related, score=score, rank=rank)
+            for pk, related_posts in lists.items()
+            for rank, (related, score) in enumerate(related_posts, start=1)
+        ),
+        batch_size=2000,
+    )
+
+
+def refresh():
+    """Recompute the related posts of every active post; returns counters of the run."""
+    started = time.monotonic()
+    rows = [
+        (pk, weights)
+        for pk, weights in BlogPost.objects.order_by("pk").values_list("pk", "term_weights").iterator(chunk_size=2000)
+        if weights
+    ]
+    pks = np.array([pk for pk, _ in rows], dtype=np.int64)
+    lists = {}
+    if len(rows) > 1:
+        indptr, indices, data, terms = tfidf_matrix([weights for _, weights in rows])
+        lists = most_similar(pks, indptr, indices, data, terms, settings.RELATED_POSTS_PER_POST)
+    _store(lists)
+    return {
+        "posts": len(rows),
+        "pairs": sum(len(related) for related in lists.values()),
+        "seconds": time.monotonic() - started,
+    }
+
+
+def related_posts(post_id):
+    """Stored ``RelatedBlogPost`` rows of a post with their (still active) posts, best first."""
+    return list(
+        RelatedBlogPost.objects.filter(post_id=post_id, related__is_archived=False)
+        .select_related("related")
+        .defer("related__body", "related__term_weights")
+        .order_by("rank")
+    )
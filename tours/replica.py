@@ -0,0 +1,136 @@
+"""Refreshing the read-only replica with the SQLite online backup API."""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_refresh_lock = threading.Lock()
+_timer_lock = threading.Lock()
+_pending_timer = None
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def _touch(path, at=None):
+    with open(path, "a"):
+        pass
+    os.utime(path, None if at is None else (at, at))
+
+
+# Метки рядом с репликой, общие для всех процессов: mtime «-refreshed» — начало последней
+# удачной копии, mtime «-pending» — первая запись каталога после неё. Время изменения
+# самой основной базы не годится: её трогают и сессии, и задачи, и заявки
+def _refreshed_marker():
+    return f"{settings.SQLITE_REPLICA_PATH}-refreshed"
+
+
+def _pending_marker():
+    return f"{settings.SQLITE_REPLICA_PATH}-pending"
+
+
+def refresh_replica(pages=1024, sleep=0.0):
+    """Copy the primary database into the replica file in place.
+
+    The backup writes into the live replica, so readers holding persistent
+    connections see the new snapshot on their next transaction; the copy is
+    done in steps of ``pages`` so the primary is never read-locked for long.
+    """
+    primary_path = str(settings.DATABASES["default"]["NAME"])
+    replica_path = str(settings.SQLITE_REPLICA_PATH)
+    started = time.monotonic()
+    with _refresh_lock:
+        # Запись, закоммиченная во время копии, могла в неё не попасть: отсчёт — от начала
+        started_at = time.time()
+        source = sqlite3.connect(primary_path, timeout=20)
+        target = sqlite3.connect(replica_path, timeout=20)
+        try:
+            source.backup(target, pages=pages, sleep=sleep)
+        finally:
+            target.close()
+            source.close()
+        _touch(_refreshed_marker(), started_at)
+    elapsed = time.monotonic() - started
+    logger.info("Replica refreshed in %.3fs", elapsed)
+    return elapsed
+
+
+def replication_lag():
+    """Seconds since the first catalog write the replica does not have yet (0 when it has all).
+
+    ``None`` means there is no replica yet and reads go to the primary.
+    """
+    if not os.path.exists(settings.SQLITE_REPLICA_PATH):
+        return None
+    pending = _mtime(_pending_marker())
+    if not pending or pending <= _mtime(_refreshed_marker()):
+        return 0.0
+    return max(0.0, time.time() - pending)
+
+
+def mark_pending():
+    """Note a catalog write the replica is missing; only the first one since a refresh counts."""
+    try:
+        if _mtime(_pending_marker()) <= _mtime(_refreshed_marker()):
+            _touch(_pending_marker())
+    except OSError:
+        logger.exception("Could not mark the replica stale")
+
+
+def _run_scheduled_refresh():
+    global _pending_timer
+    with _timer_lock:
+        _pending_timer = None
+    try:
+        refresh_replica()
+    except sqlite3.Error:
+        logger.exception("Replica refresh failed")
+
+
+def schedule_refresh():
+    """Refresh the replica shortly; several commits in a row share one backup."""
+    global _pending_timer
+    mark_pending()
+    with _timer_lock:
+        if _pending_timer is not None:
+            return
+        _pending_timer = threading.Timer(settings.SQLITE_REPLICA_REFRESH_DELAY, _run_scheduled_refresh)
+        _pending_timer.daemon = True
+        _pending_timer.start()
+
+
+def refresh_after_commit(sender, **kwargs):
+    """post_save / post_delete / archive_changed hook for catalog models."""
+    if not settings.SQLITE_REPLICA_ENABLED or sender._meta.app_label != "tours":
+        return
+    # Очередь задач читают только воркеры и staff с primary
+    if sender._meta.model_name in ("job", "jobschedule"):
+        return
+    using = kwargs.get("using") or "default"
+    transaction.on_commit(schedule_refresh, using=using)
+
+
+def _is_test_database(settings_dict):
+    name = str(settings_dict["NAME"])
+    test_name = settings_dict.get("TEST", {}).get("NAME")
+    return name == str(test_name) or os.path.basename(name).startswith("test_") or "memory" in name
+
+
+def refresh_after_migrate(sender, using="default", **kwargs):
+    """post_migrate hook: routed reads must not see the schema from before the migration."""
+    if not settings.SQLITE_REPLICA_ENABLED or using != "default":
+        return
+    # create_test_db тоже мигрирует: временную базу в настоящую реплику не копируем
+    if _is_test_database(connections[using].settings_dict):
+        return
+    refresh_replica()
@@ -0,0 +1,119 @@
+"""Retention of archived catalog rows.
+
+A row archived more than ``CATALOG_RETENTION_DAYS[model]`` days ago is
+purged, unless an active record still uses it (an archived day in the
+itinerary of an active tour, an archived attraction or include of an active
+day): deleting it would silently change a live page. An archived tour with
+bookings is kept for good; its departures without bookings go with it.
+Deletion runs in small batches, each its own short transaction, and every
+batch re-selects what is left, so an interrupted run simply continues where
+it stopped.
+
+Once a batch is deleted its rows are appended to a JSONL file in
+``CATALOG_RETENTION_DIR`` — the "archive table" of the purged data. The
+change feed does not report purges: partners saw those rows as archived
+long before.
+"""
+import json
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .db import retry_on_locked
+from .models import Attraction, BlogPost, Departure, GroupTour, Include, ToursDay
+
+# Родители раньше детей: удалённый архивный тур перестаёт держать свои дни
+RETENTION_MODELS = (GroupTour, BlogPost, ToursDay, Attraction, Include)
+
+# Что держит архивную запись: активный родитель или, у тура, брони его отправлений
+_IN_USE = {
+    GroupTour: Q(departures__bookings__isnull=False),
+    ToursDay: Q(group_tours__is_archived=False),
+    Attraction: Q(tours_days__is_archived=False),
+    Include: Q(tours_days__is_archived=False),
+}
+# Дети с on_delete=PROTECT, которые уходят вместе с записью: отправления тура без броней
+_PROTECTED_CHILDREN = {
+    GroupTour: ((Departure, "group_tour"),),
+}
+
+
+def retention_days(model):
+    """Days after ``archived_at`` before purge; None keeps the model's rows forever."""
+    return settings.CATALOG_RETENTION_DAYS.get(model._meta.model_name)
+
+
+def expired(model, days, now=None):
+    """Archived rows past the retention period, including ones still in use."""
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return model.all_objects.filter(is_archived=True, archived_at__lt=cutoff)
+
+
+def purgeable(model, days, now=None):
+    qs = expired(model, days, now)
+    in_use = _IN_USE.get(model)
+    return qs.exclude(in_use) if in_use is not None else qs
+
+
+def report(model, days, now=None):
+    """What a purge would do: expired / kept-in-use counts and the oldest ``archived_at``."""
+    qs = expired(model, days, now)
+    stats = qs.aggregate(oldest=Min("archived_at"))
+    total = qs.count()
+    purge = purgeable(model, days, now).count()
+    return {"expired": total, "purge": purge, "in_use": total - purge, "oldest": stats["oldest"]}
+
+
+@retry_on_locked
+def _delete_batch(model, pks, archive_path=None):
+    """(rows of ``model``, rows of every model including cascaded links).
+
+    The archive copy is read in the deleting transaction and appended only
+    after it commits: a batch replayed after "database is locked" is not
+    written twice.
+    """
+    in_use = _IN_USE.get(model)
+    if in_use is not None:
+        # Пачка выбрана вне транзакции: бронь или активный родитель могли появиться с тех пор
+        pks = list(model.all_objects.filter(pk__in=pks).exclude(in_use).values_list("pk", flat=True))
+    batch = model.all_objects.filter(pk__in=pks)
+    if archive_path is not None:
+        rows = list(batch.order_by("pk").values())
+        transaction.on_commit(lambda: _write_archive_copy(archive_path, rows))
+    total = 0
+    for child, field in _PROTECTED_CHILDREN.get(model, ()):
+        total += child.objects.filter(**{f"{field}__in": pks}).delete()[0]
+    deleted, per_model = batch.delete()
+    return per_model.get(model._meta.label, 0), total + deleted
+
+
+def _write_archive_copy(path, rows):
+    with open(path, "a", encoding="utf-8") as handle:
+        for row in rows:
+            handle.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n")
+
+
+def purge(model, days, batch_size=200, pause=0.0, archive_dir=None, now=None):
+    """Delete purgeable rows batch by batch; returns (rows deleted, rows deleted with cascades)."""
+    now = now or timezone.now()
+    archive_path = None
+    if archive_dir is not None:
+        Path(archive_dir).mkdir(parents=True, exist_ok=True)
+        archive_path = Path(archive_dir) / f"{model._meta.model_name}-{now:%Y%m%d}.jsonl"
+    deleted = deleted_total = 0
+    while True:
+        pks = list(purgeable(model, days, now).order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return deleted, deleted_total
+        rows, total = _delete_batch(model, pks, archive_path)
+        deleted += rows
+        deleted_total += total
+        if pause:
+            # Пауза между пачками отдаёт блокировку записи другим процессам
+            time.sleep(pause)
@@ -0,0 +1,67 @@
+"""Read/write routing between the primary SQLite file and its read-only replica."""
+import contextlib
+import os
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY = "default"
+REPLICA = "replica"
+
+# По умолчанию всё читается с primary; ReplicaRoutingMiddleware переключает
+# на реплику только публичные GET-запросы анонимных посетителей.
+_read_alias = ContextVar("tours_read_alias", default=PRIMARY)
+
+_REPLICA_CHECK_TTL = 5.0
+_replica_checked_at = 0.0
+_replica_present = False
+
+
+def replica_available():
+    global _replica_checked_at, _replica_present
+    now = time.monotonic()
+    if now - _replica_checked_at > _REPLICA_CHECK_TTL:
+        _replica_present = os.path.exists(settings.SQLITE_REPLICA_PATH)
+        _replica_checked_at = now
+    return _replica_present
+
+
+@contextlib.contextmanager
+def read_from(alias):
+    """Route reads of catalog models to ``alias`` inside the block."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def primary_only():
+    return read_from(PRIMARY)
+
+
+class PrimaryReplicaRouter:
+    """Catalog (``tours``) reads go to the replica when the request allows it.
+
+    Sessions, auth and other contrib apps always stay on the primary: the
+    replica lags behind by design and a fresh login must be visible at once.
+    """
+
+    route_app_labels = {"tours"}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels:
+            return PRIMARY
+        if _read_alias.get() == REPLICA and replica_available():
+            return REPLICA
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
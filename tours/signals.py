@@ -0,0 +1,6 @@
+"""Signals of the tours app."""
+from django.dispatch import Signal
+
+# Отправляется один раз на пакетную архивацию / восстановление (ArchivableQuerySet):
+# sender — модель, pks — затронутые записи, archived — новое состояние, using — БД
+archive_changed = Signal()
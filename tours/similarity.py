@@ -0,0 +1,230 @@
+"""Precomputed "similar tours": MinHash signatures with LSH banding.
+
+A tour is the set of its attractions and cities (of its days and of their
+attractions). Its signature holds, for each of ``NUM_PERM`` multiply-shift
+hash functions, the smallest hash over the set, so the share of equal
+positions in two signatures estimates the Jaccard similarity of the sets.
+The signature is cut into ``BANDS`` bands of ``ROWS`` values; only tours
+that agree on a whole band are compared, which keeps the job close to
+linear in the number of tours instead of comparing every pair.
+
+``manage.py build_similar_tours`` stores the signatures
+(``GroupTourSignature``) and the best ``SIMILAR_TOURS_PER_TOUR`` matches of
+every tour (``SimilarGroupTour``, ordered by ``rank``), so a detail page
+reads its list with one indexed query. A run without ``--full`` re-signs
+only the tours whose itinerary changed since the previous run (the tour,
+its days, their attractions: ``tours.changes.group_tours_changed_since``)
+and re-ranks them, the tours that share a band with them and the tours
+that listed them.
+"""
+import hashlib
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .changes import group_tours_changed_since
+from .db import retry_on_locked
+from .geocoding import normalize_query
+from .models import (
+    Attraction,
+    GroupTour,
+    GroupTourDay,
+    GroupTourSignature,
+    SimilarGroupTour,
+    ToursDay,
+    ToursDayAttraction,
+)
+
+NUM_PERM = 128
+BANDS = 64
+ROWS = NUM_PERM // BANDS
+# Порог пары ~ (1/BANDS) ** (1/ROWS) ≈ 0.125; ниже MIN_SCORE туры похожими не считаются
+MIN_SCORE = 0.1
+# Корзина, в которую попали сотни туров (например, все туры одного города), почти ничего не говорит
+MAX_BUCKET = 500
+
+_BATCH = 500
+_rng = np.random.default_rng(20261019)  # хэш-функции фиксированы: подписи разных запусков сравнимы
+_MULTIPLIERS = _rng.integers(1, 2**64, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_OFFSETS = _rng.integers(0, 2**64, NUM_PERM, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, 2**64, ROWS, dtype=np.uint64) | np.uint64(1)
+
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+
+
+def signature(tokens):
+    """MinHash of a set of strings as ``NUM_PERM`` uint32, or None for an empty set."""
+    if not tokens:
+        return None
+    values = np.array([_token_hash(token) for token in tokens], dtype=np.uint64)
+    # h(x) = (a·x + b) mod 2^64 >> 32; переполнение uint64 здесь и есть взятие по модулю
+    hashes = (_MULTIPLIERS[:, None] * values[None, :] + _OFFSETS[:, None]) >> np.uint64(32)
+    return hashes.min(axis=1).astype(np.uint32)
+
+
+def tour_tokens(pks):
+    """pk -> set of "a<attraction id>" and "c<city>" tokens for the active tours among ``pks``."""
+    tokens = {pk: set() for pk in GroupTour.objects.filter(pk__in=pks).values_list("pk", flat=True)}
+    days = GroupTourDay.objects.filter(group_tour_id__in=tokens, tours_day__is_archived=False).order_by()
+    for tour_pk, city in days.values_list("group_tour_id", "tours_day__city"):
+        _add_city(tokens[tour_pk], city)
+    links = ToursDayAttraction.objects.filter(
+        tours_day__grouptourday__group_tour_id__in=tokens,
+        tours_day__is_archived=False,
+        attraction__is_archived=False,
+    ).order_by()
+    for tour_pk, attraction_pk, city in links.values_list(
+        "tours_day__grouptourday__group_tour_id", "attraction_id", "attraction__city"
+    ):
+        tokens[tour_pk].add(f"a{attraction_pk}")
+        _add_city(tokens[tour_pk], city)
+    return tokens
+
+
+def _add_city(tokens, city):
+    key = normalize_query(city or "")
+    if key:
+        tokens.add(f"c{key}")
+
+
+class Bands:
+    """LSH buckets of all stored signatures, one grouping per band."""
+
+    def __init__(self, pks, signatures):
+        self.pks = pks
+        self.signatures = signatures
+        self.rows = {int(pk): row for row, pk in enumerate(pks)}
+        self._bands = []
+        for band in range(BANDS):
+            chunk = signatures[:, band * ROWS : (band + 1) * ROWS].astype(np.uint64)
+            keys = (chunk * _BAND_MIX).sum(axis=1)  # одно число на полосу; коллизии отсеет оценка
+            _, bucket, sizes = np.unique(keys, return_inverse=True, return_counts=True)
+            order = np.argsort(bucket, kind="stable")
+            starts = np.concatenate(([0], np.cumsum(sizes)))
+            self._bands.append((bucket, order, starts, sizes))
+
+    def candidates(self, row):
+        """Rows sharing at least one band with ``row``, except itself."""
+        found = []
+        for bucket, order, starts, sizes in self._bands:
+            index = bucket[row]
+            if 1 < sizes[index] <= MAX_BUCKET:
+                found.append(order[starts[index] : starts[index + 1]])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        rows = np.unique(np.concatenate(found))
+        return rows[rows != row]
+
+    def most_similar(self, row, limit):
+        """(pk, estimated Jaccard) of the best ``limit`` candidates, best first, ties by pk."""
+        rows = self.candidates(row)
+        if not len(rows):
+            return []
+        scores = (self.signatures[rows] == self.signatures[row]).mean(axis=1)
+        keep = scores >= MIN_SCORE
+        rows, scores = rows[keep], scores[keep]
+        best = np.lexsort((self.pks[rows], -scores))[:limit]
+        return [(int(self.pks[rows[i]]), float(scores[i])) for i in best]
+
+
+def load_bands():
+    pks, signatures = [], []
+    for pk, minhash in GroupTourSignature.objects.order_by("pk").values_list("pk", "minhash").iterator(
+        chunk_size=5000
+    ):
+        pks.append(pk)
+        signatures.append(np.frombuffer(minhash, dtype=np.uint32))
+    matrix = np.vstack(signatures) if signatures else np.empty((0, NUM_PERM), dtype=np.uint32)
+    return Bands(np.array(pks, dtype=np.int64), matrix)
+
+
+@retry_on_locked
+def _store_signatures(pks, signatures, version):
+    GroupTourSignature.objects.filter(pk__in=pks).delete()
+    GroupTourSignature.objects.bulk_create(
+        GroupTourSignature(group_tour_id=pk, minhash=sig.tobytes(), catalog_version=version)
+        for pk, sig in signatures.items()
+    )
+
+
+@retry_on_locked
+def _store_lists(pks, lists):
+    SimilarGroupTour.objects.filter(group_tour_id__in=pks).delete()
+    SimilarGroupTour.objects.bulk_create(
+        SimilarGroupTour(group_tour_id=pk, similar_id=similar, score=score, rank=rank)
+        for pk in pks
+        for rank, (similar, score) in enumerate(lists.get(pk, []), start=1)
+    )
+
+
+def _catalog_version():
+    models = (GroupTour, ToursDay, Attraction)
+    versions = [model.all_objects.aggregate(latest=Max("updated_at"))["latest"] for model in models]
+    return max(filter(None, versions), default=None) or timezone.now()
+
+
+def refresh(full=False):
+    """Re-sign changed tours and re-rank the affected lists; returns counters of the run."""
+    started = time.monotonic()
+    version = _catalog_version()
+    last_run = GroupTourSignature.objects.aggregate(latest=Max("catalog_version"))["latest"]
+    if full or last_run is None:
+        changed = set(GroupTour.all_objects.values_list("pk", flat=True))
+        changed.update(GroupTourSignature.objects.values_list("pk", flat=True))
+    else:
+        # Окно назад: updated_at ставится до коммита, медленная транзакция появляется «в прошлом»
+        changed = group_tours_changed_since(last_run - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS))
+    changed = sorted(changed)
+
+    signed = 0
+    for start in range(0, len(changed), _BATCH):
+        batch = changed[start : start + _BATCH]
+        signatures = {pk: signature(tokens) for pk, tokens in tour_tokens(batch).items()}
+        # Архивные, удалённые и пустые туры остаются без подписи — и без похожих
+        signatures = {pk: sig for pk, sig in signatures.items() if sig is not None}
+        _store_signatures(batch, signatures, version)
+        signed += len(signatures)
+
+    bands = load_bands()
+    if full or last_run is None:
+        targets = set(GroupTour.all_objects.values_list("pk", flat=True))
+    else:
+        targets = set(changed)
+        for pk in changed:
+            row = bands.rows.get(pk)
+            if row is not None:
+                targets.update(int(bands.pks[other]) for other in bands.candidates(row))
+        targets.update(
+            SimilarGroupTour.objects.filter(similar_id__in=changed).values_list("group_tour_id", flat=True)
+        )
+    targets = sorted(targets)
+
+    limit = settings.SIMILAR_TOURS_PER_TOUR
+    listed = 0
+    for start in range(0, len(targets), _BATCH):
+        batch = targets[start : start + _BATCH]
+        lists = {pk: bands.most_similar(bands.rows[pk], limit) for pk in batch if pk in bands.rows}
+        _store_lists(batch, lists)
+        listed += sum(len(similar) for similar in lists.values())
+    return {
+        "changed": len(changed),
+        "signed": signed,
+        "ranked": len(targets),
+        "pairs": listed,
+        "seconds": time.monotonic() - started,
+    }
+
+
+def similar_tours(group_tour_id):
+    """Stored ``SimilarGroupTour`` rows of a tour with their (still active) tours, best first."""
+    return list(
+        SimilarGroupTour.objects.filter(group_tour_id=group_tour_id, similar__is_archived=False)
+        .select_related("similar")
+        .order_by("rank")
+    )
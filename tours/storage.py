@@ -0,0 +1,43 @@
+"""Upload paths sharded by a hash of the file name.
+
+``catalog/attractions/photos/ab/cd/photo.jpg`` instead of one flat
+directory per field: with two levels of 256 directories each holds a
+few files even at millions of uploads, so lookups and listings stay fast.
+The shard depends on the name only, so ``shard_media`` can compute where an
+existing file belongs.
+"""
+import hashlib
+import posixpath
+
+from django.utils.deconstruct import deconstructible
+
+SHARD_LEVELS = 2
+
+
+def shard_name(prefix, filename):
+    """``prefix`` + two hash levels + the base name of ``filename``."""
+    basename = posixpath.basename(filename.replace("\\", "/"))
+    digest = hashlib.sha1(basename.encode()).hexdigest()
+    shards = [digest[2 * level : 2 * level + 2] for level in range(SHARD_LEVELS)]
+    return posixpath.join(prefix, *shards, basename)
+
+
+def is_sharded(prefix, name):
+    """True when ``name`` already sits in a shard directory under ``prefix``."""
+    if not name.startswith(prefix):
+        return False
+    return name[len(prefix) :].count("/") == SHARD_LEVELS
+
+
+@deconstructible
+class ShardedUploadTo:
+    """``upload_to`` callable: ``ShardedUploadTo("catalog/blog/images/")``."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def __call__(self, instance, filename):
+        return shard_name(self.prefix, filename)
+
+    def __eq__(self, other):
+        return isinstance(other, ShardedUploadTo) and self.prefix == other.prefix
@@ -0,0 +1,128 @@
+"""Tasks of the background worker (``tours.jobs``) and the signal hooks that queue them.
+
+Catalog and blog edits used to leave the precomputed similar tours and
+related posts stale until someone ran the build command. Now a change
+queues one delayed recompute, ``JOB_RECOMPUTE_DELAY`` seconds later, and
+the edits made in between join it. Uploaded catalog files are imported by
+the worker, not the request. Periodic maintenance (draining leads, purging
+the archive and old jobs) runs from ``JOB_SCHEDULE``.
+"""
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import catalog_io, jobs, leads, related_posts, retention, similarity
+from .db import retry_on_locked
+from .models import Job
+from .replica import refresh_replica
+
+IMPORT_REPORTED_ERRORS = 20
+
+
+@jobs.register("similar_tours", lease=1800)
+def build_similar_tours(full=False):
+    stats = similarity.refresh(full=full)
+    # bulk_create не шлёт сигналов, поэтому реплику обновляем сами
+    if settings.SQLITE_REPLICA_ENABLED and stats["ranked"]:
+        refresh_replica()
+    return stats
+
+
+@jobs.register("related_posts", lease=1800)
+def build_related_posts():
+    stats = related_posts.refresh()
+    if settings.SQLITE_REPLICA_ENABLED:
+        refresh_replica()
+    return stats
+
+
+@jobs.register("drain_leads", max_attempts=1)
+def drain_leads():
+    # Повтор не нужен: следующий запуск по расписанию подхватит оставшееся
+    return {"created": leads.drain(), "sent": leads.notify_pending()}
+
+
+@jobs.register("purge_archived", lease=3600, priority=-10)
+def purge_archived():
+    purged = {}
+    for model in retention.RETENTION_MODELS:
+        days = retention.retention_days(model)
+        if days is not None:
+            purged[model._meta.model_name], _ = retention.purge(
+                model, days, pause=0.05, archive_dir=settings.CATALOG_RETENTION_DIR
+            )
+    if settings.SQLITE_REPLICA_ENABLED and any(purged.values()):
+        refresh_replica()
+    return purged
+
+
+@jobs.register("purge_jobs", priority=-10)
+def purge_jobs(batch_size=500):
+    """Delete finished jobs older than ``JOB_KEEP_DAYS`` and the uploads of failed imports."""
+    cutoff = timezone.now() - timedelta(days=settings.JOB_KEEP_DAYS)
+    finished = Job.objects.filter(status__in=(Job.DONE, Job.FAILED), finished_at__lt=cutoff)
+    deleted = 0
+    while True:
+        pks = list(finished.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            break
+        deleted += _delete_jobs(pks)
+    files = 0
+    for path in Path(settings.JOB_UPLOAD_DIR).glob("*"):
+        if path.stat().st_mtime < cutoff.timestamp():
+            path.unlink(missing_ok=True)
+            files += 1
+    return {"jobs": deleted, "files": files}
+
+
+@retry_on_locked
+def _delete_jobs(pks):
+    return Job.objects.filter(pk__in=pks).delete()[0]
+
+
+@jobs.register("import_catalog", lease=1800, max_attempts=3, priority=10)
+def import_catalog(kind, path, fmt):
+    """Import an uploaded file saved by the import page; the file is removed once imported."""
+    started = time.monotonic()
+    with open(path, encoding="utf-8-sig", newline="") as handle:
+        result = catalog_io.import_records(kind, catalog_io.read_records(handle, kind, fmt))
+    if result.created + result.updated:
+        # bulk-запись не шлёт сигналов: реплику и похожие туры обновляем сами
+        if settings.SQLITE_REPLICA_ENABLED:
+            refresh_replica()
+        if kind != "includes":
+            _recompute_later("similar_tours")()
+    os.remove(path)
+    return {
+        "kind": kind,
+        "created": result.created,
+        "updated": result.updated,
+        "skipped": result.skipped,
+        "errors": result.errors[:IMPORT_REPORTED_ERRORS],
+        "seconds": time.monotonic() - started,
+    }
+
+
+# --- постановка пересчётов по сигналам ---
+
+
+def _recompute_later(task):
+    def enqueue():
+        jobs.enqueue(task, unique_key=f"recompute:{task}", delay=settings.JOB_RECOMPUTE_DELAY)
+
+    return enqueue
+
+
+def similar_tours_changed(sender, **kwargs):
+    """post_save / post_delete / archive_changed hook of the tour models."""
+    transaction.on_commit(_recompute_later("similar_tours"), using=kwargs.get("using") or "default")
+
+
+def blog_post_changed(sender, **kwargs):
+    """post_save / post_delete / archive_changed hook of ``BlogPost``."""
+    transaction.on_commit(_recompute_later("related_posts"), using=kwargs.get("using") or "default")
@@ -0,0 +1,46 @@
+"""Text features of blog posts, computed when a post is saved.
+
+The list shows ``excerpt`` and ``reading_minutes`` instead of cutting the
+body in the template, and ``term_weights`` is the term-frequency half of a
+post's TF-IDF vector: the inverse document frequency depends on the whole
+blog and is applied by ``manage.py build_related_posts``.
+"""
+import math
+import re
+from collections import Counter
+
+EXCERPT_CHARS = 240
+WORDS_PER_MINUTE = 200
+MAX_TERMS = 200
+
+_WORD_RE = re.compile(r"[^\W\d_]{3,}")
+STOP_WORDS = frozenset(
+    """
+    about above after again against all also and any are because been before being below between both but
+    can could did does doing down during each few for from further had has have having her here hers herself
+    him himself his how into its itself just more most myself nor not now off once only other our ours
+    ourselves out over own same she should some such than that the their theirs them themselves then there
+    these they this those through too under until very was were what when where which while who whom why
+    will with would you your yours yourself yourselves
+    """.split()
+)
+
+
+def excerpt(body, limit=EXCERPT_CHARS):
+    """The beginning of ``body`` on one line, cut at a word boundary."""
+    text = " ".join(body.split())
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[: cut if cut > 0 else limit].rstrip(" ,.;:-—") + "…"
+
+
+def reading_minutes(body):
+    return max(1, math.ceil(len(body.split()) / WORDS_PER_MINUTE))
+
+
+def term_weights(title, body):
+    """Sublinear term frequencies (1 + log tf) of the ``MAX_TERMS`` most frequent words; the title counts twice."""
+    words = _WORD_RE.findall(f"{title} {title} {body}".casefold())
+    counts = Counter(word for word in words if word not in STOP_WORDS)
+    return {term: round(1 + math.log(count), 4) for term, count in counts.most_common(MAX_TERMS)}
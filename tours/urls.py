@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, autocomplete, changes, places_map, views
 
 urlpatterns = [
     path("catalog/", views.catalog_dashboard, name="catalog_dashboard"),
@@ -17,17 +17,44 @@ urlpatterns = [
     path("catalog/tours-days/", views.tours_days_list, name="catalog_tours_days_list"),
     path("catalog/tours-days/create/", views.tours_day_create, name="catalog_tours_day_create"),
     path("catalog/tours-days/<int:pk>/edit/", views.tours_day_update, name="catalog_tours_day_update"),
+    path("catalog/tours-days/<int:pk>/route/", views.tours_day_route, name="catalog_tours_day_route"),
     path("catalog/tours-days/<int:pk>/archive/", views.tours_day_archive, name="catalog_tours_day_archive"),
     path("catalog/tours-days/<int:pk>/restore/", views.tours_day_restore, name="catalog_tours_day_restore"),
     path("catalog/group-tours/", views.group_tours_list, name="catalog_group_tours_list"),
     path("catalog/group-tours/create/", views.group_tour_create, name="catalog_group_tour_create"),
     path("catalog/group-tours/<int:pk>/edit/", views.group_tour_update, name="catalog_group_tour_update"),
+    path("catalog/group-tours/<int:pk>/departures/", views.group_tour_departures, name="catalog_group_tour_departures"),
     path("catalog/group-tours/<int:pk>/archive/", views.group_tour_archive, name="catalog_group_tour_archive"),
     path("catalog/group-tours/<int:pk>/restore/", views.group_tour_restore, name="catalog_group_tour_restore"),
     path("catalog/group-tour-media/<int:pk>/delete/", views.group_tour_media_delete, name="catalog_group_tour_media_delete"),
+    path("catalog/<str:kind>/bulk/", views.catalog_bulk_action, name="catalog_bulk_action"),
+    path("catalog/io/", views.catalog_import_export, name="catalog_io"),
+    path("catalog/io/export/<str:kind>/", views.catalog_export, name="catalog_export"),
     path("catalog/blog/", views.blog_list, name="catalog_blog_list"),
     path("catalog/blog/create/", views.blog_create, name="catalog_blog_create"),
     path("catalog/blog/<int:pk>/edit/", views.blog_update, name="catalog_blog_update"),
     path("catalog/blog/<int:pk>/archive/", views.blog_archive, name="catalog_blog_archive"),
     path("catalog/blog/<int:pk>/restore/", views.blog_restore, name="catalog_blog_restore"),
+    path("catalog/profiles/", views.profiles_list, name="catalog_profiles_list"),
+    path("catalog/profiles/<str:name>/", views.profile_download, name="catalog_profile_download"),
+    path("catalog/jobs/", views.jobs_status, name="catalog_jobs"),
+    path("health/replica/", views.replica_status, name="replica_status"),
+    path("metrics", views.metrics, name="metrics"),
+    path("api/v1/changes/", changes.feed, name="api_changes"),
+    path("api/v1/map/tiles/", places_map.tile, name="api_map_tiles"),
+    path("api/v1/map/places/", places_map.place_list, name="api_map_places"),
+    path("api/v1/autocomplete/", autocomplete.suggest, name="api_autocomplete"),
+] + [
+    route
+    for resource, name in (
+        ("attractions", "attractions"),
+        ("includes", "includes"),
+        ("tours-days", "tours_days"),
+        ("group-tours", "group_tours"),
+        ("blog-posts", "blog_posts"),
+    )
+    for route in (
+        path(f"api/v1/{resource}/", api.object_list, {"resource": resource}, name=f"api_{name}_list"),
+        path(f"api/v1/{resource}/<int:pk>/", api.object_detail, {"resource": resource}, name=f"api_{name}_detail"),
+    )
 ]
@@ -1,18 +1,57 @@
 # pylint: disable=no-member
+import json
 import os
+import uuid
 from datetime import datetime
 
 from django.conf import settings
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
+from django.core import signing
+from django.core.files.storage import default_storage
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db import models
+from django.db.models import Count, F, Q
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.views.decorators.http import require_http_methods, require_POST
 
-from .forms import AttractionForm, BlogPostForm, GroupTourForm, IncludeForm, ToursDayForm
+from . import autocomplete
+from . import booking
+from . import catalog_io
+from . import geo
+from . import itinerary
+from . import jobs
+from . import leads
+from . import metrics as metrics_store
+from . import places_map
+from . import profiling
+from . import recommender
+from . import related_posts
+from . import similarity
+from .db import retry_on_locked
+from .replica import replication_lag
+from .routers import primary_only
+from .forms import (
+    AttractionForm,
+    BlogPostForm,
+    BookingForm,
+    DepartureForm,
+    GroupTourForm,
+    IncludeForm,
+    LeadForm,
+    ToursDayForm,
+)
 from .models import (
     Attraction,
     BlogPost,
@@ -20,6 +59,8 @@ from .models import (
     GroupTourDay,
     GroupTourMedia,
     Include,
+    Job,
+    Lead,
     ToursDay,
     ToursDayAttraction,
     ToursDayInclude,
@@ -94,6 +135,33 @@ def home(request):
     )
 
 
+NEARBY_ATTRACTIONS_RADIUS_KM = 50
+NEARBY_ATTRACTIONS_START_KM = 0.25
+NEARBY_ATTRACTIONS_LIMIT = 4
+
+
+def _nearby_attractions(attraction):
+    """Closest other attractions over the geohash index (see ``tours.geo``)."""
+    if attraction.location is None:
+        return []
+    # Радиус растёт от малого: в плотном городе первый же круг даёт 4 места, не весь город
+    rows = geo.nearest(
+        Attraction.objects.exclude(pk=attraction.pk),
+        *attraction.location,
+        NEARBY_ATTRACTIONS_LIMIT,
+        max_radius_km=NEARBY_ATTRACTIONS_RADIUS_KM,
+        start_radius_km=NEARBY_ATTRACTIONS_START_KM,
+        fields=("id", "title", "city", "photo"),
+    )
+    for row in rows:
+        row["photo_url"] = (
+            default_storage.url(row["photo"])
+            if row["photo"]
+            else f"{settings.MEDIA_URL}working/test1/origOf1icon.jpg"
+        )
+    return rows
+
+
 def attraction_detail(request, pk):
     """Страница достопримечательности (по образцу blog/13/) с переключением prev/next."""
     attraction = get_object_or_404(Attraction, pk=pk)
@@ -107,7 +175,12 @@ def attraction_detail(request, pk):
     return render(
         request,
         "attraction_detail.html",
-        {"attraction": attraction, "prev_attraction_pk": prev_pk, "next_attraction_pk": next_pk},
+        {
+            "attraction": attraction,
+            "prev_attraction_pk": prev_pk,
+            "next_attraction_pk": next_pk,
+            "nearby_attractions": _nearby_attractions(attraction),
+        },
     )
 
 
@@ -140,9 +213,29 @@ def about_us(request):
     return render(request, "about_us.html")
 
 
+def _submit_lead(request, source, **details):
+    """Queue the lead of a POSTed form (see ``tours.leads``); False, with a message, if the contact is invalid."""
+    form = LeadForm(request.POST)
+    if not form.is_valid():
+        field, errors = next(iter(form.errors.items()))
+        messages.error(request, f"{form[field].label}: {errors[0]}")
+        return False
+    # Запись в журнал на локальном диске: блокировка записи основной базы не нужна
+    leads.submit(
+        source,
+        form.cleaned_data["name"],
+        form.cleaned_data["email"],
+        start_month=form.cleaned_data["month"],
+        **details,
+    )
+    return True
+
+
 def for_organizations(request):
     """Страница «For organizations» — туры для организаций (первая часть макета)."""
     if request.method == "POST" and request.POST.get("submit_request"):
+        if not _submit_lead(request, Lead.ORGANIZATIONS):
+            return redirect(reverse("for_organizations") + "#request-group-tour")
         return redirect(reverse("for_organizations") + "?submitted=1#request-group-tour")
     submitted = request.GET.get("submitted") == "1"
     return render(request, "for_organizations.html", {"submitted": submitted})
@@ -174,18 +267,78 @@ def _attractions_payload():
     return attractions
 
 
-def _attraction_category(attraction):
-    text = f"{attraction.title} {attraction.description} {attraction.city}".lower()
-    nature_words = ("beach", "mountain", "lake", "park", "forest", "nature")
-    city_words = ("city", "square", "center", "old town")
-    if any(word in text for word in nature_words):
-        return "nature"
-    if any(word in text for word in city_words):
-        return "city"
-    return "historical"
+# Ответы мастера живут в подписанной cookie: сессия в базе брала бы блокировку записи на каждом шаге
+JOURNEY_COOKIE = "journey"
+JOURNEY_COOKIE_MAX_AGE = 30 * 24 * 3600
+JOURNEY_COOKIE_MAX_BYTES = 4000  # браузеры хранят до 4096 байт на cookie
+_JOURNEY_SALT = "tours.journey"
+_JOURNEY_TEXT = ("dream", "topic")
+
+
+class _JourneySerializer:
+    # Ответы часто не латиницей: UTF-8 сжимается лучше \u-экранирования JSON
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def loads(self, data):
+        return json.loads(data.decode())
+
+
+def _journey(request):
+    value = request.COOKIES.get(JOURNEY_COOKIE)
+    if not value:
+        return {}
+    try:
+        return signing.loads(
+            value, salt=_JOURNEY_SALT, serializer=_JourneySerializer, max_age=JOURNEY_COOKIE_MAX_AGE
+        )
+    except signing.BadSignature:
+        return {}
+
+
+def _save_journey(response, journey):
+    """Store the answers on ``response``; long free-text answers are cut until the cookie fits."""
+    journey = dict(journey)
+    while True:
+        value = signing.dumps(journey, salt=_JOURNEY_SALT, serializer=_JourneySerializer, compress=True)
+        longest = max(_JOURNEY_TEXT, key=lambda name: len(journey.get(name, "")))
+        if len(value) <= JOURNEY_COOKIE_MAX_BYTES or not journey.get(longest):
+            break
+        journey[longest] = journey[longest][: len(journey[longest]) // 2]
+    response.set_cookie(
+        JOURNEY_COOKIE,
+        value,
+        max_age=JOURNEY_COOKIE_MAX_AGE,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite="Lax",
+    )
+    return response
+
+
+def _positive_int(value):
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        return None
+    return number if number > 0 else None
 
 
 def begin_your_journey_step2(request):
+    # Ответы мастера копятся в cookie; по ним шаг 5 подбирает туры (tours.recommender)
+    journey = _journey(request)
+    if request.method == "POST":
+        journey = recommender.update_journey(
+            journey,
+            dream=request.POST.get("dream", "").strip()[:2000],
+            topic=request.POST.get("topic", "").strip()[:2000],
+        )
+        return _save_journey(redirect("begin_your_journey_step3"), journey)
+    experience = request.GET.get("experience")
+    changed = experience in recommender.EXPERIENCES
+    if changed:
+        journey = recommender.update_journey(journey, experience=experience)
+
     stage = request.GET.get("stage", "preferences")
     if stage not in {"preferences", "places", "details"}:
         stage = "preferences"
@@ -198,85 +351,111 @@ def begin_your_journey_step2(request):
     }
     current = attractions[0] if attractions else fallback
 
-    return render(
+    response = render(
         request,
         "begin_journey_step2.html",
         {
             "step_stage": stage,
             "slider_current": current,
             "slider_items": attractions if attractions else [fallback],
+            "journey": journey,
         },
     )
+    return _save_journey(response, journey) if changed else response
 
 
-def begin_your_journey_step3(request):
-    attractions_data = []
-    for attraction in Attraction.objects.order_by("title"):
-        photo_url = (
-            attraction.photo.url
-            if attraction.photo
-            else f"{settings.MEDIA_URL}working/test1/origOf1icon.jpg"
-        )
-        attractions_data.append(
-            {
-                "id": attraction.pk,
-                "title": attraction.title,
-                "description": attraction.description,
-                "city": attraction.city,
-                "address": attraction.address,
-                "duration_hours": str(attraction.duration_hours),
-                "photo_url": photo_url,
-                "category": _attraction_category(attraction),
-            }
-        )
+STEP3_POPULAR_PLACES = 6
+
 
+def begin_your_journey_step3(request):
+    # Страница несёт только первые места; карта и список догружают остальное по видимой области
     return render(
         request,
         "begin_journey_step3.html",
         {
-            "attractions": attractions_data,
+            "attractions": places_map.places(limit=STEP3_POPULAR_PLACES),
             "yandex_maps_api_key": getattr(settings, "YANDEX_MAPS_API_KEY", ""),
         },
     )
 
 
 def begin_your_journey_step4(request):
+    journey = _journey(request)
+    changed = "places" in request.GET
+    if changed:
+        places = [_positive_int(pk) for pk in request.GET["places"].split(",")]
+        journey = recommender.update_journey(
+            journey, places=[pk for pk in places if pk][: recommender.MAX_PLACES]
+        )
     attractions = Attraction.objects.order_by("title")
-    cover_attraction = next(
-        (a for a in attractions if "malbork" in a.title.lower()),
-        attractions.first(),
+    cover_attraction = (
+        attractions.filter(title__icontains="malbork").first() or attractions.first()
     )
     cover_url = (
         cover_attraction.photo.url
         if cover_attraction and cover_attraction.photo
         else f"{settings.MEDIA_URL}working/tours/mountains-iceland.png"
     )
-    city_choices = sorted(
-        {a.city.strip() for a in attractions if a.city and a.city.strip()}
-    )
-    return render(
+    response = render(
         request,
         "begin_journey_step4.html",
         {
             "cover_url": cover_url,
-            "city_choices": city_choices,
+            # Города — из индекса автодополнения, без обхода всех достопримечательностей
+            "city_choices": autocomplete.index.cities(),
+            "journey": journey,
         },
     )
+    return _save_journey(response, journey) if changed else response
+
+
+JOURNEY_RECOMMENDATIONS = 6
 
 
 def begin_your_journey_step5(request):
+    if request.method == "POST":
+        adults = _positive_int(request.POST.get("adults", "")) or 0
+        children = _positive_int(request.POST.get("children", "")) or 0
+        days = _positive_int(request.POST.get("days", ""))
+        cities = [request.POST.get(name, "").strip()[:100] for name in ("city", "other_city")]
+        cities = [city for city in cities if city]
+        journey = recommender.update_journey(
+            _journey(request), days=days, people=adults + children or None, cities=cities
+        )
+        if request.POST.get("email", "").strip():
+            submitted = _submit_lead(
+                request,
+                Lead.JOURNEY,
+                experience=journey.get("experience", "")[:20],
+                wishes="\n".join(journey[name] for name in ("dream", "topic") if journey.get(name)),
+                places=journey.get("places", []),
+                days=days,
+                adults=adults or None,
+                children=children or None,
+                cities=", ".join(cities)[:255],
+                country=request.POST.get("country", "").strip()[:100],
+                accommodation=request.POST.get("accommodation", "").strip()[:100],
+                comments=request.POST.get("comments", "").strip()[:2000],
+                health=request.POST.get("health", "").strip()[:2000],
+            )
+            if not submitted:
+                return _save_journey(redirect("begin_your_journey_step4"), journey)
+        return _save_journey(redirect("begin_your_journey_step5"), journey)
+
     attractions = Attraction.objects.order_by("title")
-    cover_attraction = next(
-        (a for a in attractions if "gdansk" in a.title.lower()
-         or "malbork" in a.title.lower()),
-        attractions.first(),
+    cover_attraction = (
+        attractions.filter(Q(title__icontains="gdansk") | Q(title__icontains="malbork")).first()
+        or attractions.first()
     )
     cover_url = (
         cover_attraction.photo.url
         if cover_attraction and cover_attraction.photo
         else f"{settings.MEDIA_URL}working/tours/mountains-iceland.png"
     )
-    return render(request, "begin_journey_step5.html", {"cover_url": cover_url})
+    ranked = recommender.recommend(_journey(request), limit=JOURNEY_RECOMMENDATIONS)
+    tours = GroupTour.objects.filter(pk__in=ranked).prefetch_related("tour_days", "media_items").in_bulk()
+    cards = _build_group_tour_cards([tours[pk] for pk in ranked if pk in tours])
+    return render(request, "begin_journey_step5.html", {"cover_url": cover_url, "recommended_tours": cards})
 
 
 def group_tours_page(request):
@@ -291,7 +470,17 @@ def group_tours_page(request):
     return render(request, "group_tours.html", context)
 
 
-def _group_tour_detail_context(group_tour):
+def _group_tour_day_links(group_tour_id):
+    return (
+        GroupTourDay.objects.filter(group_tour_id=group_tour_id)
+        .select_related("tours_day")
+        .prefetch_related("tours_day__attractions", "tours_day__includes")
+        .order_by("day_number")
+    )
+
+
+def _group_tour_detail_context(group_tour, day_links=None, departures=None):
+    """``day_links`` and ``departures`` can be passed in already fetched (the async views load them in parallel)."""
     media_items = list(group_tour.media_items.all())
     image_media = [m for m in media_items if m.media_type ==
                    GroupTourMedia.IMAGE]
@@ -299,11 +488,8 @@ def _group_tour_detail_context(group_tour):
     if not gallery:
         gallery = [f"{settings.MEDIA_URL}working/test1/I965-5797-449-1298-368-149.png"]
 
-    day_links = (
-        GroupTourDay.objects.filter(group_tour=group_tour)
-        .select_related("tours_day")
-        .order_by("day_number")
-    )
+    if day_links is None:
+        day_links = _group_tour_day_links(group_tour.pk)
     itinerary = []
     cities = set()
     highlights = []
@@ -354,22 +540,16 @@ def _group_tour_detail_context(group_tour):
         "itinerary": itinerary,
         "highlights": highlights,
         "tour_includes": tour_includes,
+        "departures": booking.upcoming_departures(group_tour.pk) if departures is None else departures,
+        # Новый ключ на каждый показ формы: повторная отправка той же формы не займёт места дважды
+        "booking_key": uuid.uuid4().hex,
     }
 
 
-def group_tour_detail(request, pk):
-    group_tour = get_object_or_404(
-        GroupTour.objects.prefetch_related(
-            "media_items",
-            "tour_days__attractions",
-            "tour_days__includes",
-        ),
-        pk=pk,
-    )
-    context = _group_tour_detail_context(group_tour)
-    # Иконки includes берём из media/working/icons/
+def _includes_with_icons(includes):
+    """Иконки includes на страницах тура берём из media/working/icons/."""
     includes_with_icons_path = []
-    for inc in context["tour_includes"]:
+    for inc in includes:
         icon_url = ""
         if inc.icon_path:
             icon_url = f"{settings.MEDIA_URL}working/icons/{os.path.basename(inc.icon_path)}"
@@ -378,41 +558,114 @@ def group_tour_detail(request, pk):
             "icon_path": inc.icon_path,
             "icon_url": icon_url,
         })
-    context["tour_includes"] = includes_with_icons_path
+    return includes_with_icons_path
+
+
+def group_tour_detail(request, pk):
+    group_tour = get_object_or_404(
+        GroupTour.objects.prefetch_related("media_items"),
+        pk=pk,
+    )
+    context = _group_tour_detail_context(group_tour)
+    context["tour_includes"] = _includes_with_icons(context["tour_includes"])
+    # Похожие туры посчитаны заранее (manage.py build_similar_tours): один запрос по индексу
+    context["similar_tours"] = similarity.similar_tours(group_tour.pk)
     return render(request, "group_tour_detail.html", context)
 
 
 def group_tour_inspiration_detail(request, pk):
     group_tour = get_object_or_404(
-        GroupTour.objects.prefetch_related(
-            "media_items",
-            "tour_days__attractions",
-            "tour_days__includes",
-        ),
+        GroupTour.objects.prefetch_related("media_items"),
         pk=pk,
     )
     context = _group_tour_detail_context(group_tour)
-    # Иконки includes на странице inspirations берём из media/working/icons/
-    includes_with_icons_path = []
-    for inc in context["tour_includes"]:
-        icon_url = ""
-        if inc.icon_path:
-            icon_url = f"{settings.MEDIA_URL}working/icons/{os.path.basename(inc.icon_path)}"
-        includes_with_icons_path.append({
-            "description": inc.description,
-            "icon_path": inc.icon_path,
-            "icon_url": icon_url,
-        })
-    context["tour_includes"] = includes_with_icons_path
+    context["tour_includes"] = _includes_with_icons(context["tour_includes"])
     return render(request, "group_tour_inspiration_detail.html", context)
 
 
+@require_POST
+def group_tour_book(request, pk):
+    group_tour = get_object_or_404(GroupTour, pk=pk)
+    form = BookingForm(request.POST, group_tour=group_tour)
+    if not form.is_valid():
+        field, errors = next(iter(form.errors.items()))
+        messages.error(request, f"{form[field].label}: {errors[0]}")
+        return redirect("group_tour_detail", pk=pk)
+    try:
+        reservation, created = booking.book(
+            form.cleaned_data["departure"].pk,
+            form.seats,
+            form.cleaned_data["idempotency_key"],
+            name=form.cleaned_data["name"],
+            email=form.cleaned_data["email"],
+            notes=form.cleaned_data["notes"],
+        )
+    except booking.BookingError as exc:
+        messages.error(request, str(exc))
+    else:
+        messages.success(
+            request,
+            f"{reservation.seats} seat(s) booked for {reservation.departure.starts_on:%d %B %Y}."
+            if created
+            else "This booking was already received.",
+        )
+    return redirect("group_tour_detail", pk=pk)
+
+
 def _creator_or_none(request):
     if request.user.is_authenticated:
         return request.user
     return None
 
 
+def _store_uploads(instance):
+    """Write the new files of ``instance``'s file fields to storage; (storage, name) pairs."""
+    stored = []
+    for field in instance._meta.concrete_fields:
+        if isinstance(field, models.FileField):
+            field_file = getattr(instance, field.attname)
+            if field_file and not field_file._committed:
+                field_file.save(field_file.name, field_file.file, save=False)
+                stored.append((field.storage, field_file.name))
+    return stored
+
+
+def _store_group_tour_media(files):
+    """Write uploaded media to storage: (stored name, media type) pairs."""
+    field = GroupTourMedia._meta.get_field("file")
+    media = []
+    for media_file in files:
+        content_type = getattr(media_file, "content_type", "") or ""
+        media_type = GroupTourMedia.VIDEO if content_type.startswith(
+            "video/") else GroupTourMedia.IMAGE
+        name = field.storage.save(field.generate_filename(None, media_file.name), media_file)
+        media.append((name, media_type))
+    return media
+
+
+def _write_with_uploads(stored, write, *args):
+    """Run the retried ``write``; the files stored for it are removed if it fails for good.
+
+    Files go to storage before the transaction: a "database is locked" retry
+    replays the rows, and files saved inside it would be stored once per attempt.
+    """
+    try:
+        return write(*args)
+    except Exception:
+        for storage, name in stored:
+            storage.delete(name)
+        raise
+
+
+@retry_on_locked
+def _write_instance(instance):
+    instance.save()
+
+
+def _save_instance(instance):
+    _write_with_uploads(_store_uploads(instance), _write_instance, instance)
+
+
 def _save_tours_day_relations(instance, attractions, includes):
     ToursDayAttraction.objects.filter(tours_day=instance).delete()
     for idx, attraction in enumerate(attractions, start=1):
@@ -441,18 +694,39 @@ def _save_group_tour_days(instance, tour_days):
         )
 
 
-def _save_group_tour_media(instance, files):
-    for media_file in files:
-        content_type = getattr(media_file, "content_type", "") or ""
-        media_type = GroupTourMedia.VIDEO if content_type.startswith(
-            "video/") else GroupTourMedia.IMAGE
+def _save_group_tour_media(instance, media):
+    for name, media_type in media:
         GroupTourMedia.objects.create(
             group_tour=instance,
-            file=media_file,
+            file=name,
             media_type=media_type,
         )
 
 
+@retry_on_locked
+def _write_tours_day(instance, attractions, includes):
+    instance.save()
+    _save_tours_day_relations(instance, attractions, includes)
+
+
+def _save_tours_day(instance, attractions, includes):
+    _write_with_uploads(_store_uploads(instance), _write_tours_day, instance, attractions, includes)
+
+
+@retry_on_locked
+def _write_group_tour(instance, tour_days, media):
+    instance.save()
+    _save_group_tour_days(instance, tour_days)
+    _save_group_tour_media(instance, media)
+
+
+def _save_group_tour(instance, tour_days, files):
+    media = _store_group_tour_media(files)
+    storage = GroupTourMedia._meta.get_field("file").storage
+    stored = _store_uploads(instance) + [(storage, name) for name, _ in media]
+    _write_with_uploads(stored, _write_group_tour, instance, tour_days, media)
+
+
 def catalog_dashboard(request):
     context = {
         "attractions_count": Attraction.objects.count(),
@@ -471,7 +745,7 @@ def catalog_dashboard(request):
 
 def attractions_list(request):
     context = {
-        "items": Attraction.objects.order_by("title"),
+        "items": Attraction.objects.order_by("title").select_related("user"),
         "archived_items": Attraction.all_objects.filter(is_archived=True).order_by("title"),
     }
     return render(request, "catalog/attractions/list.html", context)
@@ -484,7 +758,7 @@ def attraction_create(request):
     if request.method == "POST" and form.is_valid():
         attraction = form.save(commit=False)
         attraction.user = _creator_or_none(request)
-        attraction.save()
+        _save_instance(attraction)
         messages.success(request, "Attraction created.")
         return redirect("catalog_attractions_list")
     return render(request, "catalog/form_page.html", {"form": form, "title": "Create attraction"})
@@ -500,7 +774,7 @@ def attraction_update(request, pk):
         attraction = form.save(commit=False)
         if not attraction.user:
             attraction.user = _creator_or_none(request)
-        attraction.save()
+        _save_instance(attraction)
         messages.success(request, "Attraction updated.")
         return redirect("catalog_attractions_list")
     return render(request, "catalog/form_page.html", {"form": form, "title": "Edit attraction"})
@@ -537,7 +811,7 @@ def includes_list(request):
 def include_create(request):
     form = IncludeForm(request.POST or None)
     if request.method == "POST" and form.is_valid():
-        form.save()
+        retry_on_locked(form.save)()
         messages.success(request, "Include created.")
         return redirect("catalog_includes_list")
     return render(request, "catalog/form_page.html", {"form": form, "title": "Create include"})
@@ -549,7 +823,7 @@ def include_update(request, pk):
     include = get_object_or_404(Include.all_objects, pk=pk)
     form = IncludeForm(request.POST or None, instance=include)
     if request.method == "POST" and form.is_valid():
-        form.save()
+        retry_on_locked(form.save)()
         messages.success(request, "Include updated.")
         return redirect("catalog_includes_list")
     return render(request, "catalog/form_page.html", {"form": form, "title": "Edit include"})
@@ -575,7 +849,14 @@ def include_restore(request, pk):
 
 def tours_days_list(request):
     context = {
-        "items": ToursDay.objects.order_by("title"),
+        "items": ToursDay.objects.order_by("title").select_related("user").annotate(
+            attractions_count=Count(
+                "attractions", filter=Q(attractions__is_archived=False), distinct=True
+            ),
+            includes_count=Count(
+                "includes", filter=Q(includes__is_archived=False), distinct=True
+            ),
+        ),
         "archived_items": ToursDay.all_objects.filter(is_archived=True).order_by("title"),
     }
     return render(request, "catalog/tours_days/list.html", context)
@@ -588,8 +869,7 @@ def tours_day_create(request):
     if request.method == "POST" and form.is_valid():
         tours_day = form.save(commit=False)
         tours_day.user = _creator_or_none(request)
-        tours_day.save()
-        _save_tours_day_relations(
+        _save_tours_day(
             instance=tours_day,
             attractions=form.cleaned_data["attractions"],
             includes=form.cleaned_data["includes"],
@@ -609,8 +889,7 @@ def tours_day_update(request, pk):
         tours_day = form.save(commit=False)
         if not tours_day.user:
             tours_day.user = _creator_or_none(request)
-        tours_day.save()
-        _save_tours_day_relations(
+        _save_tours_day(
             instance=tours_day,
             attractions=form.cleaned_data["attractions"],
             includes=form.cleaned_data["includes"],
@@ -620,6 +899,45 @@ def tours_day_update(request, pk):
     return render(request, "catalog/form_page.html", {"form": form, "title": "Edit tour day"})
 
 
+def _tours_day_links(tours_day):
+    return list(
+        ToursDayAttraction.objects.filter(tours_day=tours_day)
+        .select_related("attraction")
+        .order_by("position", "id")
+    )
+
+
+@retry_on_locked
+def _apply_tours_day_route(tours_day, links):
+    for position, link in enumerate(links, start=1):
+        link.position = position
+    ToursDayAttraction.objects.bulk_update(links, ["position"])
+    tours_day.save(update_fields=["updated_at"])  # порядок остановок виден в API и ленте изменений
+
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def tours_day_route(request, pk):
+    """Preview of the suggested order of a day's attractions; POST applies the previewed order."""
+    tours_day = get_object_or_404(ToursDay.all_objects, pk=pk)
+    links = _tours_day_links(tours_day)
+    if request.method == "POST":
+        by_pk = {link.pk: link for link in links}
+        order = [int(value) for value in request.POST.getlist("order") if value.isdigit()]
+        if sorted(order) != sorted(by_pk):
+            messages.error(request, "The day's attractions changed since the preview; review the new suggestion.")
+            return redirect("catalog_tours_day_route", pk=pk)
+        _apply_tours_day_route(tours_day, [by_pk[link_pk] for link_pk in order])
+        messages.success(request, "Route order saved.")
+        return redirect("catalog_tours_days_list")
+    context = {
+        "tours_day": tours_day,
+        "plan": itinerary.plan(tours_day, links),
+        "speed_kmh": settings.ITINERARY_TRAVEL_SPEED_KMH,
+    }
+    return render(request, "catalog/tours_days/route.html", context)
+
+
 @login_required
 @require_POST
 def tours_day_archive(request, pk):
@@ -640,7 +958,12 @@ def tours_day_restore(request, pk):
 
 def group_tours_list(request):
     context = {
-        "items": GroupTour.objects.order_by("title").prefetch_related("media_items"),
+        "items": GroupTour.objects.order_by("title").select_related("user").annotate(
+            tour_days_count=Count(
+                "tour_days", filter=Q(tour_days__is_archived=False), distinct=True
+            ),
+            media_count=Count("media_items", distinct=True),
+        ),
         "archived_items": GroupTour.all_objects.filter(is_archived=True).order_by("title"),
     }
     return render(request, "catalog/group_tours/list.html", context)
@@ -653,10 +976,11 @@ def group_tour_create(request):
     if request.method == "POST" and form.is_valid():
         group_tour = form.save(commit=False)
         group_tour.user = _creator_or_none(request)
-        group_tour.save()
-        _save_group_tour_days(group_tour, form.cleaned_data["tour_days"])
-        _save_group_tour_media(
-            group_tour, request.FILES.getlist("media_files"))
+        _save_group_tour(
+            group_tour,
+            form.cleaned_data["tour_days"],
+            request.FILES.getlist("media_files"),
+        )
         messages.success(request, "Group tour created.")
         return redirect("catalog_group_tours_list")
     return render(request, "catalog/form_page.html", {"form": form, "title": "Create group tour"})
@@ -673,10 +997,11 @@ def group_tour_update(request, pk):
         group_tour = form.save(commit=False)
         if not group_tour.user:
             group_tour.user = _creator_or_none(request)
-        group_tour.save()
-        _save_group_tour_days(group_tour, form.cleaned_data["tour_days"])
-        _save_group_tour_media(
-            group_tour, request.FILES.getlist("media_files"))
+        _save_group_tour(
+            group_tour,
+            form.cleaned_data["tour_days"],
+            request.FILES.getlist("media_files"),
+        )
         messages.success(request, "Group tour updated.")
         return redirect("catalog_group_tours_list")
     return render(
@@ -690,6 +1015,23 @@ def group_tour_update(request, pk):
     )
 
 
+@login_required
+@require_http_methods(["GET", "POST"])
+def group_tour_departures(request, pk):
+    group_tour = get_object_or_404(GroupTour.all_objects, pk=pk)
+    form = DepartureForm(request.POST or None, group_tour=group_tour)
+    if request.method == "POST" and form.is_valid():
+        retry_on_locked(form.save)()
+        messages.success(request, "Departure added.")
+        return redirect("catalog_group_tour_departures", pk=pk)
+    departures = group_tour.departures.annotate(booked=F("capacity") - F("seats_left")).order_by("-starts_on")
+    return render(
+        request,
+        "catalog/group_tours/departures.html",
+        {"group_tour": group_tour, "form": form, "departures": departures},
+    )
+
+
 @login_required
 @require_POST
 def group_tour_archive(request, pk):
@@ -713,11 +1055,91 @@ def group_tour_restore(request, pk):
 def group_tour_media_delete(request, pk):
     media = get_object_or_404(GroupTourMedia, pk=pk)
     group_tour_id = media.group_tour_id
-    media.delete()
+    retry_on_locked(media.delete)()
     messages.success(request, "Media deleted.")
     return redirect("catalog_group_tour_update", pk=group_tour_id)
 
 
+# ——— Пакетная архивация / восстановление ———
+BULK_KINDS = {
+    "attractions": (Attraction, "catalog_attractions_list"),
+    "includes": (Include, "catalog_includes_list"),
+    "tours-days": (ToursDay, "catalog_tours_days_list"),
+    "group-tours": (GroupTour, "catalog_group_tours_list"),
+    "blog": (BlogPost, "catalog_blog_list"),
+}
+
+
+@login_required
+@require_POST
+def catalog_bulk_action(request, kind):
+    """Archive or restore the rows ticked on a catalog list with one UPDATE."""
+    if kind not in BULK_KINDS:
+        raise Http404("Unknown catalog")
+    model, list_url = BULK_KINDS[kind]
+    action = request.POST.get("action")
+    ids = [value for value in request.POST.getlist("ids") if value.isdigit()]
+    if action not in ("archive", "restore") or not ids:
+        messages.error(request, "Select at least one record.")
+        return redirect(list_url)
+    selection = model.all_objects.filter(pk__in=ids)
+    count = selection.archive() if action == "archive" else selection.restore()
+    messages.success(request, f"{count} record(s) {'moved to archive' if action == 'archive' else 'restored'}.")
+    return redirect(list_url)
+
+
+# ——— Импорт / экспорт каталога ———
+def _save_upload(upload, fmt):
+    """Copy an uploaded file to ``JOB_UPLOAD_DIR``: the worker reads it after the request is gone."""
+    os.makedirs(settings.JOB_UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(settings.JOB_UPLOAD_DIR, f"{uuid.uuid4().hex}.{fmt}")
+    with open(path, "wb") as handle:
+        for chunk in upload.chunks():
+            handle.write(chunk)
+    return path
+
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def catalog_import_export(request):
+    """Export links per kind and format; an uploaded JSONL / CSV file is imported by the worker."""
+    if request.method == "POST":
+        kind = request.POST.get("kind")
+        upload = request.FILES.get("file")
+        fmt = os.path.splitext(upload.name)[1].lstrip(".").lower() if upload else ""
+        if kind not in catalog_io.KINDS or upload is None or fmt not in catalog_io.FORMATS:
+            messages.error(request, "Choose a kind and a .jsonl or .csv file.")
+        else:
+            job = jobs.enqueue("import_catalog", {"kind": kind, "path": _save_upload(upload, fmt), "fmt": fmt})
+            messages.success(request, f"{kind}: import queued, the result appears below when it is done.")
+            return redirect(f"{reverse('catalog_io')}?job={job.pk}")
+    job = None
+    if request.GET.get("job", "").isdigit():
+        job = Job.objects.filter(pk=request.GET["job"], task="import_catalog").first()
+    result = job.result if job and job.status == Job.DONE else None
+    context = {
+        "kinds": sorted(catalog_io.KINDS),
+        "formats": catalog_io.FORMATS,
+        "job": job,
+        "result": result,
+        "errors": result["errors"] if result else [],
+        "more_errors": result["skipped"] - len(result["errors"]) if result else 0,
+    }
+    return render(request, "catalog/io.html", context)
+
+
+@login_required
+def catalog_export(request, kind):
+    fmt = request.GET.get("format", "jsonl")
+    if kind not in catalog_io.KINDS or fmt not in catalog_io.FORMATS:
+        raise Http404("Unknown kind or format")
+    chunks = catalog_io.encode_records(catalog_io.export_records(kind), kind, fmt)
+    content_type = "application/x-ndjson" if fmt == "jsonl" else "text/csv"
+    response = StreamingHttpResponse(chunks, content_type=f"{content_type}; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
 # ——— Блог (каталог) ———
 def _blog_list_queryset(request, base_queryset):
     qs = base_queryset
@@ -752,7 +1174,7 @@ def _blog_list_queryset(request, base_queryset):
 
 
 def blog_list(request):
-    active = BlogPost.objects.all()
+    active = BlogPost.objects.select_related("user")
     archived = BlogPost.all_objects.filter(is_archived=True)
     items, params = _blog_list_queryset(request, active)
     archived_items, _ = _blog_list_queryset(request, archived)
@@ -775,7 +1197,7 @@ def blog_create(request):
     if request.method == "POST" and form.is_valid():
         post = form.save(commit=False)
         post.user = _creator_or_none(request)
-        post.save()
+        _save_instance(post)
         messages.success(request, "Blog post created.")
         return redirect("catalog_blog_list")
     return render(request, "catalog/form_page.html", {"form": form, "title": "Create blog post"})
@@ -790,7 +1212,7 @@ def blog_update(request, pk):
         post = form.save(commit=False)
         if not post.user:
             post.user = _creator_or_none(request)
-        post.save()
+        _save_instance(post)
         messages.success(request, "Blog post updated.")
         return redirect("catalog_blog_list")
     return render(request, "catalog/form_page.html", {"form": form, "title": "Edit blog post"})
@@ -816,7 +1238,8 @@ def blog_restore(request, pk):
 
 # ——— Публичная страница Our Blog ———
 def blog_page(request):
-    qs = BlogPost.objects.order_by("-published_at", "-created_at")
+    # Карточкам хватает excerpt и reading_minutes: полный текст и веса слов не читаем
+    qs = BlogPost.objects.order_by("-published_at", "-created_at").defer("body", "term_weights")
     paginator = Paginator(qs, 9)
     try:
         page_number = int(request.GET.get("page", 1))
@@ -834,11 +1257,11 @@ def blog_page(request):
 
 
 def blog_post_detail(request, pk):
-    post = get_object_or_404(BlogPost.objects, pk=pk)
+    post = get_object_or_404(BlogPost.objects.defer("term_weights"), pk=pk)
     return render(
         request,
         "blog_post_detail.html",
-        {"post": post},
+        {"post": post, "related_posts": related_posts.related_posts(post.pk)},
     )
 
 
@@ -850,3 +1273,73 @@ def page_404_preview(request):
 def terms_and_conditions(request):
     """Страница Terms and Conditions."""
     return render(request, "terms_and_conditions.html")
+
+
+def replica_status(request):
+    """Отставание реплики от основной БД (для мониторинга)."""
+    lag = replication_lag()
+    return JsonResponse(
+        {
+            "enabled": settings.SQLITE_REPLICA_ENABLED,
+            "available": lag is not None,
+            "lag_seconds": lag,
+        }
+    )
+
+
+def metrics(request):
+    """Метрики в текстовом формате Prometheus (все воркеры вместе)."""
+    allowed = request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+    if not allowed and not request.user.is_staff:
+        return HttpResponseForbidden()
+    metrics_store.prune_exited()
+    gauges = []
+    lag = replication_lag()
+    if lag is not None:
+        gauges.append(
+            ("potours_replica_lag_seconds", "Seconds the read replica is behind the primary.", {}, lag)
+        )
+    with primary_only():  # реплика отстаёт, а очередь нужна текущая
+        due, oldest_wait = jobs.queue_depth()
+    gauges.append(("potours_jobs_due", "Queued jobs that are due.", {}, due))
+    gauges.append(("potours_jobs_oldest_wait_seconds", "Seconds the oldest due job has waited.", {}, oldest_wait))
+    return HttpResponse(
+        metrics_store.render(gauges),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@staff_member_required
+def profiles_list(request):
+    """Сохранённые профили запросов, горячие функции фонового режима и выдача подписанных ссылок."""
+    path = request.GET.get("path", "").strip()
+    mode = request.GET.get("mode", "sample")
+    link = None
+    if path.startswith("/") and mode in profiling.MODES:
+        token = profiling.sign_profile_link(path.split("?", 1)[0], mode)
+        separator = "&" if "?" in path else "?"
+        link = request.build_absolute_uri(f"{path}{separator}_profile={token}")
+    context = {
+        "profiles": profiling.list_profiles(),
+        "hot_functions": profiling.hot_functions(profiling.background_stacks()),
+        "background_rate": settings.PROFILE_SAMPLE_RATE,
+        "modes": profiling.MODES,
+        "path": path,
+        "mode": mode,
+        "link": link,
+    }
+    return render(request, "catalog/profiles/list.html", context)
+
+
+@staff_member_required
+def profile_download(request, name):
+    path = profiling.profile_path(name)
+    if path is None:
+        raise Http404("Profile not found")
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=name)
+
+
+@staff_member_required
+def jobs_status(request):
+    """Очередь фоновых задач: глубина, задержки за последний час, выполняемые, сбои и расписание."""
+    return render(request, "catalog/jobs.html", jobs.stats())